@@ -2,17 +2,47 @@ from dotenv import load_dotenv
 load_dotenv()  # 必须在读取os.environ之前
 
 import os, re, uuid
-from datetime import datetime
+import base64, json
+import hmac
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
 from decimal import Decimal
 from pathlib import Path
 
-from flask import (Flask, render_template, request, redirect,
-                   url_for, session, flash, abort, send_file, make_response)
+from flask import (Flask, Request, Response, render_template, request, redirect,
+                   url_for, session, flash, abort, send_file, make_response,
+                   jsonify, stream_with_context)
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
 from werkzeug.security import generate_password_hash, check_password_hash
 from io import BytesIO
+from urllib.parse import quote
 from weasyprint import HTML
 
-from models import db, User, Expense, ExpenseType
+from sqlalchemy import func, or_, and_, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, contains_eager
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, User, Expense, ExpenseType, PdfJob
+from office_pool import OfficePool
+from pdf_export import export_pdf
+from page_cache import PageCache
+from template_registry import templates, preload_templates
+from invoice_store import InvoiceStore
+from invoice_ingest import InvoiceIngest
+from invoice_thumbs import InvoiceDerivatives, DerivativeError, MIMETYPE as INVOICE_IMAGE_MIMETYPE
+from metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY as METRICS, init_metrics, render_metrics
+from refcache import RefCache
+from request_timeouts import init_request_timeouts, parse_route_timeouts
+from record_export import EXPORT_FORMATS
+from reporting import DIMENSIONS as ROLLUP_DIMENSIONS, apply_rollup, month_start, query_rollups, rollup_row
+from search import filter_by_keywords, index_expenses, ranked_matches, remove_expenses, set_reject_reason
+from rmb_upper import num_to_rmb_upper, nums_to_rmb_upper
 
 # ------------------- Flask 基本配置 -------------------
 app = Flask(__name__)
@@ -26,14 +56,173 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///instance/baoxiao.db'
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 连接池：每个 gunicorn worker 进程一个池，默认与 worker 线程数（GUNICORN_THREADS）一致，
+# 让每个线程都能拿到连接；导出的服务端游标、发票规范化回调线程用 max_overflow 兜底。
+# 连接经过网络和防火墙，取出前 ping 一次、超过 DB_POOL_RECYCLE 秒的重建，避免拿到被掐断的连接。
+# 本地 SQLite 不走网络，保持默认。
+_db_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+if _db_url.get_backend_name() != 'sqlite':
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size':     int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 8))),
+        'max_overflow':  int(os.environ.get('DB_MAX_OVERFLOW', 4)),
+        'pool_timeout':  int(os.environ.get('DB_POOL_TIMEOUT', 10)),        # 池满时最多等几秒
+        'pool_recycle':  int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+    }
+    if _db_url.get_driver_name() == 'pyodbc':
+        # executemany（全文索引、汇总表、批量审批）一次把整批参数发给 ODBC 驱动，而不是逐行往返
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['fast_executemany'] = \
+            os.environ.get('DB_FAST_EXECUTEMANY', '1') == '1'
 app.config['JSON_AS_ASCII'] = False                   # jsonify / render_template 中文不转义
 
 # 上传目录
 UPLOAD_FOLDER = Path('static/invoices')
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
+# 上传临时文件目录：不能在 static 下，且须与 UPLOAD_FOLDER 在同一文件系统（保存时 rename 过去）
+app.config['INVOICE_TMP_DIR'] = os.environ.get('INVOICE_TMP_DIR', os.path.join('instance', 'invoice_tmp'))
+# 按内容哈希去重存储，见 invoice_store.py
+invoice_store = InvoiceStore(UPLOAD_FOLDER, app.config['INVOICE_TMP_DIR'])
+# 上传大小上限：整个请求（一次提交多条报销） / 单个发票文件
+app.config['MAX_CONTENT_LENGTH']    = int(os.environ.get('UPLOAD_MAX_REQUEST_MB', 200)) * 1024 * 1024
+app.config['INVOICE_MAX_FILE_SIZE'] = int(os.environ.get('INVOICE_MAX_FILE_MB', 20)) * 1024 * 1024
+
+# 发票缩略图 / 预览图缓存（见 invoice_thumbs.py）
+app.config['INVOICE_IMAGE_DIR']     = os.environ.get('INVOICE_IMAGE_DIR', os.path.join('instance', 'invoice_images'))
+app.config['INVOICE_IMAGE_MAX_AGE'] = int(os.environ.get('INVOICE_IMAGE_MAX_AGE', 7 * 24 * 3600))
+invoice_images = InvoiceDerivatives(UPLOAD_FOLDER, app.config['INVOICE_IMAGE_DIR'])
+
+# 上传发票图片规范化（见 invoice_ingest.py）：摆正、缩到打印分辨率、去元数据、重新压缩
+app.config['INVOICE_NORMALIZE']        = os.environ.get('INVOICE_NORMALIZE', '1') == '1'
+app.config['INVOICE_MAX_PRINT_PX']     = int(os.environ.get('INVOICE_MAX_PRINT_PX', 2480))   # A4 长边 @300DPI
+app.config['INVOICE_JPEG_QUALITY']     = int(os.environ.get('INVOICE_JPEG_QUALITY', 85))
+app.config['INVOICE_INGEST_WORKERS']   = int(os.environ.get('INVOICE_INGEST_WORKERS', 2))
+# 非空时，原图被规范化替换前先复制到这里
+app.config['INVOICE_COLD_STORAGE_DIR'] = os.environ.get('INVOICE_COLD_STORAGE_DIR', '')
+invoice_ingest = InvoiceIngest(app, invoice_store,
+                               max_workers=app.config['INVOICE_INGEST_WORKERS'],
+                               max_side=app.config['INVOICE_MAX_PRINT_PX'],
+                               quality=app.config['INVOICE_JPEG_QUALITY'],
+                               cold_root=app.config['INVOICE_COLD_STORAGE_DIR'] or None,
+                               on_removed=invoice_images.discard)
+
+# 报销记录列表分页
+app.config['RECORDS_PAGE_SIZE']     = int(os.environ.get('RECORDS_PAGE_SIZE', 50))
+app.config['RECORDS_PAGE_SIZE_MAX'] = int(os.environ.get('RECORDS_PAGE_SIZE_MAX', 500))
+# 导出 CSV / XLSX 时每次从游标取的行数（也是每段响应包含的行数）
+app.config['EXPORT_CHUNK_ROWS']     = int(os.environ.get('EXPORT_CHUNK_ROWS', 2000))
+
+# LibreOffice 转换进程池
+app.config['SOFFICE_BIN']         = os.environ.get('SOFFICE_BIN', 'soffice')
+app.config['SOFFICE_POOL_SIZE']   = int(os.environ.get('SOFFICE_POOL_SIZE', 2))
+app.config['SOFFICE_JOB_TIMEOUT'] = int(os.environ.get('SOFFICE_JOB_TIMEOUT', 120))
+# 带 uno 模块的 Python，用来驱动常驻 soffice（见 office_bridge.py）；为空则每个任务冷启动 soffice
+app.config['SOFFICE_PYTHON']      = os.environ.get('SOFFICE_PYTHON', '/usr/bin/python3')
+# docx 渲染 / 位图化进程数，默认与 CPU 核数一致
+app.config['PDF_RENDER_WORKERS']  = int(os.environ.get('PDF_RENDER_WORKERS', os.cpu_count() or 1))
+# A4 拼版方式：vector（矢量合并，默认） / raster（旧的 300DPI 位图）
+app.config['PDF_IMPOSE_MODE']     = os.environ.get('PDF_IMPOSE_MODE', 'vector')
+
+# 已渲染 A5 页面缓存
+PDF_TEMPLATE_PATH = os.path.join('word_templates', 'expense_a5_template.docx')
+app.config['PAGE_CACHE_DIR']    = os.environ.get('PAGE_CACHE_DIR', os.path.join('instance', 'page_cache'))
+app.config['PAGE_CACHE_MAX_MB'] = int(os.environ.get('PAGE_CACHE_MAX_MB', 200))
+
+# 报销单 PDF 后台任务（见 pdf_jobs.py）
+app.config['PDF_JOB_DIR']                 = os.environ.get('PDF_JOB_DIR', os.path.join('instance', 'pdf_jobs'))
+app.config['PDF_JOB_MAX_ACTIVE_PER_USER'] = int(os.environ.get('PDF_JOB_MAX_ACTIVE_PER_USER', 2))
+app.config['PDF_JOB_RETENTION_HOURS']     = int(os.environ.get('PDF_JOB_RETENTION_HOURS', 24))
+app.config['PDF_JOB_POLL_INTERVAL']       = float(os.environ.get('PDF_JOB_POLL_INTERVAL', 1))
+# 下载报销单 / 发票图片时只返回 X-Sendfile 头，由前端服务器（Apache mod_xsendfile、lighttpd）发送文件；
+# 不开启时由 gunicorn 用 sendfile 直接从磁盘发送，不经过应用内存
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
+# 批量审批单次最多处理的报销单数（SQL Server 单条语句最多 2100 个参数）
+app.config['APPROVE_BATCH_MAX'] = int(os.environ.get('APPROVE_BATCH_MAX', 1000))
+
+# 单个请求的 SQL 条数超过该值时记 warning（见 metrics.py）
+app.config['SQL_STATEMENT_BUDGET'] = int(os.environ.get('SQL_STATEMENT_BUDGET', 20))
+# 性能指标（见 metrics.py）：各进程的快照目录需在 gunicorn worker 和 PDF 任务进程间共享；
+# /metrics 需带 Authorization: Bearer <METRICS_TOKEN>，未配置 METRICS_TOKEN 时一律拒绝（见 dockerfile）；
+# SLOW_REQUEST_SECONDS > 0 时记录超过该耗时的请求
+app.config['METRICS_DIR']            = os.environ.get('METRICS_DIR', os.path.join('instance', 'metrics'))
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+app.config['METRICS_TOKEN']          = os.environ.get('METRICS_TOKEN', '')
+app.config['SLOW_REQUEST_SECONDS']   = float(os.environ.get('SLOW_REQUEST_SECONDS', 0))
+
+# 报销类型 / 用户名录的进程内缓存（见 refcache.py）：版本戳目录需在各 worker 间共享
+app.config['REFCACHE_DIR'] = os.environ.get('REFCACHE_DIR', os.path.join('instance', 'refcache'))
+app.config['REFCACHE_TTL'] = int(os.environ.get('REFCACHE_TTL', 300))
+
+# 请求时限（秒，见 request_timeouts.py），0 为不限；长请求按 endpoint 单独设置，
+# 环境变量 ROUTE_TIMEOUTS="endpoint=秒,..." 覆盖
+app.config['REQUEST_TIMEOUT'] = float(os.environ.get('REQUEST_TIMEOUT', 30))
+app.config['ROUTE_TIMEOUTS']  = {
+    'export_records': 600,                # 流式导出全部记录
+    'submit_expense': 300,                # 一次提交多张发票
+    'edit_expense':   120,
+    'approve_batch':  120,
+    'dashboard':      120,
+    'api_rollups':    120,
+    'invoice_image':  60,                 # 首次访问时生成缩略图
+    **parse_route_timeouts(os.environ.get('ROUTE_TIMEOUTS', '')),
+}
 
 db.init_app(app)
+init_metrics(app)
+init_request_timeouts(app)
+
+
+class UploadRequest(Request):
+    """
+    表单里的文件字段边解析边写入发票存储的临时目录（invoice_store.UploadSpool），
+    不经过 werkzeug 默认的内存 / 临时文件缓冲，保存时也不再复制一遍。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = invoice_store.spool(app.config['INVOICE_MAX_FILE_SIZE'])
+        self.__dict__.setdefault('_spools', []).append(spool)
+        return spool
+
+    def close(self):
+        super().close()
+        # 解析中途出错时，已写完的文件还没挂到 request.files 上，在这里一并清理
+        for spool in self.__dict__.get('_spools', ()):
+            spool.close()
+
+
+app.request_class = UploadRequest
+
+# ------------------- 参考数据缓存 -------------------
+TypeRef = namedtuple('TypeRef', 'id name')
+UserRef = namedtuple('UserRef', 'id username realname role')
+
+refcache = RefCache(app.config['REFCACHE_DIR'], ttl=app.config['REFCACHE_TTL'], logger=app.logger)
+refcache.register('expense_types', lambda: [TypeRef(t.id, t.name) for t in
+                                            ExpenseType.query.order_by(ExpenseType.id)])
+refcache.register('users', lambda: [UserRef(u.id, u.username, u.realname, u.role) for u in
+                                    User.query.order_by(User.id)])
+
+def expense_types():
+    """全部报销类型 [TypeRef]，按 id 排序。"""
+    return refcache.get('expense_types')
+
+def user_directory():
+    """全部用户 [UserRef]，按 id 排序（不含密码）。"""
+    return refcache.get('users')
+
+METRICS.counter('refcache_requests_total', '参考数据缓存查询次数', ('cache', 'result'))
+METRICS.counter('refcache_reloads_total', '参考数据缓存重新加载次数', ('cache',))
+
+def _refcache_metrics():
+    stats = refcache.stats()
+    return {
+        'refcache_requests_total': {(name, result): s[key] for name, s in stats.items()
+                                    for result, key in (('hit', 'hits'), ('miss', 'misses'))},
+        'refcache_reloads_total': {(name,): s['reloads'] for name, s in stats.items()},
+    }
+
+METRICS.add_collector(_refcache_metrics)
 
 # ------------------- 通用常量 -------------------
 STATUS_PENDING   = '待审批'
@@ -47,82 +236,114 @@ def validate_username(username: str):
     if not USERNAME_RE.match(username):
         abort(400, '用户名只能包含英文字母、数字、下划线，且以字母开头')
 
-def secure_filename_cn(filename: str) -> str:
+def save_invoice(expense, file_storage, saved):
     """
-    保留中文 / 数字 / 字母，剔除路径分隔符，最后附加一段 uuid 保证唯一。
+    保存上传的发票并挂到 expense 上（按内容去重，引用数 +1），写入的文件记入 saved。
+    返回被替换下来的旧文件哈希，提交后交给 collect_invoices；
+    传入 None 或空文件名时不做任何事，返回 None。
     """
-    filename = os.path.basename(filename)
-    name, ext = os.path.splitext(filename)
-    uid = uuid.uuid4().hex[:8]
-    return f'{name}_{uid}{ext}'
+    return save_invoices([(expense, file_storage)], saved)[0]
 
-def save_invoice(file_storage):
+def save_invoices(items, saved):
     """
-    把上传的 FileStorage 保存到 static/invoices，返回保存后的文件名。
-    传入 None 或空文件名则返回 None。
+    save_invoice 的批量版：items 为 [(expense, file_storage)]，
+    全部发票的去重查询、引用计数各只执行一次 SQL。返回与 items 对应的旧文件哈希列表。
     """
-    if not file_storage or not file_storage.filename:
-        return None
-    filename = secure_filename_cn(file_storage.filename)
-    file_path = UPLOAD_FOLDER / filename
-    file_storage.save(file_path)
-    return filename
-
-# 金额数字转中文大写金额
-def num_to_rmb_upper(num):
-    """
-    数字金额转中文大写金额（支持到分）
-    1234.56 -> 壹仟贰佰叁拾肆元伍角陆分
-    """
-    units = ["元", "拾", "佰", "仟", "万", "拾", "佰", "仟", "亿"]
-    nums = "零壹贰叁肆伍陆柒捌玖"
-    fraction = ["角", "分"]
-    head = ""
-    if num < 0:
-        head = "负"
-        num = -num
-    num = round(num + 0.0000001, 2)  # 防止浮点误差
-    integer = int(num)
-    decimal = int(round((num - integer) * 100))
-    result = ""
-    # 处理整数部分
-    if integer == 0:
-        result = "零元"
-    else:
-        unit_pos = 0
-        zero = True
-        while integer > 0:
-            n = integer % 10
-            if n == 0:
-                if not zero:
-                    result = nums[0] + result
-                zero = True
-            else:
-                result = nums[n] + units[unit_pos] + result
-                zero = False
-            unit_pos += 1
-            integer //= 10
-    # 处理小数部分
-    if decimal == 0:
-        result += "整"
-    else:
-        jiao = decimal // 10
-        fen = decimal % 10
-        if jiao > 0:
-            result += nums[jiao] + fraction[0]
-        if fen > 0:
-            result += nums[fen] + fraction[1]
-    # 处理零元零角等冗余
-    result = result.replace("零元", "元")
-    result = result.replace("零角", "")
-    result = result.replace("零分", "")
-    result = result.replace("元整", "元整")
-    if result.startswith("元"):
-        result = "零" + result
-    return head + result
+    results = invoice_store.save_many([file_storage for _, file_storage in items])
+    replaced = []
+    for (expense, file_storage), (relpath, digest) in zip(items, results):
+        if not relpath:
+            replaced.append(None)
+            continue
+        saved.append((relpath, digest))
+        # 同一文件重新上传时一加一减，不会被回收
+        replaced.append(invoice_store.release(expense.invoice_sha256))
+        expense.invoice        = relpath
+        expense.invoice_sha256 = digest
+        expense.invoice_name   = os.path.basename(file_storage.filename)
+    return replaced
+
+@contextmanager
+def invoice_transaction():
+    """
+    保存发票 + 提交数据库。with 块内 save_invoice 写入的文件记在 yield 出的列表里；
+    块内或提交时出错会回滚，并删除本次写入、没有被任何记录引用的文件。
+    """
+    saved = []
+    try:
+        yield saved
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        invoice_store.discard(saved)
+        raise
+
+def ingest_invoices(saved):
+    """提交后把本次新保存的发票交给进程池规范化，不等待结果。"""
+    if app.config['INVOICE_NORMALIZE']:
+        invoice_ingest.submit(digest for _, digest in saved)
+
+def collect_invoices(*digests):
+    """提交后回收引用数归零的发票文件及其缩略图。"""
+    for relpath in invoice_store.collect(*digests):
+        invoice_images.discard(relpath)
 
 import re
 
+# gthread worker 里多个线程可能同时首次调用下面的 get_*，创建单例时加锁
+_singleton_lock = threading.Lock()
+_office_pool = None
+
+def get_office_pool():
+    """
+    进程内单例的 soffice 转换池，首次使用时才创建（gunicorn fork 之后）。
+    """
+    global _office_pool
+    with _singleton_lock:
+        if _office_pool is None:
+            _office_pool = OfficePool(size=app.config['SOFFICE_POOL_SIZE'],
+                                      job_timeout=app.config['SOFFICE_JOB_TIMEOUT'],
+                                      soffice_bin=app.config['SOFFICE_BIN'],
+                                      bridge_python=app.config['SOFFICE_PYTHON'])
+    return _office_pool
+
+_render_executor = None
+
+def get_render_executor():
+    """
+    docx 渲染 / 位图化用的进程池，大小为 PDF_RENDER_WORKERS。
+    """
+    global _render_executor
+    with _singleton_lock:
+        if _render_executor is None:
+            # 用 spawn 启动子进程：soffice worker 线程随时在 fork 子进程，
+            # 直接 fork 会让子进程继承它们的管道，导致 subprocess 永远等不到 EOF
+            _render_executor = ProcessPoolExecutor(max_workers=app.config['PDF_RENDER_WORKERS'],
+                                                   mp_context=multiprocessing.get_context('spawn'),
+                                                   initializer=preload_templates)
+    return _render_executor
+
+def warm_up_pdf_pipeline():
+    """
+    预先加载模板、启动 soffice worker 和渲染子进程，避免第一次导出时才冷启动。
+    """
+    templates.preload()
+    get_office_pool().start()
+    executor = get_render_executor()
+    for f in [executor.submit(preload_templates) for _ in range(app.config['PDF_RENDER_WORKERS'])]:
+        f.result()
+
+_page_cache = None
+
+def get_page_cache():
+    """进程内单例的 A5 页面缓存。"""
+    global _page_cache
+    with _singleton_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(app.config['PAGE_CACHE_DIR'], PDF_TEMPLATE_PATH,
+                                    max_bytes=app.config['PAGE_CACHE_MAX_MB'] * 1024 * 1024)
+    return _page_cache
+
 def safe_filename(name):
     # 替换所有空白字符（包括全角空格、制表符等）为下划线
     name = re.sub(r'\\s+', '_', name)
@@ -151,6 +372,7 @@ def register():
                     role='user')
         db.session.add(user)
         db.session.commit()
+        refcache.bump('users')
         flash('注册成功，请登录')
         return redirect(url_for('login'))
     return render_template('register.html')
@@ -190,7 +412,7 @@ def submit_expense():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    types = ExpenseType.query.all()
+    types = expense_types()
 
     if request.method == 'POST':
         expenses = []
@@ -212,44 +434,51 @@ def submit_expense():
                 flash(f'第 {idx} 条报销：发票不能为空', 'danger')
                 return redirect(url_for('submit_expense'))
 
-            invoice_filename = save_invoice(invoice_file)
-
             expense = Expense(
                 date=datetime.strptime(date_str, '%Y-%m-%d').date(),
                 type_id=int(type_id),
                 title=title,
                 amount=Decimal(amount),
-                invoice=invoice_filename,
                 description=description,
                 submitter_id=session['user_id'],
                 status=STATUS_PENDING
             )
-            db.session.add(expense)
-            expenses.append(expense)
+            expenses.append((expense, invoice_file))
             idx += 1
 
-        db.session.commit()
+        # 全部条目校验通过后再保存发票，中途失败时回滚并清理已写入的文件
+        with invoice_transaction() as saved:
+            save_invoices(expenses, saved)
+            db.session.add_all(expense for expense, _ in expenses)
+            apply_rollup(added=[rollup_row(expense) for expense, _ in expenses])
+            db.session.flush()                      # 取得 id 后写入全文索引
+            index_expenses(expense for expense, _ in expenses)
+        ingest_invoices(saved)
         flash(f'成功提交 {len(expenses)} 条报销单！', 'success')
         return redirect(url_for('view_records'))
 
     return render_template('submit.html', types=types)
 
 # --------------------------------------------------
-#                  报销记录（本人）
+#          报销记录列表：筛选 / 排序 / 键集分页
 # --------------------------------------------------
-@app.route('/records')
-def view_records():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-
-    role = session.get('role')
-    query = Expense.query.filter_by(submitter_id=session['user_id'])
-
-    # ---------- 筛选 ----------
-    start_date = request.args.get('start_date')
-    end_date   = request.args.get('end_date')
-    status     = request.args.get('status')
-    type_id    = request.args.get('type')
+# sort 参数 -> (排序列, 是否倒序)；id 作为同值时的次序，保证游标稳定
+RECORD_SORTS = {
+    'date_asc':    (Expense.date,   False),
+    'date_desc':   (Expense.date,   True),
+    'amount_asc':  (Expense.amount, False),
+    'amount_desc': (Expense.amount, True),
+}
+
+def filter_records(query, args):
+    """
+    按 start_date / end_date / status / type / q（关键词，见 search.py）筛选；
+    username 筛选由 all_records 自己处理。
+    """
+    start_date = args.get('start_date')
+    end_date   = args.get('end_date')
+    status     = args.get('status')
+    type_id    = args.get('type')
 
     if start_date:
         try:
@@ -262,30 +491,182 @@ def view_records():
         except ValueError:
             pass
     if status:
-        query = query.filter_by(status=status)
+        query = query.filter(Expense.status == status)
     if type_id:
-        query = query.filter_by(type_id=int(type_id))
-
-    # ---------- 排序 ----------
-    sort = request.args.get('sort')
-    if sort == 'date_asc':
-        query = query.order_by(Expense.date.asc())
-    elif sort == 'date_desc':
-        query = query.order_by(Expense.date.desc())
-    elif sort == 'amount_asc':
-        query = query.order_by(Expense.amount.asc())
-    elif sort == 'amount_desc':
-        query = query.order_by(Expense.amount.desc())
-
-    expenses = query.all()
-    total    = sum(e.amount for e in expenses)
-    types    = ExpenseType.query.all()
-    return render_template('records.html', expenses=expenses, role=role,
-                           total=total, users=[], types=types)
+        query = query.filter(Expense.type_id == int(type_id))
+    return filter_by_keywords(query, args.get('q'))
+
+def _encode_cursor(expense, column):
+    value = getattr(expense, column.key) if column is not None else None
+    raw = json.dumps([str(value) if value is not None else None, expense.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor, column):
+    """解析游标，格式错误时返回 None（当作第一页）。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, last_id = json.loads(raw)
+        if column is Expense.date:
+            value = datetime.strptime(value, '%Y-%m-%d').date()
+        elif column is Expense.amount:
+            value = Decimal(value)
+        return value, int(last_id)
+    except (ValueError, TypeError, ArithmeticError):
+        return None
+
+def paginate_records(query, args):
+    """
+    键集（seek）分页：按 sort 排序，游标记录上一页边界行的 (排序值, id)，
+    新插入的记录不会导致翻页时重复或遗漏。
+    返回 (本页记录, 下一页游标, 上一页游标)。
+    """
+    column, desc = RECORD_SORTS.get(args.get('sort'), (None, False))
+    page_size = app.config['RECORDS_PAGE_SIZE']
+    try:
+        page_size = max(1, min(int(args.get('page_size', page_size)), app.config['RECORDS_PAGE_SIZE_MAX']))
+    except ValueError:
+        pass
+
+    after, before = args.get('after'), args.get('before')
+    backward = bool(before) and not after
+    seek = _decode_cursor(before if backward else after, column) if (after or before) else None
+    # 向前翻页时把排序方向反过来取，再把结果倒回原顺序
+    reverse = desc != backward
+
+    keys = ([column] if column is not None else []) + [Expense.id]
+    if seek:
+        value, last_id = seek
+        if column is None:
+            cond = Expense.id < last_id if reverse else Expense.id > last_id
+        elif reverse:
+            cond = or_(column < value, and_(column == value, Expense.id < last_id))
+        else:
+            cond = or_(column > value, and_(column == value, Expense.id > last_id))
+        query = query.filter(cond)
+    query = query.order_by(*[k.desc() if reverse else k.asc() for k in keys])
+
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+        next_cursor = _encode_cursor(rows[-1], column) if rows else None
+        prev_cursor = _encode_cursor(rows[0], column) if rows and has_more else None
+    else:
+        next_cursor = _encode_cursor(rows[-1], column) if rows and has_more else None
+        prev_cursor = _encode_cursor(rows[0], column) if rows and seek else None
+    return rows, next_cursor, prev_cursor
+
+def summarize_records(query, types):
+    """
+    在数据库里按 (状态, 类型) 分组求 COUNT / SUM，一次查询得到
+    总条数、总金额，以及按状态、按类型的小计。SQLite / SQL Server 通用。
+    """
+    rows = (query.order_by(None)
+            .with_entities(Expense.status, Expense.type_id,
+                           func.count(Expense.id), func.sum(Expense.amount))
+            .group_by(Expense.status, Expense.type_id)
+            .all())
+    type_names = {t.id: t.name for t in types}
+    summary = {'count': 0, 'total': Decimal('0'), 'by_status': {}, 'by_type': {}}
+    for status, type_id, count, amount in rows:
+        amount = Decimal(amount or 0)
+        summary['count'] += count
+        summary['total'] += amount
+        for bucket, key in (('by_status', status), ('by_type', type_names.get(type_id, type_id))):
+            item = summary[bucket].setdefault(key, {'count': 0, 'total': Decimal('0')})
+            item['count'] += count
+            item['total'] += amount
+    return summary
+
+# 列表页会用到 e.type.name / e.submitter.realname，一并查出避免逐行懒加载
+LIST_LOAD_OPTIONS = (joinedload(Expense.type), joinedload(Expense.submitter))
+
+def render_records(query, users, load_options=LIST_LOAD_OPTIONS):
+    """筛选后的 query -> 汇总、分页并渲染 records.html。"""
+    types    = expense_types()
+    summary  = summarize_records(query, types)
+    expenses, next_cursor, prev_cursor = paginate_records(query.options(*load_options), request.args)
+
+    def page_url(**cursor):
+        args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+        return url_for(request.endpoint, **args, **cursor)
+
+    return render_template('records.html', expenses=expenses, role=session.get('role'),
+                           total=summary['total'], summary=summary, users=users, types=types,
+                           next_url=page_url(after=next_cursor) if next_cursor else None,
+                           prev_url=page_url(before=prev_cursor) if prev_cursor else None)
+
+@app.route('/records')
+def view_records():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    query = Expense.query.filter_by(submitter_id=session['user_id'])
+    query = filter_records(query, request.args)
+    return render_records(query, users=[])
 
 # --------------------------------------------------
 #                   财务审批
 # --------------------------------------------------
+DECISION_APPROVED  = 'approved'
+DECISION_REJECTED  = 'rejected'
+DECISION_SKIPPED   = 'skipped'       # 已被其他人处理（不再是待审批）
+DECISION_NOT_FOUND = 'not_found'
+DECISION_CONFLICT  = 'conflict'      # 仍待审批，但审批人看到之后又被修改过（version 不一致）
+
+CONFLICT_MESSAGE = '报销单已被他人修改或处理，本次操作未生效，请刷新后重试'
+
+def decide_expenses(ids, action, reject_reason, approver_id, versions=None):
+    """
+    用一条条件 UPDATE（... WHERE status = '待审批' [AND version = 审批人看到的版本]）
+    批量通过 / 驳回，返回 {id: 结果}。versions 为 {id: version}，缺省的 id 不比较版本。
+    已被别人处理或修改过的报销单不会被覆盖，结果为 skipped / conflict。
+    不提交事务，由调用方 commit。
+    """
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    if not ids:
+        return {}
+    if action == 'approve':
+        values = {'status': STATUS_APPROVED, 'reject_reason': None}
+        decided = DECISION_APPROVED
+    elif action == 'reject':
+        values = {'status': STATUS_REJECTED, 'reject_reason': reject_reason}
+        decided = DECISION_REJECTED
+    else:
+        raise ValueError(f'未知操作：{action}')
+
+    versions = versions or {}
+    checked = [and_(Expense.id == i, Expense.version == versions[i]) for i in ids if i in versions]
+    match = or_(Expense.id.in_([i for i in ids if i not in versions]), *checked)
+    pending = and_(match, Expense.status == STATUS_PENDING)
+    stmt = (update(Expense).where(pending)
+            .values(approver_id=approver_id, version=Expense.version + 1, **values)
+            .execution_options(synchronize_session=False))
+    # 顺带取回月度汇总需要的列：这些报销单从 待审批 移到新状态
+    cols = (Expense.id, Expense.date, Expense.type_id, Expense.submitter_id, Expense.amount)
+    if db.engine.dialect.update_returning:           # SQLite 3.35+ RETURNING / SQL Server OUTPUT
+        rows = db.session.execute(stmt.returning(*cols)).all()
+    else:
+        rows = db.session.execute(select(*cols).where(pending).with_for_update()).all()
+        if rows:
+            db.session.execute(stmt.where(Expense.id.in_([r.id for r in rows])))
+    apply_rollup(added=[rollup_row(r, values['status']) for r in rows],
+                 removed=[rollup_row(r, STATUS_PENDING) for r in rows])
+    updated = {r.id for r in rows}
+    set_reject_reason(updated, values['reject_reason'])
+
+    results = {i: decided for i in updated}
+    missed = [i for i in ids if i not in updated]
+    if missed:
+        status = dict(db.session.execute(select(Expense.id, Expense.status)
+                                          .where(Expense.id.in_(missed))).all())
+        results.update({i: DECISION_NOT_FOUND if i not in status
+                           else DECISION_CONFLICT if status[i] == STATUS_PENDING
+                           else DECISION_SKIPPED
+                        for i in missed})
+    return results
+
 @app.route('/approve', methods=['GET', 'POST'])
 def approve_expense():
     if 'user_id' not in session or session.get('role') != 'finance':
@@ -293,28 +674,69 @@ def approve_expense():
         return redirect(url_for('login'))
 
     if request.method == 'POST':
-        expense_id = request.form['expense_id']
+        expense_id = request.form.get('expense_id', type=int)
         action     = request.form['action']
-        expense    = Expense.query.get(expense_id)
-
-        if not expense or expense.status != STATUS_PENDING:
-            flash('报销单不存在或已处理')
-            return redirect(url_for('approve_expense'))
-
-        if action == 'approve':
-            expense.status = STATUS_APPROVED
-            expense.reject_reason = None
-        elif action == 'reject':
-            expense.status = STATUS_REJECTED
-            expense.reject_reason = request.form.get('reject_reason', '').strip()
-        expense.approver_id = session['user_id']
+        if action not in ('approve', 'reject'):
+            abort(400, '未知操作')
+        version = request.form.get('version', type=int)
+        results = decide_expenses([expense_id], action, request.form.get('reject_reason', '').strip(),
+                                  session['user_id'],
+                                  versions={expense_id: version} if version is not None else None)
         db.session.commit()
-        flash('操作成功')
+        result = results.get(expense_id, DECISION_NOT_FOUND)
+        if result == DECISION_CONFLICT:
+            flash(CONFLICT_MESSAGE)
+        elif result in (DECISION_SKIPPED, DECISION_NOT_FOUND):
+            flash('报销单不存在或已处理')
+        else:
+            flash('操作成功')
         return redirect(url_for('approve_expense'))
 
-    expenses = Expense.query.filter_by(status=STATUS_PENDING).all()
+    expenses = (Expense.query.options(*LIST_LOAD_OPTIONS)
+                .filter_by(status=STATUS_PENDING).all())
     return render_template('approve.html', expenses=expenses, role='finance')
 
+@app.route('/approve/batch', methods=['POST'])
+def approve_batch():
+    """
+    批量审批：ids（JSON 数组或逗号分隔）+ action（approve / reject）+ reject_reason，
+    可选 versions（{id: version}，仅 JSON）。一个事务内完成，返回每条报销单的处理结果。
+    """
+    if 'user_id' not in session or session.get('role') != 'finance':
+        return jsonify(error='无权限'), 403
+    data = request.get_json(silent=True) or request.form
+    ids = data.get('ids') or []
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        return jsonify(error='报销单编号无效'), 400
+    try:
+        # {id: 审批人看到的 version}；给出时只在版本一致时才审批
+        versions = {int(i): int(v) for i, v in (data.get('versions') or {}).items()} \
+            if isinstance(data.get('versions'), dict) else None
+    except (TypeError, ValueError):
+        return jsonify(error='版本号无效'), 400
+    action        = data.get('action')
+    reject_reason = (data.get('reject_reason') or '').strip()
+    if not ids:
+        return jsonify(error='请选择要审批的报销单'), 400
+    if len(ids) > app.config['APPROVE_BATCH_MAX']:
+        return jsonify(error=f'一次最多审批 {app.config["APPROVE_BATCH_MAX"]} 条'), 400
+    if action not in ('approve', 'reject'):
+        return jsonify(error='未知操作'), 400
+    if action == 'reject' and not reject_reason:
+        return jsonify(error='驳回时必须填写驳回理由'), 400
+
+    results = decide_expenses(ids, action, reject_reason, session['user_id'], versions)
+    db.session.commit()
+    counts = {}
+    for result in results.values():
+        counts[result] = counts.get(result, 0) + 1
+    return jsonify(results=[{'id': i, 'result': results[i]} for i in dict.fromkeys(ids)],
+                   counts=counts)
+
 # --------------------------------------------------
 #                  编辑本人报销
 # --------------------------------------------------
@@ -332,21 +754,32 @@ def edit_expense(expense_id):
         flash('报销单已审批通过，无法编辑')
         return redirect(url_for('view_records'))
 
-    types = ExpenseType.query.all()
+    types = expense_types()
 
     if request.method == 'POST':
+        # 打开编辑页之后被审批 / 修改过：不覆盖
+        if request.form.get('version', type=int) not in (None, expense.version):
+            flash(CONFLICT_MESSAGE)
+            return redirect(url_for('view_records'))
+
+        before = rollup_row(expense)
         expense.date    = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
         expense.type_id = int(request.form['type'])
         expense.title   = request.form['title']
         expense.amount  = Decimal(request.form['amount'])
         expense.description = request.form['description']
 
-        invoice_file = request.files.get('invoice')
-        new_name = save_invoice(invoice_file)
-        if new_name:
-            expense.invoice = new_name
-
-        db.session.commit()
+        try:
+            # 提交时 UPDATE ... WHERE version = 读到的版本，期间被审批则 StaleDataError
+            with invoice_transaction() as saved:
+                replaced = save_invoice(expense, request.files.get('invoice'), saved)
+                apply_rollup(added=[rollup_row(expense)], removed=[before])
+                index_expenses([expense])
+        except StaleDataError:
+            flash(CONFLICT_MESSAGE)
+            return redirect(url_for('view_records'))
+        collect_invoices(replaced)
+        ingest_invoices(saved)
         flash('修改成功')
         return redirect(url_for('view_records'))
 
@@ -355,64 +788,235 @@ def edit_expense(expense_id):
 # --------------------------------------------------
 #               全部记录（财务 & 老板）
 # --------------------------------------------------
+def all_records_query(args):
+    """全部记录页的筛选：filter_records 的条件 + 按报销人用户名。"""
+    query = Expense.query.join(User, Expense.submitter_id == User.id)
+    query = filter_records(query, args)
+    username = args.get('username')
+    if username:
+        query = query.filter(User.username == username)
+    return query
+
 @app.route('/all_records')
 def all_records():
     if 'user_id' not in session or session.get('role') not in ['finance', 'boss']:
         flash('无权限')
         return redirect(url_for('login'))
 
-    role  = session.get('role')
-    query = Expense.query.join(User, Expense.submitter_id == User.id)
+    query = all_records_query(request.args)
+    # 已经 join 了 User，直接用这次 join 填充 submitter
+    return render_records(query, users=user_directory(),
+                          load_options=(joinedload(Expense.type), contains_eager(Expense.submitter)))
 
-    # ---------- 筛选 ----------
-    start_date = request.args.get('start_date')
-    end_date   = request.args.get('end_date')
-    username   = request.args.get('username')
-    status     = request.args.get('status')
-    type_id    = request.args.get('type')
+EXPORT_HEADER = ('编号', '日期', '报销人', '用户名', '类型', '事由', '金额', '状态', '说明', '驳回原因')
 
-    if start_date:
-        try:
-            query = query.filter(Expense.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        except ValueError:
-            pass
-    if end_date:
-        try:
-            query = query.filter(Expense.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        except ValueError:
-            pass
-    if username:
-        query = query.filter(User.username == username)
-    if status:
-        query = query.filter(Expense.status == status)
-    if type_id:
-        query = query.filter(Expense.type_id == int(type_id))
+@app.route('/all_records/export.<fmt>')
+def export_records(fmt):
+    """
+    按全部记录页当前的筛选和排序导出 CSV / XLSX，最后一行为合计（说明列为大写金额）。
+    只查需要的列并按 EXPORT_CHUNK_ROWS 分批从游标取，边取边写入响应，不把结果集放进内存。
+    """
+    if 'user_id' not in session or session.get('role') not in ['finance', 'boss']:
+        flash('无权限')
+        return redirect(url_for('login'))
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    column, desc = RECORD_SORTS.get(request.args.get('sort'), (None, False))
+    keys = ([column] if column is not None else []) + [Expense.id]
+    chunk_rows = app.config['EXPORT_CHUNK_ROWS']
+    query = (all_records_query(request.args)
+             .join(ExpenseType, Expense.type_id == ExpenseType.id)
+             .with_entities(Expense.id, Expense.date, User.realname, User.username, ExpenseType.name,
+                            Expense.title, Expense.amount, Expense.status, Expense.description,
+                            Expense.reject_reason)
+             .order_by(*[k.desc() if desc else k.asc() for k in keys])
+             .yield_per(chunk_rows))            # stream_results：服务端游标，按批取
+
+    totals = {'count': 0, 'amount': Decimal('0')}
+
+    def rows():
+        for row in query:
+            totals['count']  += 1
+            totals['amount'] += row.amount
+            yield row
+
+    def footer():
+        return ('合计', None, f'{totals["count"]} 条', None, None, None, totals['amount'],
+                None, num_to_rmb_upper(totals['amount']))
+
+    writer, mimetype = EXPORT_FORMATS[fmt]
+    filename = f'报销记录_{datetime.now():%Y%m%d_%H%M%S}.{fmt}'
+    resp = Response(stream_with_context(writer(EXPORT_HEADER, rows(), footer, chunk_rows=chunk_rows)),
+                    mimetype=mimetype)
+    resp.headers['Content-Disposition'] = (f"attachment; filename=records.{fmt}; "
+                                           f"filename*=UTF-8''{quote(filename)}")
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+@app.route('/api/search')
+def api_search():
+    """
+    关键词检索报销单，按相关度排序：q 为关键词（空格分隔，需全部命中），limit 最多 200。
+    财务 / 老板检索全部报销单，其他用户只检索本人的。
+    """
+    if 'user_id' not in session:
+        return jsonify(error='请先登录'), 401
+    matches = ranked_matches(request.args.get('q', ''))
+    if matches is None:
+        return jsonify(error='请输入关键词'), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    query = (db.session.query(Expense, matches.c.score)
+             .join(matches, matches.c.id == Expense.id)
+             .options(*LIST_LOAD_OPTIONS)
+             .order_by(matches.c.score.desc(), Expense.id.desc()))
+    if session.get('role') not in ['finance', 'boss']:
+        query = query.filter(Expense.submitter_id == session['user_id'])
+    return jsonify(results=[{
+        'id': e.id, 'date': e.date.isoformat(), 'type': e.type.name, 'title': e.title,
+        'amount': e.amount, 'status': e.status, 'submitter': e.submitter.realname,
+        'description': e.description, 'reject_reason': e.reject_reason, 'score': round(score, 4),
+    } for e, score in query.limit(limit)])
+
+# --------------------------------------------------
+#           统计报表（财务 & 老板，只读月度汇总表）
+# --------------------------------------------------
+def parse_month(value):
+    """'YYYY-MM' -> 当月 1 日；为空返回 None，格式错误抛 ValueError。"""
+    return datetime.strptime(value, '%Y-%m').date() if value else None
 
-    # ---------- 排序 ----------
-    sort = request.args.get('sort')
-    if sort == 'date_asc':
-        query = query.order_by(Expense.date.asc())
-    elif sort == 'date_desc':
-        query = query.order_by(Expense.date.desc())
-    elif sort == 'amount_asc':
-        query = query.order_by(Expense.amount.asc())
-    elif sort == 'amount_desc':
-        query = query.order_by(Expense.amount.desc())
-
-    expenses = query.all()
-    total    = sum(e.amount for e in expenses)
-    users    = User.query.all()
-    types    = ExpenseType.query.all()
-    return render_template('records.html', expenses=expenses, role=role,
-                           total=total, users=users, types=types)
+def add_months(month, n):
+    year, index = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(year, index + 1, 1)
+
+@app.route('/dashboard')
+def dashboard():
+    if 'user_id' not in session or session.get('role') not in ['finance', 'boss']:
+        flash('无权限')
+        return redirect(url_for('login'))
+
+    this_month = month_start(date.today())
+    try:
+        end   = parse_month(request.args.get('end')) or this_month
+        start = parse_month(request.args.get('start')) or add_months(end, -11)
+    except ValueError:
+        flash('月份格式应为 YYYY-MM')
+        return redirect(url_for('dashboard'))
+    statuses = request.args.getlist('status')
+    months = []
+    month = start
+    while month <= end and len(months) < 120:
+        months.append(month)
+        month = add_months(month, 1)
+
+    # 月份 × 类型 的金额透视表
+    type_names = {t.id: t.name for t in expense_types()}
+    cells, month_totals, type_totals = {}, {}, {}
+    for month, type_id, count, amount in query_rollups(('month', 'type'), start, end, statuses):
+        cells[month, type_id] = (count, amount)
+        month_totals[month] = month_totals.get(month, Decimal('0')) + amount
+        type_totals[type_id] = type_totals.get(type_id, Decimal('0')) + amount
+    type_ids = sorted(type_totals, key=lambda t: -type_totals[t])
+
+    users = {u.id: u for u in user_directory()}
+    top_submitters = [(users.get(submitter_id), count, amount) for submitter_id, count, amount
+                      in query_rollups(('submitter',), start, end, statuses, order_by_amount=True, limit=10)]
+    by_status = query_rollups(('status',), start, end)
+
+    quarter = add_months(this_month, -((this_month.month - 1) % 3))
+    ranges = [('近 12 个月', add_months(this_month, -11), this_month),
+              ('本季度', quarter, this_month),
+              ('本年', this_month.replace(month=1), this_month)]
+    return render_template('dashboard.html', start=start, end=end, statuses=statuses,
+                           all_statuses=[STATUS_PENDING, STATUS_APPROVED, STATUS_REJECTED],
+                           months=months, type_ids=type_ids, type_names=type_names,
+                           cells=cells, month_totals=month_totals, type_totals=type_totals,
+                           grand_total=sum(month_totals.values(), Decimal('0')),
+                           top_submitters=top_submitters, by_status=by_status, ranges=ranges)
+
+@app.route('/api/rollups')
+def api_rollups():
+    """
+    月度汇总 JSON 接口：group_by（month / type / submitter / status，逗号分隔，默认 month），
+    可选 start / end（YYYY-MM，含）、status（可多个）、type、username，
+    order=amount 按金额倒序，limit 最多 1000。
+    """
+    if 'user_id' not in session or session.get('role') not in ['finance', 'boss']:
+        return jsonify(error='无权限'), 403
+    group_by = [g for g in request.args.get('group_by', 'month').split(',') if g]
+    if any(g not in ROLLUP_DIMENSIONS for g in group_by) or len(set(group_by)) != len(group_by):
+        return jsonify(error=f'group_by 只能是 {", ".join(ROLLUP_DIMENSIONS)} 的组合'), 400
+    try:
+        start = parse_month(request.args.get('start'))
+        end   = parse_month(request.args.get('end'))
+    except ValueError:
+        return jsonify(error='月份格式应为 YYYY-MM'), 400
+
+    users = user_directory()
+    submitter_id = None
+    username = request.args.get('username')
+    if username:
+        submitter_id = next((u.id for u in users if u.username == username), None)
+        if submitter_id is None:
+            return jsonify(error='用户不存在'), 404
+    limit = max(1, min(request.args.get('limit', 1000, type=int), 1000))
+    rows = query_rollups(group_by, start, end, request.args.getlist('status'),
+                         request.args.get('type', type=int), submitter_id,
+                         order_by_amount=request.args.get('order') == 'amount', limit=limit)
+
+    type_names = {t.id: t.name for t in expense_types()}
+    users = {u.id: u for u in users}
+    result = []
+    for row in rows:
+        item = {'count': row[-2], 'amount': row[-1]}
+        for dim, value in zip(group_by, row):
+            if dim == 'month':
+                item['month'] = value.strftime('%Y-%m')
+            elif dim == 'type':
+                item.update(type_id=value, type=type_names.get(value))
+            elif dim == 'submitter':
+                user = users.get(value)
+                item.update(submitter_id=value, username=user and user.username,
+                            realname=user and user.realname)
+            else:
+                item['status'] = value
+        result.append(item)
+    return jsonify(group_by=group_by, rows=result)
 
 # --------------------------------------------------
 #                发票预览（静态图片）
 # --------------------------------------------------
-@app.route('/invoice_preview/<filename>')
+@app.route('/invoice_preview/<path:filename>')
 def invoice_preview(filename):
     return render_template('invoice_preview.html', invoice=filename)
 
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    """上传超过大小上限 / 文件类型不对：提示后回到原页面。"""
+    message = e.description
+    if message == RequestEntityTooLarge.description:        # MAX_CONTENT_LENGTH 触发的默认提示
+        message = f'单次提交的文件总大小不能超过 {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)} MB'
+    flash(message, 'danger')
+    return redirect(request.referrer or url_for('index'))
+
+@app.route('/invoice_image/<variant>/<path:filename>')
+def invoice_image(variant, filename):
+    """发票缩略图（thumb）/ 预览图（preview），首次访问时生成。"""
+    if 'user_id' not in session:
+        abort(401)
+    try:
+        path = invoice_images.get(filename, variant)
+    except (KeyError, FileNotFoundError, DerivativeError):
+        abort(404)
+    # 发票按内容哈希存储，同一 URL 内容不变；ETag 兜底处理过期后的重新验证。
+    # 衍生图路径相对于进程当前目录，而 send_file 会把相对路径按 app.root_path 解析
+    resp = send_file(os.path.abspath(path), mimetype=INVOICE_IMAGE_MIMETYPE, conditional=True, etag=True,
+                     max_age=app.config['INVOICE_IMAGE_MAX_AGE'])
+    resp.cache_control.public  = False           # 需登录访问，只允许浏览器缓存
+    resp.cache_control.private = True
+    return resp
+
 # --------------------------------------------------
 #             用户、类型等管理接口（略）
 # --------------------------------------------------
@@ -448,6 +1052,7 @@ def user_add():
                     role=role)
         db.session.add(user)
         db.session.commit()
+        refcache.bump('users')
         flash('账号创建成功')
         return redirect(url_for('user_manage'))
 
@@ -470,6 +1075,7 @@ def user_edit(user_id):
         if request.form['password']:
             user.password = generate_password_hash(request.form['password'])
         db.session.commit()
+        refcache.bump('users')
         flash('账号信息已更新')
         return redirect(url_for('user_manage'))
 
@@ -507,11 +1113,12 @@ def type_manage():
         if new_type and not ExpenseType.query.filter_by(name=new_type).first():
             db.session.add(ExpenseType(name=new_type))
             db.session.commit()
+            refcache.bump('expense_types')
             flash('类型添加成功')
         else:
             flash('类型已存在或无效')
 
-    types = ExpenseType.query.all()
+    types = expense_types()
     return render_template('type_manage.html', types=types)
 
 @app.route('/type_edit/<int:type_id>', methods=['POST'])
@@ -525,6 +1132,7 @@ def type_edit(type_id):
     if t and new_name and not ExpenseType.query.filter_by(name=new_name).first():
         t.name = new_name
         db.session.commit()
+        refcache.bump('expense_types')
         flash('类型已更新')
     else:
         flash('类型名无效或已存在')
@@ -544,6 +1152,7 @@ def type_delete(type_id):
         else:
             db.session.delete(t)
             db.session.commit()
+            refcache.bump('expense_types')
             flash('类型已删除')
     return redirect(url_for('type_manage'))
 
@@ -559,8 +1168,22 @@ def expense_delete(expense_id):
         flash('报销单不存在')
         return redirect(request.referrer or url_for('all_records'))
 
+    if request.form.get('version', type=int) not in (None, expense.version):
+        flash(CONFLICT_MESSAGE)
+        return redirect(request.referrer or url_for('all_records'))
+
+    released = invoice_store.release(expense.invoice_sha256)
+    # 在 delete 之前更新汇总和索引：这些语句会触发 autoflush，版本冲突要留到下面的 commit 再报
+    apply_rollup(removed=[rollup_row(expense)])
+    remove_expenses([expense.id])
     db.session.delete(expense)
-    db.session.commit()
+    try:
+        db.session.commit()                  # DELETE ... WHERE version = 读到的版本
+    except StaleDataError:
+        db.session.rollback()
+        flash(CONFLICT_MESSAGE)
+        return redirect(request.referrer or url_for('all_records'))
+    collect_invoices(released)
     flash('报销单已删除')
     return redirect(request.referrer or url_for('all_records'))
 
@@ -583,138 +1206,153 @@ def init_admin_users():
         created = True
     if created:
         db.session.commit()
+        refcache.bump('users')
         print("初始化财务 / 老板账号完毕（默认密码 123456）")
 
 # --------------------------------------------------
+def build_page_contexts(expenses, realname):
+    """
+    按每页 5 条把报销记录分组，生成 docx 模板所需的上下文列表。
+    """
+    pages = [expenses[i:i+5] for i in range(0, len(expenses), 5)]
+    total_pages = len(pages)
+    # 金额按 Decimal 相加，各页合计的大写一次批量换算
+    totals = [sum((Decimal(e.amount) for e in group), Decimal('0')) for group in pages]
+    uppers = nums_to_rmb_upper(totals)
+    contexts = []
+    for group, total_amount, total_amount_upper in zip(pages, totals, uppers):
+        details = []
+        for e in group:
+            details.append({
+                'desc': e.title,
+                'amount': f'{float(e.amount):.2f}',
+                'description': e.description or ''
+            })
+        while len(details) < 5:
+            details.append({'desc': '', 'amount': '', 'description': ''})
+        contexts.append({
+            'date': group[0].date.strftime('%Y年%m月%d日') if group else '',
+            'page_count': str(total_pages),
+            'details': details,
+            'total': f'{total_amount:.2f}',
+            'amount_upper': total_amount_upper,
+            'name': realname
+        })
+    return contexts
+
+def render_expense_pdf(expenses, realname, out_path, progress=None):
+    """
+    报销记录 -> A5 docx -> A5 pdf -> A4 拼版 pdf，写入 out_path。
+    progress(stage, done_pages, total_pages) 用于汇报进度，可为 None。
+    """
+    contexts = build_page_contexts(expenses, realname)
+    return export_pdf(contexts, out_path, PDF_TEMPLATE_PATH,
+                      office_pool=get_office_pool(),
+                      executor=get_render_executor(),
+                      cache=get_page_cache(),
+                      mode=app.config['PDF_IMPOSE_MODE'],
+                      progress=progress)
+
+# --------------------------------------------------
+#            报销单 PDF（后台任务 + 轮询下载）
+# --------------------------------------------------
+JOB_QUEUED  = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE    = 'done'
+JOB_FAILED  = 'failed'
+
+def _job_json(job):
+    data = {
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'done_pages': job.done_pages,
+        'total_pages': job.total_pages,
+        'error': job.error,
+        'status_url': url_for('pdf_job_status', job_id=job.id),
+    }
+    if job.status == JOB_DONE:
+        data['download_url'] = url_for('pdf_job_download', job_id=job.id)
+    return data
+
+def _get_own_job(job_id):
+    job = PdfJob.query.get(job_id)
+    if not job or job.user_id != session['user_id']:
+        abort(404)
+    return job
+
 @app.route('/generate_pdf', methods=['POST'])
 def generate_pdf():
-    import shutil
-    from docxtpl import DocxTemplate
-    from PyPDF2 import PdfReader
-    import subprocess
-    import tempfile
-    from datetime import datetime
-    import os
-    from pdf2image import convert_from_path
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
-    from PyPDF2 import PdfWriter
-    from io import BytesIO
-
     if 'user_id' not in session:
-        flash('请先登录')
-        return redirect(url_for('login'))
+        return jsonify(error='请先登录'), 401
     user_id = session['user_id']
-    user = User.query.get(user_id)
-    if not user:
-        flash('用户不存在')
-        return redirect(url_for('view_records'))
     selected_ids = request.form.get('selected_ids', '')
-    if not selected_ids:
-        flash('请选择要生成报销单的记录')
-        return redirect(url_for('view_records'))
-    try:
-        id_list = [int(i) for i in selected_ids.split(',') if i.strip().isdigit()]
-    except Exception:
-        flash('参数错误')
-        return redirect(url_for('view_records'))
+    id_list = [int(i) for i in selected_ids.split(',') if i.strip().isdigit()]
     if not id_list:
-        flash('请选择要生成报销单的记录')
-        return redirect(url_for('view_records'))
-    expenses = Expense.query.filter(Expense.id.in_(id_list), Expense.submitter_id==user_id, Expense.status=='通过审批').order_by(Expense.date.asc()).all()
-    if not expenses or len(expenses) != len(id_list):
-        flash('部分报销记录不存在或无权操作')
+        return jsonify(error='请选择要生成报销单的记录'), 400
+
+    count = Expense.query.filter(Expense.id.in_(id_list), Expense.submitter_id==user_id,
+                                 Expense.status==STATUS_APPROVED).count()
+    if count != len(set(id_list)):
+        return jsonify(error='部分报销记录不存在或无权操作'), 400
+
+    busy = '已有报销单正在生成，请稍后再试'
+    limit = app.config['PDF_JOB_MAX_ACTIVE_PER_USER']
+    active = [slot for (slot,) in db.session.query(PdfJob.active_slot)
+              .filter(PdfJob.user_id==user_id, PdfJob.status.in_([JOB_QUEUED, JOB_RUNNING]))]
+    if len(active) >= limit:
+        return jsonify(error=busy), 429
+    slot = min(set(range(limit)) - set(active))
+
+    # 名额由唯一索引 ux_pdf_job_user_slot 把关：并发提交抢到同一个名额时只有一个能插入成功
+    job = PdfJob(id=uuid.uuid4().hex, user_id=user_id,
+                 expense_ids=','.join(str(i) for i in id_list),
+                 status=JOB_QUEUED, total_pages=(len(set(id_list)) + 4) // 5, active_slot=slot)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify(error=busy), 429
+    return jsonify(_job_json(job)), 202
+
+@app.route('/pdf_jobs/<job_id>')
+def pdf_job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify(error='请先登录'), 401
+    return jsonify(_job_json(_get_own_job(job_id)))
+
+@app.route('/pdf_jobs/<job_id>/download')
+def pdf_job_download(job_id):
+    if 'user_id' not in session:
+        flash('请先登录')
+        return redirect(url_for('login'))
+    job = _get_own_job(job_id)
+    if job.status != JOB_DONE or not job.result_path or not os.path.exists(job.result_path):
+        flash('报销单尚未生成或已过期，请重新生成')
         return redirect(url_for('view_records'))
-    pages = [expenses[i:i+5] for i in range(0, len(expenses), 5)]
-    total_pages = len(pages)
-    with tempfile.TemporaryDirectory() as tmpdir:
-        docx_files = []
-        pdf_files = []
-        template_path = os.path.join('word_templates', 'expense_a5_template.docx')
-        for idx, group in enumerate(pages):
-            details = []
-            for e in group:
-                details.append({
-                    'desc': e.title,
-                    'amount': f'{float(e.amount):.2f}',
-                    'description': e.description or ''
-                })
-            while len(details) < 5:
-                details.append({'desc': '', 'amount': '', 'description': ''})
-            total_amount = sum(float(e.amount) for e in group)
-            total_amount_upper = num_to_rmb_upper(total_amount)
-            context = {
-                'date': group[0].date.strftime('%Y年%m月%d日') if group else '',
-                'page_count': str(total_pages),
-                'details': details,
-                'total': f'{total_amount:.2f}',
-                'amount_upper': total_amount_upper,
-                'name': user.realname
-            }
-            tpl = DocxTemplate(template_path)
-            docx_path = os.path.join(tmpdir, f'baoxiao_{idx+1}.docx')
-            tpl.render(context)
-            tpl.save(docx_path)
-            docx_files.append(docx_path)
-        for docx_file in docx_files:
-            cmd = [
-                'soffice', '--headless', '--convert-to', 'pdf', '--outdir', tmpdir, docx_file
-            ]
-            subprocess.run(cmd, check=True)
-            pdf_file = os.path.splitext(docx_file)[0] + '.pdf'
-            pdf_files.append(pdf_file)
-        # 拼版A4竖向PDF（pdf2image+reportlab）
-        a4_width, a4_height = A4
-        gap = 1 * mm
-        a4_pdf_writer = PdfWriter()
-        a4_pdf_bytes_list = []
-        # 先将所有A5 PDF转为图片
-        a5_images = []
-        for pdf in pdf_files:
-            images = convert_from_path(pdf, dpi=300, size=(int(a4_width), None))
-            a5_images.append(images[0])  # 每个A5只有一页
-        # 每2张A5拼成1页A4
-        for i in range(0, len(a5_images), 2):
-            packet = BytesIO()
-            can = canvas.Canvas(packet, pagesize=A4)
-            # 上半部分
-            img1 = a5_images[i]
-            img1_width, img1_height = img1.size
-            scale1 = min(a4_width / img1_width, (a4_height - gap) / 2 / img1_height)
-            draw_w1 = img1_width * scale1
-            draw_h1 = img1_height * scale1
-            can.drawInlineImage(img1, 0, a4_height/2 + gap/2, width=draw_w1, height=draw_h1)
-            # 下半部分
-            if i+1 < len(a5_images):
-                img2 = a5_images[i+1]
-                img2_width, img2_height = img2.size
-                scale2 = min(a4_width / img2_width, (a4_height - gap) / 2 / img2_height)
-                draw_w2 = img2_width * scale2
-                draw_h2 = img2_height * scale2
-                can.drawInlineImage(img2, 0, 0, width=draw_w2, height=draw_h2)
-            can.save()
-            packet.seek(0)
-            # 转为PDF页
-            pdf_page = PdfReader(packet).pages[0]
-            a4_pdf_writer.add_page(pdf_page)
-        # 生成文件名始终为'报销单_日期.pdf'，不包含用户名
-        filename = f'报销单_{datetime.now().strftime("%Y%m%d")}.pdf'
-        final_pdf_path = os.path.join(tmpdir, filename)
-        with open(final_pdf_path, 'wb') as f:
-            a4_pdf_writer.write(f)
-        # 用 BytesIO 读入内存，避免文件占用
-        import io
-        with open(final_pdf_path, 'rb') as f:
-            pdf_bytes = f.read()
-        pdf_io = io.BytesIO(pdf_bytes)
-        pdf_io.seek(0)
-        return send_file(pdf_io, as_attachment=True, download_name=filename, mimetype='application/pdf')
+    return send_file(os.path.abspath(job.result_path), as_attachment=True,
+                     download_name=job.filename, mimetype='application/pdf')
+
+# --------------------------------------------------
+#                 性能指标（Prometheus）
+# --------------------------------------------------
+@app.route('/metrics')
+def metrics():
+    """所有 worker / PDF 任务进程汇总后的指标，见 metrics.py。"""
+    # 指标里有各路由的访问量、慢请求等内部信息，没有配置令牌时不对外开放
+    token = app.config['METRICS_TOKEN']
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+    resp = Response(render_metrics(app.config['METRICS_DIR']), content_type=PROMETHEUS_CONTENT_TYPE)
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 # --------------------------------------------------
 if __name__ == '__main__':
+    from migrations import upgrade
     with app.app_context():
-        db.create_all()
+        upgrade(db.engine)
         init_admin_users()
     print("USE_SQLSERVER:", os.environ.get("USE_SQLSERVER"))
     print("SQLALCHEMY_DATABASE_URI:", os.environ.get("SQLALCHEMY_DATABASE_URI"))
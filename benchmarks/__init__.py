@@ -0,0 +1,3 @@
+"""
+性能基准脚本。各脚本可单独运行：python -m benchmarks.<name>
+"""
@@ -0,0 +1,114 @@
+"""
+大批量导出压测：生成合成数据后通过 /all_records/export.<fmt> 流式导出，
+统计耗时、吞吐、响应大小和导出期间 Python 堆内存峰值（tracemalloc），
+并与"一次性 query.all() 取出全部 ORM 对象"的峰值对比。
+
+    python -m benchmarks.bench_export --rows 1000000
+    python -m benchmarks.bench_export --rows 200000 --formats csv
+    python -m benchmarks.bench_export --url "mssql+pyodbc://..." --rows 1000000
+
+默认在临时目录建 SQLite 库；--url 指向 SQL Server 时会重建 user / expense_type / expense 表，
+请只用于测试库。导出峰值内存应与行数无关，可换不同 --rows 对比。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from benchmarks.bench_indexes import create_indexes, seed  # noqa: E402
+
+
+def _import_app(url):
+    # app.py 在导入时读取数据库配置
+    os.environ['USE_SQLSERVER'] = '1'
+    os.environ['SQLALCHEMY_DATABASE_URI'] = url
+    import app as appmod
+    appmod.app.config['TESTING'] = True
+    return appmod
+
+
+def _mb(n):
+    return f'{n / 1024 / 1024:8.1f} MB'
+
+
+def export(appmod, fmt, chunk_rows):
+    app = appmod.app
+    app.config['EXPORT_CHUNK_ROWS'] = chunk_rows
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'], sess['role'] = 1, 'finance'
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    resp = client.get(f'/all_records/export.{fmt}', buffered=False)
+    first = None
+    size = chunks = 0
+    for chunk in resp.response:
+        if first is None:
+            first = time.perf_counter() - start
+        size   += len(chunk)
+        chunks += 1
+    resp.close()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, first, size, chunks, peak
+
+
+def load_all(appmod):
+    """对照组：把全部记录作为 ORM 对象一次取出（相当于不分页渲染全部记录页）。"""
+    from models import Expense
+    with appmod.app.app_context():
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = Expense.query.all()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, len(rows), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--types', type=int, default=12)
+    parser.add_argument('--chunk-rows', type=int, default=2000)
+    parser.add_argument('--formats', default='csv,xlsx')
+    parser.add_argument('--skip-load-all', action='store_true', help='不跑一次性取出全部记录的对照组')
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f'sqlite:///{os.path.join(tmpdir.name, "bench.db")}'
+    engine = create_engine(url)
+    t = time.perf_counter()
+    seed(engine, args.rows, args.users, args.types)
+    create_indexes(engine)
+    engine.dispose()
+    print(f'生成 {args.rows} 条记录：{time.perf_counter() - t:.1f} s')
+
+    appmod = _import_app(url)
+    for fmt in args.formats.split(','):
+        elapsed, first, size, chunks, peak = export(appmod, fmt, args.chunk_rows)
+        print(f'{fmt:>5}: {elapsed:7.1f} s，{args.rows / elapsed:9.0f} 行/s，首字节 {first * 1000:6.0f} ms，'
+              f'{_mb(size)}，{chunks} 段，内存峰值 {_mb(peak)}')
+    if not args.skip_load_all:
+        elapsed, n, peak = load_all(appmod)
+        print(f'query.all(): {elapsed:7.1f} s，{n} 个 ORM 对象，内存峰值 {_mb(peak)}')
+
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+A4 拼版对比：vector（PDF 空间合并） vs raster（pdf2image 位图）。
+用 reportlab 生成一批带中文文字的 A5 页面作为输入，比较耗时和输出体积。
+
+    python -m benchmarks.bench_impose --pages 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+from pdf_export import IMPOSE_RASTER, IMPOSE_VECTOR, impose_a4  # noqa: E402
+
+
+def make_a5_pages(tmpdir, pages):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfgen import canvas
+
+    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    paths = []
+    for idx in range(pages):
+        path = os.path.join(tmpdir, f'baoxiao_{idx + 1}.pdf')
+        can = canvas.Canvas(path, pagesize=A5)
+        can.setFont('STSong-Light', 12)
+        can.drawString(40, 550, f'费用报销单  第 {idx + 1} 页')
+        for row in range(5):
+            can.drawString(40, 480 - row * 30, f'测试报销 {row + 1}    123.45    基准测试')
+            can.line(30, 470 - row * 30, 390, 470 - row * 30)
+        can.drawString(40, 300, '合计：陆佰壹拾柒元贰角伍分')
+        can.save()
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=50)
+    args = parser.parse_args()
+
+    modes = [IMPOSE_VECTOR]
+    if shutil.which('pdftoppm'):
+        modes.append(IMPOSE_RASTER)
+    else:
+        print('未找到 poppler（pdftoppm），跳过 raster')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdf_files = make_a5_pages(tmpdir, args.pages)
+        for mode in modes:
+            out = os.path.join(tmpdir, f'out_{mode}.pdf')
+            start = time.perf_counter()
+            impose_a4(pdf_files, out, mode)
+            elapsed = time.perf_counter() - start
+            print(f'{mode:>6}: {elapsed:7.2f} s  {os.path.getsize(out) / 1024:9.1f} KB  '
+                  f'({len(PdfReader(out).pages)} 页 A4)')
+
+
+if __name__ == '__main__':
+    main()
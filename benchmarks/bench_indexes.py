@@ -0,0 +1,147 @@
+"""
+Expense 复合索引前后对比：生成合成数据，分别在无索引 / 有索引时
+打印各典型查询的执行计划和耗时。
+
+    python -m benchmarks.bench_indexes --rows 1000000
+    python -m benchmarks.bench_indexes --url "mssql+pyodbc://..." --rows 1000000
+
+默认在临时目录建 SQLite 库；--url 指向 SQL Server 时用 SHOWPLAN_TEXT 取计划
+（会在目标库里重建 user / expense_type / expense 表，请只用于测试库）。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select, text  # noqa: E402
+
+from models import Expense, ExpenseType, User, db  # noqa: E402
+
+STATUSES = ['待审批', '通过审批', '驳回']
+E = Expense.__table__
+
+# 与 app.py 中各列表页 / 审批页 / 汇总实际发出的查询对应
+QUERIES = {
+    'records 按日期倒序':  lambda p: select(E).where(E.c.submitter_id == p['user'])
+                                          .order_by(E.c.date.desc(), E.c.id.desc()).limit(50),
+    'records 按金额倒序':  lambda p: select(E).where(E.c.submitter_id == p['user'])
+                                          .order_by(E.c.amount.desc(), E.c.id.desc()).limit(50),
+    'approve 待审批列表':  lambda p: select(E).where(E.c.status == '待审批')
+                                          .order_by(E.c.date.desc()).limit(500),
+    'all_records 按类型':  lambda p: select(E).where(E.c.type_id == p['type'])
+                                          .order_by(E.c.date.desc(), E.c.id.desc()).limit(50),
+    'all_records 日期区间': lambda p: select(E).where(E.c.date.between(p['start'], p['end']))
+                                          .order_by(E.c.date.asc(), E.c.id.asc()).limit(50),
+    'records 汇总':        lambda p: select(E.c.status, E.c.type_id, func.count(E.c.id), func.sum(E.c.amount))
+                                          .where(E.c.submitter_id == p['user'])
+                                          .group_by(E.c.status, E.c.type_id),
+}
+
+
+def seed(engine, rows, users, types, batch=20000):
+    db.metadata.drop_all(engine, tables=[E, ExpenseType.__table__, User.__table__])
+    db.metadata.create_all(engine, tables=[User.__table__, ExpenseType.__table__, E])
+    rnd = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'id': i, 'username': f'user{i}', 'password': 'x', 'role': 'user', 'realname': f'用户{i}'}
+            for i in range(1, users + 1)])
+        conn.execute(insert(ExpenseType.__table__), [
+            {'id': i, 'name': f'类型{i}'} for i in range(1, types + 1)])
+    start = date(2020, 1, 1)
+    for offset in range(0, rows, batch):
+        chunk = [{'date': start + timedelta(days=rnd.randrange(1500)),
+                  'type_id': rnd.randint(1, types),
+                  'title': f'报销 {offset + i}',
+                  'amount': Decimal(rnd.randrange(100, 500000)) / 100,
+                  'status': rnd.choices(STATUSES, weights=[5, 90, 5])[0],
+                  'submitter_id': rnd.randint(1, users)}
+                 for i in range(min(batch, rows - offset))]
+        with engine.begin() as conn:
+            conn.execute(insert(E), chunk)
+
+
+def drop_indexes(engine):
+    with engine.begin() as conn:
+        for index in E.indexes:
+            index.drop(bind=conn, checkfirst=True)
+
+
+def create_indexes(engine):
+    with engine.begin() as conn:
+        for index in E.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(conn, compile_kwargs={'literal_binds': True})
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+    if conn.dialect.name == 'mssql':
+        conn.exec_driver_sql('SET SHOWPLAN_TEXT ON')
+        try:
+            return [row[0].strip() for rs in [conn.exec_driver_sql(str(compiled))] for row in rs]
+        finally:
+            conn.exec_driver_sql('SET SHOWPLAN_TEXT OFF')
+    return []
+
+
+def measure(engine, params, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, build in QUERIES.items():
+            stmt = build(params)
+            plan = explain(conn, stmt)
+            conn.execute(stmt).fetchall()           # 预热
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(stmt).fetchall()
+            results[name] = ((time.perf_counter() - start) / repeat * 1000, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--types', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f'sqlite:///{os.path.join(tmpdir.name, "bench.db")}'
+    engine = create_engine(url)
+
+    t = time.perf_counter()
+    seed(engine, args.rows, args.users, args.types)
+    print(f'生成 {args.rows} 条记录：{time.perf_counter() - t:.1f} s')
+    params = {'user': args.users // 2, 'type': 1, 'start': date(2021, 3, 1), 'end': date(2021, 3, 31)}
+
+    drop_indexes(engine)
+    before = measure(engine, params, args.repeat)
+    t = time.perf_counter()
+    create_indexes(engine)
+    print(f'创建索引：{time.perf_counter() - t:.1f} s')
+    after = measure(engine, params, args.repeat)
+
+    for name in QUERIES:
+        (ms_before, plan_before), (ms_after, plan_after) = before[name], after[name]
+        print(f'\n== {name}: {ms_before:9.2f} ms -> {ms_after:9.2f} ms ({ms_before / max(ms_after, 1e-6):.1f}x)')
+        print('   无索引: ' + ' | '.join(plan_before))
+        print('   有索引: ' + ' | '.join(plan_after))
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
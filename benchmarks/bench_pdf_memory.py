@@ -0,0 +1,185 @@
+"""
+报销单 PDF 生成 / 下载的峰值内存（RSS）：原来的 PdfWriter 整份留在内存 vs SheetWriter 逐张写盘，
+把文件读进 BytesIO 再 send_file vs send_file 文件路径。
+
+    python -m benchmarks.bench_pdf_memory --pages 100
+    python -m benchmarks.bench_pdf_memory --pages 100 --scan            # 每页带一张 300DPI 扫描件
+    python -m benchmarks.bench_pdf_memory --font /usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc
+
+输入是 reportlab 生成的 A5 PDF（pages 张，拼成 pages/2 张 A4）。LibreOffice 转出的 A5 每页各自
+嵌入字体子集，--font 给一个 TTF / TTC 时同样按页嵌入；--scan 给每页加一张扫描件，模拟图片较多的页面。
+有 poppler（pdftoppm）时还比较 raster 拼版：原实现先把全部 A5 转成位图放在列表里，新实现逐张转换。
+
+每个变体在单独的子进程里执行，报告执行期间 RSS 峰值比开始时高出多少（MB，不含导入模块的内存）。
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pdf2image import convert_from_path  # noqa: E402
+from PyPDF2 import PdfReader, PdfWriter  # noqa: E402
+
+from pdf_export import A4_WIDTH, IMPOSE_RASTER, IMPOSE_VECTOR, impose_a4, raster_sheet, vector_sheet  # noqa: E402
+
+
+def make_a5_pages(tmpdir, pages, font=None, scan=False):
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    from benchmarks.seed import invoice_png
+
+    rnd = random.Random(42)
+    # 扫描件只生成几张轮流使用；每个 A5 文件仍各自嵌入一份
+    scans = [invoice_png(rnd, 1748, 2480) for _ in range(4)] if scan else []
+    paths = []
+    for idx in range(pages):
+        if font:
+            # 每个 A5 是独立的文件，和 soffice 的输出一样各自嵌入一份字体子集
+            name = f'Embedded{idx}'
+            pdfmetrics.registerFont(TTFont(name, font, subfontIndex=0))
+        else:
+            name = 'STSong-Light'
+            pdfmetrics.registerFont(UnicodeCIDFont(name))
+        path = os.path.join(tmpdir, f'baoxiao_{idx + 1}.pdf')
+        can = canvas.Canvas(path, pagesize=A5)
+        can.setFont(name, 12)
+        can.drawString(40, 550, f'费用报销单  第 {idx + 1} 页')
+        for row in range(5):
+            can.drawString(40, 480 - row * 30, f'测试报销 {row + 1}    123.45    基准测试')
+            can.line(30, 470 - row * 30, 390, 470 - row * 30)
+        can.drawString(40, 300, '合计：陆佰壹拾柒元贰角伍分')
+        if scan:
+            can.drawImage(ImageReader(BytesIO(scans[idx % len(scans)])), 40, 40, width=140, height=200)
+        can.save()
+        paths.append(path)
+    return paths
+
+
+# ------------------- 各变体（在子进程中执行） -------------------
+def legacy_vector(pdf_files, out):
+    writer = PdfWriter()
+    for i in range(0, len(pdf_files), 2):
+        writer.add_page(vector_sheet(pdf_files[i:i + 2]))
+    with open(out, 'wb') as f:
+        writer.write(f)
+
+
+def legacy_raster(pdf_files, out):
+    writer = PdfWriter()
+    a5_images = [convert_from_path(pdf, dpi=300, size=(int(A4_WIDTH), None))[0] for pdf in pdf_files]
+    for i in range(0, len(a5_images), 2):
+        writer.add_page(raster_sheet(a5_images[i:i + 2]))
+    with open(out, 'wb') as f:
+        writer.write(f)
+
+
+def _download(pdf_path, in_memory):
+    from flask import Flask, send_file
+
+    app = Flask(__name__)
+
+    @app.route('/download')
+    def download():
+        if in_memory:
+            with open(pdf_path, 'rb') as f:
+                data = f.read()
+            return send_file(BytesIO(data), as_attachment=True, download_name='报销单.pdf',
+                             mimetype='application/pdf')
+        return send_file(pdf_path, as_attachment=True, download_name='报销单.pdf', mimetype='application/pdf')
+
+    resp = app.test_client().get('/download', buffered=False)
+    size = sum(len(chunk) for chunk in resp.response)
+    resp.close()
+    assert size == os.path.getsize(pdf_path)
+
+
+VARIANTS = {
+    'vector PdfWriter':   lambda files, out, pdf: legacy_vector(files, out),
+    'vector SheetWriter': lambda files, out, pdf: impose_a4(files, out, IMPOSE_VECTOR),
+    'raster PdfWriter':   lambda files, out, pdf: legacy_raster(files, out),
+    'raster SheetWriter': lambda files, out, pdf: impose_a4(files, out, IMPOSE_RASTER),
+    '下载 BytesIO':        lambda files, out, pdf: _download(pdf, in_memory=True),
+    '下载 文件路径':        lambda files, out, pdf: _download(pdf, in_memory=False),
+}
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+
+def run_variant(name, input_dir, out, pdf):
+    files = sorted((os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.startswith('baoxiao_')),
+                   key=lambda p: int(p.rsplit('_', 1)[1].split('.')[0]))
+    # 导入阶段的峰值可能比要测的部分还高：Linux 上先把 VmHWM 重置为当前 RSS，否则退回 ru_maxrss
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        before, peak = _status_kb('VmRSS'), lambda: _status_kb('VmHWM')
+    except OSError:
+        before, peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                        lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    start = time.perf_counter()
+    VARIANTS[name](files, out, pdf)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'base_mb': before / 1024, 'delta_mb': (peak() - before) / 1024, 'seconds': elapsed}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=100, help='A5 页数')
+    parser.add_argument('--font', help='按页嵌入的 TTF / TTC 字体')
+    parser.add_argument('--scan', action='store_true', help='每页加一张扫描件')
+    parser.add_argument('--variant', help=argparse.SUPPRESS)      # 子进程内部使用
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    parser.add_argument('--pdf', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.variant:
+        return run_variant(args.variant, args.input, args.out, args.pdf)
+
+    names = ['vector PdfWriter', 'vector SheetWriter']
+    if shutil.which('pdftoppm'):
+        names += ['raster PdfWriter', 'raster SheetWriter']
+    else:
+        print('未找到 poppler（pdftoppm），跳过 raster')
+    names += ['下载 BytesIO', '下载 文件路径']
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = os.path.join(tmpdir, 'a5')
+        os.mkdir(input_dir)
+        make_a5_pages(input_dir, args.pages, args.font, args.scan)
+        a5_mb = sum(os.path.getsize(os.path.join(input_dir, f)) for f in os.listdir(input_dir)) / 1e6
+        print(f'输入：{args.pages} 张 A5，共 {a5_mb:.1f} MB')
+        pdf = os.path.join(tmpdir, 'vector SheetWriter.pdf')
+        for name in names:
+            out = os.path.join(tmpdir, f'{name}.pdf')
+            result = json.loads(subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_pdf_memory', '--variant', name, '--input', input_dir,
+                 '--out', out, '--pdf', pdf], cwd=ROOT, check=True, capture_output=True, text=True).stdout)
+            size = f'{os.path.getsize(out) / 1e6:6.1f} MB' if os.path.exists(out) else ' ' * 9
+            print(f'   {name:<20} 峰值 +{result["delta_mb"]:7.1f} MB   {result["seconds"]:6.2f} s   输出 {size}')
+        pages = len(PdfReader(pdf).pages)
+        print(f'输出 {pages} 张 A4')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+报销单 PDF 端到端耗时：顺序执行（1 个进程 / 1 个 soffice worker） vs 并行流水线。
+不使用页面缓存，分别测 1 / 10 / 100 条报销记录。
+
+    python -m benchmarks.bench_pipeline --sizes 1 10 100
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import PDF_TEMPLATE_PATH, app, build_page_contexts  # noqa: E402
+from office_pool import OfficePool  # noqa: E402
+from pdf_export import export_pdf  # noqa: E402
+from template_registry import preload_templates  # noqa: E402
+
+
+def fake_expenses(n):
+    return [SimpleNamespace(title=f'测试报销 {i}', amount=Decimal('100.00') + i,
+                            description='基准测试', date=date(2024, 1, 1) + timedelta(days=i))
+            for i in range(n)]
+
+
+def run(n, workers, pool_size, mode):
+    contexts = build_page_contexts(fake_expenses(n), '基准')
+    pool = OfficePool(size=pool_size, soffice_bin=app.config['SOFFICE_BIN'],
+                      bridge_python=app.config['SOFFICE_PYTHON'])
+    pool.start()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=preload_templates) as executor, \
+            tempfile.TemporaryDirectory() as tmpdir:
+        out = os.path.join(tmpdir, 'out.pdf')
+        start = time.perf_counter()
+        export_pdf(contexts, out, PDF_TEMPLATE_PATH, pool, executor, mode=mode)
+        elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--workers', type=int, default=app.config['PDF_RENDER_WORKERS'])
+    parser.add_argument('--pool-size', type=int, default=app.config['SOFFICE_POOL_SIZE'])
+    parser.add_argument('--mode', default=app.config['PDF_IMPOSE_MODE'])
+    args = parser.parse_args()
+
+    print(f'{"记录数":>6} {"顺序(s)":>9} {"并行(s)":>9} {"加速比":>7}')
+    for n in args.sizes:
+        serial   = run(n, 1, 1, args.mode)
+        parallel = run(n, args.workers, args.pool_size, args.mode)
+        print(f'{n:>8} {serial:>10.2f} {parallel:>10.2f} {serial / parallel:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+金额大写换算耗时：原 app.num_to_rmb_upper（float + 逐位拼接） vs rmb_upper 模块（逐条 / 批量）。
+正确性（往返、与旧实现对照等）见 tests/test_rmb_upper.py。
+
+    python -m benchmarks.bench_rmb_upper --n 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rmb_upper  # noqa: E402
+from rmb_upper import num_to_rmb_upper, nums_to_rmb_upper  # noqa: E402
+
+def legacy_num_to_rmb_upper(num):
+    """改动前 app.py 中的实现，原样保留作对照。"""
+    units = ["元", "拾", "佰", "仟", "万", "拾", "佰", "仟", "亿"]
+    nums = "零壹贰叁肆伍陆柒捌玖"
+    fraction = ["角", "分"]
+    head = ""
+    if num < 0:
+        head = "负"
+        num = -num
+    num = round(num + 0.0000001, 2)  # 防止浮点误差
+    integer = int(num)
+    decimal = int(round((num - integer) * 100))
+    result = ""
+    # 处理整数部分
+    if integer == 0:
+        result = "零元"
+    else:
+        unit_pos = 0
+        zero = True
+        while integer > 0:
+            n = integer % 10
+            if n == 0:
+                if not zero:
+                    result = nums[0] + result
+                zero = True
+            else:
+                result = nums[n] + units[unit_pos] + result
+                zero = False
+            unit_pos += 1
+            integer //= 10
+    # 处理小数部分
+    if decimal == 0:
+        result += "整"
+    else:
+        jiao = decimal // 10
+        fen = decimal % 10
+        if jiao > 0:
+            result += nums[jiao] + fraction[0]
+        if fen > 0:
+            result += nums[fen] + fraction[1]
+    # 处理零元零角等冗余
+    result = result.replace("零元", "元")
+    result = result.replace("零角", "")
+    result = result.replace("零分", "")
+    result = result.replace("元整", "元整")
+    if result.startswith("元"):
+        result = "零" + result
+    return head + result
+
+
+def timed(fn):
+    rmb_upper._from_cents.cache_clear()
+    rmb_upper._section.cache_clear()
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    datasets = {
+        # 1 ~ 5000 元的任意两位小数，几乎不重复
+        '随机金额': [Decimal(rnd.randrange(100, 500000)).scaleb(-2) for _ in range(args.n)],
+        # 实际报销单里金额高度重复（餐补、车费、住宿标准……），取 2000 种常见金额
+        '常见金额': [Decimal(rnd.choice(range(100, 500000, 250))).scaleb(-2) for _ in range(args.n)],
+    }
+    for label, decimals in datasets.items():
+        floats = [float(d) for d in decimals]
+        results = [
+            ('旧实现（float）',        timed(lambda: [legacy_num_to_rmb_upper(v) for v in floats])),
+            ('逐条 num_to_rmb_upper',  timed(lambda: [num_to_rmb_upper(v) for v in decimals])),
+            ('批量 nums_to_rmb_upper', timed(lambda: nums_to_rmb_upper(decimals))),
+        ]
+        base = results[0][1]
+        print(f'== {label}（{args.n} 个，{len(set(decimals))} 种取值）')
+        for name, seconds in results:
+            print(f'   {name:<24} {seconds:6.2f} s  {seconds / args.n * 1e6:5.2f} µs/个  ({base / seconds:4.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
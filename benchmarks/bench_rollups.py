@@ -0,0 +1,97 @@
+"""
+统计查询：直接聚合 expense 表 vs 读月度汇总表 expense_rollup。
+
+    python -m benchmarks.bench_rollups --rows 1000000
+    python -m benchmarks.bench_rollups --url "mssql+pyodbc://..." --rows 1000000
+
+默认在临时目录建 SQLite 库；--url 指向 SQL Server 时会重建相关表，请只用于测试库。
+汇总表行数约为 月份 × 类型 × 人数 × 状态 中实际出现的组合，人数越少压缩比越高。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, extract, func, select  # noqa: E402
+
+from benchmarks.bench_indexes import create_indexes, seed  # noqa: E402
+from models import Expense, ExpenseRollup, db  # noqa: E402
+from reporting import rebuild_rollups  # noqa: E402
+
+E, R = Expense.__table__, ExpenseRollup.__table__
+YEAR, MONTH = extract('year', E.c.date), extract('month', E.c.date)
+
+# 统计页的三个查询：(直接聚合 expense, 读汇总表)
+QUERIES = {
+    '每月各类型金额': (
+        lambda p: select(YEAR, MONTH, E.c.type_id, func.count(), func.sum(E.c.amount))
+        .where(E.c.date.between(p['start'], p['end'])).group_by(YEAR, MONTH, E.c.type_id),
+        lambda p: select(R.c.month, R.c.type_id, func.sum(R.c.count), func.sum(R.c.amount))
+        .where(R.c.month.between(p['start'], p['end'])).group_by(R.c.month, R.c.type_id)),
+    '报销金额前 10 名': (
+        lambda p: select(E.c.submitter_id, func.count(), func.sum(E.c.amount))
+        .where(E.c.date.between(p['start'], p['end'])).group_by(E.c.submitter_id)
+        .order_by(func.sum(E.c.amount).desc()).limit(10),
+        lambda p: select(R.c.submitter_id, func.sum(R.c.count), func.sum(R.c.amount))
+        .where(R.c.month.between(p['start'], p['end'])).group_by(R.c.submitter_id)
+        .order_by(func.sum(R.c.amount).desc()).limit(10)),
+    '各状态': (
+        lambda p: select(E.c.status, func.count(), func.sum(E.c.amount))
+        .where(E.c.date.between(p['start'], p['end'])).group_by(E.c.status),
+        lambda p: select(R.c.status, func.sum(R.c.count), func.sum(R.c.amount))
+        .where(R.c.month.between(p['start'], p['end'])).group_by(R.c.status)),
+}
+
+
+def timed(conn, stmt, repeat):
+    conn.execute(stmt).fetchall()                   # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(stmt).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--types', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f'sqlite:///{os.path.join(tmpdir.name, "bench.db")}'
+    engine = create_engine(url)
+
+    t = time.perf_counter()
+    seed(engine, args.rows, args.users, args.types)
+    create_indexes(engine)
+    print(f'生成 {args.rows} 条记录：{time.perf_counter() - t:.1f} s')
+    db.metadata.create_all(engine, tables=[R])
+    t = time.perf_counter()
+    n = rebuild_rollups(engine)
+    print(f'重建汇总表：{n} 行，{time.perf_counter() - t:.1f} s')
+
+    # 种子数据分布在 2020-01 起的约 50 个月内，取其中一年
+    params = {'start': date(2021, 1, 1), 'end': date(2021, 12, 31)}
+    with engine.connect() as conn:
+        for name, (raw, rollup) in QUERIES.items():
+            ms_raw    = timed(conn, raw(params), args.repeat)
+            ms_rollup = timed(conn, rollup(params), args.repeat)
+            print(f'{name:<12} expense {ms_raw:9.2f} ms -> 汇总表 {ms_rollup:7.2f} ms '
+                  f'({ms_raw / max(ms_rollup, 1e-6):.0f}x)')
+
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+全文检索压测：生成带中文标题 / 说明 / 驳回理由的合成报销单，建立索引后
+对比 FTS（search.py）与 LIKE '%…%' 的查询耗时和命中条数。每个关键词测三种查询：
+- 汇总：命中记录的条数 + 金额合计（报销记录页带关键词时的 summarize_records）
+- 首页：命中记录按日期倒序取 50 条（报销记录页的第一页）
+- 相关度：FTS 按相关度取前 50 条（/api/search）
+
+常见词用 LIKE 按日期索引倒序扫描很快就能凑满 50 条，首页差别不大；
+汇总和少见的词（发票号、偏僻地名）LIKE 必须扫全表，差别在这里。
+
+    python -m benchmarks.bench_search --rows 1000000
+    python -m benchmarks.bench_search --url "mssql+pyodbc://..." --rows 1000000
+
+默认在临时目录建 SQLite 库；--url 指向 SQL Server 时会重建相关表，请只用于测试库
+（SQL Server 的全文索引异步填充，脚本会等到填充完成再计时）。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, create_engine, func, insert, or_, select, text  # noqa: E402
+
+from models import Expense, ExpenseType, User, db  # noqa: E402
+from search import ranked_matches, rebuild_search_index  # noqa: E402
+
+E = Expense.__table__
+
+CITIES   = ['北京', '上海', '深圳', '广州', '杭州', '成都', '武汉', '西安', '南京', '苏州']
+ITEMS    = ['出租车费', '滴滴打车', '高铁票', '机票', '酒店住宿', '客户招待餐费', '办公用品', '快递费',
+            '会议室租赁', '加班餐', '停车费', '过路费', '打印耗材', '培训报名费']
+PURPOSES = ['拜访客户', '项目验收', '参加展会', '供应商考察', '年度审计', '团队培训', '设备调试', '合同签署']
+REASONS  = ['缺少发票原件', '金额与发票不符', '超出差旅标准', '事由填写不清', '重复报销', '发票抬头错误']
+
+RARE_CITY = '乌鲁木齐'
+QUERIES = ['北京 出租车', '缺少发票', '酒店', '项目验收 深圳', '发票抬头', RARE_CITY]
+
+
+def seed(engine, rows, users=200, batch=20000):
+    db.metadata.drop_all(engine, tables=[E, ExpenseType.__table__, User.__table__])
+    db.metadata.create_all(engine, tables=[User.__table__, ExpenseType.__table__, E])
+    rnd = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'id': i, 'username': f'user{i}', 'password': 'x', 'role': 'user', 'realname': f'用户{i}'}
+            for i in range(1, users + 1)])
+        conn.execute(insert(ExpenseType.__table__), [
+            {'id': i, 'name': name} for i, name in enumerate(['交通', '住宿', '餐饮', '办公'], 1)])
+    start = date(2020, 1, 1)
+    for offset in range(0, rows, batch):
+        chunk = []
+        for _ in range(min(batch, rows - offset)):
+            rejected = rnd.random() < 0.05
+            chunk.append({
+                'date': start + timedelta(days=rnd.randrange(1500)),
+                'type_id': rnd.randint(1, 4),
+                'title': f'{RARE_CITY if rnd.random() < 0.0005 else rnd.choice(CITIES)}{rnd.choice(ITEMS)}',
+                'description': (f'{rnd.choice(PURPOSES)}，{rnd.choice(CITIES)}往返，'
+                                f'发票号 {rnd.randrange(10 ** 8):08d}') if rnd.random() < 0.7 else None,
+                'amount': Decimal(rnd.randrange(100, 500000)) / 100,
+                'status': '驳回' if rejected else '通过审批',
+                'reject_reason': rnd.choice(REASONS) if rejected else None,
+                'submitter_id': rnd.randint(1, users)})
+        with engine.begin() as conn:
+            conn.execute(insert(E), chunk)
+
+
+def like_condition(q):
+    return and_(*[or_(E.c.title.like(f'%{w}%'), E.c.description.like(f'%{w}%'),
+                      E.c.reject_reason.like(f'%{w}%')) for w in q.split()])
+
+
+def build_queries(engine, q):
+    """{名称: (LIKE 语句, FTS 语句)}，LIKE 没有对应查询时为 None。"""
+    cond = like_condition(q)
+    matches = ranked_matches(q, bind=engine)
+    in_fts = E.c.id.in_(select(matches.c.id))
+    summary = lambda where: select(func.count(), func.sum(E.c.amount)).where(where)          # noqa: E731
+    first_page = lambda where: (select(E.c.id).where(where)                                 # noqa: E731
+                                .order_by(E.c.date.desc(), E.c.id.desc()).limit(50))
+    return {
+        '汇总':   (summary(cond), summary(in_fts)),
+        '首页':   (first_page(cond), first_page(in_fts)),
+        '相关度': (None, select(matches.c.id).order_by(matches.c.score.desc()).limit(50)),
+    }
+
+
+def wait_for_mssql_population(engine, timeout=3600):
+    sql = text("SELECT FULLTEXTCATALOGPROPERTY('baoxiao_ft', 'PopulateStatus')")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with engine.connect() as conn:
+            if conn.execute(sql).scalar() == 0:         # 0 = 空闲
+                return
+        time.sleep(2)
+
+
+def timed(conn, stmt, repeat):
+    result = conn.execute(stmt).fetchall()          # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(stmt).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f'sqlite:///{os.path.join(tmpdir.name, "bench.db")}'
+    engine = create_engine(url)
+
+    t = time.perf_counter()
+    seed(engine, args.rows)
+    print(f'生成 {args.rows} 条记录：{time.perf_counter() - t:.1f} s')
+    t = time.perf_counter()
+    n = rebuild_search_index(engine)
+    if engine.dialect.name == 'mssql':
+        wait_for_mssql_population(engine)
+    print(f'建立全文索引：{n} 条，{time.perf_counter() - t:.1f} s')
+
+    # 取一个真实存在的发票号做精确查询
+    with engine.connect() as conn:
+        invoice_no = conn.execute(select(E.c.description).where(E.c.description.is_not(None))
+                                  .order_by(E.c.id).offset(args.rows // 2).limit(1)).scalar().rsplit(' ', 1)[-1]
+    with engine.connect() as conn:
+        for q in QUERIES + [invoice_no]:
+            hits = conn.execute(select(func.count()).where(like_condition(q))).scalar()
+            print(f'\n== {q}（命中 {hits} 条）')
+            for name, (like_stmt, fts_stmt) in build_queries(engine, q).items():
+                ms_fts, fts_rows = timed(conn, fts_stmt, args.repeat)
+                if like_stmt is None:
+                    print(f'   {name:<4}                      FTS {ms_fts:9.2f} ms')
+                    continue
+                ms_like, like_rows = timed(conn, like_stmt, args.repeat)
+                same = '' if name != '汇总' or like_rows == fts_rows else '  结果不一致！'
+                print(f'   {name:<4} LIKE {ms_like:9.2f} ms -> FTS {ms_fts:9.2f} ms '
+                      f'({ms_like / max(ms_fts, 1e-6):6.1f}x){same}')
+
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+soffice 转换吞吐对比：逐页冷启动（旧实现） vs 常驻 soffice 进程池批量转换。
+--soffice-python 指向的 Python 没有 uno 模块时，进程池会退回每批冷启动一次，输出里会注明。
+
+    python -m benchmarks.bench_soffice --pages 8 --rounds 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from office_pool import OfficePool  # noqa: E402
+
+TEMPLATE = os.path.join('word_templates', 'expense_a5_template.docx')
+
+
+def render_pages(tmpdir, pages):
+    from docxtpl import DocxTemplate
+    paths = []
+    for idx in range(pages):
+        details = [{'desc': f'测试报销 {idx}-{i}', 'amount': '123.45', 'description': '基准测试'}
+                   for i in range(5)]
+        tpl = DocxTemplate(TEMPLATE)
+        tpl.render({'date': '2024年01月01日', 'page_count': str(pages), 'details': details,
+                    'total': '617.25', 'amount_upper': '陆佰壹拾柒元贰角伍分', 'name': '基准'})
+        path = os.path.join(tmpdir, f'baoxiao_{idx + 1}.docx')
+        tpl.save(path)
+        paths.append(path)
+    return paths
+
+
+def run_legacy(docx_paths, outdir, soffice_bin):
+    for path in docx_paths:
+        subprocess.run([soffice_bin, '--headless', '--convert-to', 'pdf', '--outdir', outdir, path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--soffice', default=os.environ.get('SOFFICE_BIN', 'soffice'))
+    parser.add_argument('--soffice-python', default=os.environ.get('SOFFICE_PYTHON', '/usr/bin/python3'),
+                        help='带 uno 模块的 Python')
+    args = parser.parse_args()
+
+    pool = OfficePool(size=args.pool_size, soffice_bin=args.soffice, bridge_python=args.soffice_python)
+    pool.start()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        docx_paths = render_pages(tmpdir, args.pages)
+        results = {}
+        for name, fn in (('legacy', lambda: run_legacy(docx_paths, tmpdir, args.soffice)),
+                         ('pool',   lambda: pool.convert(docx_paths, tmpdir))):
+            fn()                           # 预热一轮，不计时
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                fn()
+            elapsed = time.perf_counter() - start
+            results[name] = args.pages * args.rounds / elapsed
+            print(f'{name:>6}: {elapsed / args.rounds:7.2f} s/请求  {results[name]:6.2f} pages/s')
+        print(f'加速比: {results["pool"] / results["legacy"]:.2f}x'
+              + ('（进程池为冷启动模式）' if pool.cold_start else '（常驻 soffice）'))
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
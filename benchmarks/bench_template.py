@@ -0,0 +1,77 @@
+"""
+docx 模板渲染耗时：每次从磁盘解析（旧实现） vs 模板注册表里的预解析副本；
+以及新进程里第一次渲染的耗时（未预热 / 已预热）。
+
+    python -m benchmarks.bench_template --rounds 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from docxtpl import DocxTemplate  # noqa: E402
+
+from template_registry import TemplateRegistry  # noqa: E402
+
+TEMPLATE = os.path.join('word_templates', 'expense_a5_template.docx')
+CONTEXT = {'date': '2024年01月01日', 'page_count': '1', 'total': '617.25',
+           'amount_upper': '陆佰壹拾柒元贰角伍分', 'name': '基准',
+           'details': [{'desc': f'测试报销 {i}', 'amount': '123.45', 'description': '基准测试'}
+                       for i in range(5)]}
+
+FIRST_RENDER = '''
+import time
+start = time.perf_counter()
+import pdf_export
+{preload}
+ready = time.perf_counter()
+pdf_export.render_docx({template!r}, {context!r}, '/dev/null')
+end = time.perf_counter()
+print(ready - start, end - ready)
+'''
+
+
+def per_page(render, rounds):
+    render()                            # 预热一次，不计时
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def render_from_disk():
+    tpl = DocxTemplate(TEMPLATE)
+    tpl.render(CONTEXT)
+    tpl.save(BytesIO())
+
+
+def first_render(preload):
+    code = FIRST_RENDER.format(preload='pdf_export.templates.preload()' if preload else '',
+                               template=TEMPLATE, context=CONTEXT)
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout.split()
+    return float(out[0]) * 1000, float(out[1]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+    os.chdir(ROOT)
+
+    registry = TemplateRegistry()
+    print(f'每页渲染  磁盘解析: {per_page(render_from_disk, args.rounds):7.2f} ms')
+    print(f'每页渲染  注册表:   {per_page(lambda: registry.render(TEMPLATE, CONTEXT, BytesIO()), args.rounds):7.2f} ms')
+    for preload in (False, True):
+        startup, render = first_render(preload)
+        label = '已预热' if preload else '未预热'
+        print(f'首次渲染  {label}:  启动 {startup:7.2f} ms  渲染 {render:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+负载测试：在同一份数据集上对比两种部署配置的吞吐量和延迟。
+
+- old：原来的启动命令 gunicorn -b ... app:app（1 个 sync worker、30 s 超时），
+  连接池通过 DB_* 环境变量还原为 SQLAlchemy 默认值（pool_size 5、不 ping、不回收、不开 fast_executemany）
+- new：gunicorn -c gunicorn.conf.py（gthread，进程 / 线程数按 CPU 核数）和 app.py 里调过的连接池
+
+    python -m benchmarks.seed     --workdir /data/bench --users 1000 --expenses 1000000
+    python -m benchmarks.loadtest --workdir /data/bench --clients 32 --duration 60 --output load.json
+    python -m benchmarks.loadtest --workdir /data/bench --profile new --slow-clients 0
+
+每个配置单独启动一次 gunicorn。--clients 个并发客户端（各自登录不同的普通用户和财务账号）
+在 --duration 秒内按 MIX 的权重不停发读请求（列表页、筛选、排序、搜索、统计报表）；
+另有 --slow-clients 个客户端循环导出全部记录（CSV），模拟长请求占住 worker 的情形。
+报告快请求的吞吐量（req/s）、延迟分位数和错误数，以及导出完成 / 失败的次数。
+前 --warmup 秒的请求不计入结果。
+
+SQLite 数据集上连接池参数不生效（app.py 对 SQLite 保持默认），只比较 gunicorn 配置；
+要连同连接池一起比较，用 benchmarks.seed --url 在测试用 SQL Server 库上生成数据。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, select  # noqa: E402
+
+from benchmarks.suite import GUNICORN_CONF, HttpDriver, git_revision, summarize  # noqa: E402
+from models import User  # noqa: E402
+
+PROFILES = {
+    'old': {'gunicorn_args': [],
+            'env': {'DB_POOL_SIZE': '5', 'DB_MAX_OVERFLOW': '10', 'DB_POOL_TIMEOUT': '30',
+                    'DB_POOL_RECYCLE': '-1', 'DB_POOL_PRE_PING': '0', 'DB_FAST_EXECUTEMANY': '0'}},
+    'new': {'gunicorn_args': ['-c', GUNICORN_CONF], 'env': {}},
+}
+
+# (账号, 权重, 路径)
+MIX = [
+    ('user',    25, '/records'),
+    ('user',    10, '/records?sort=amount_desc'),
+    ('finance', 15, '/all_records'),
+    ('finance', 10, '/all_records?status=%E5%BE%85%E5%AE%A1%E6%89%B9'),                    # 待审批
+    ('finance', 10, '/all_records?sort=amount_desc'),
+    ('finance', 10, '/all_records?q=%E5%8C%97%E4%BA%AC+%E5%87%BA%E7%A7%9F%E8%BD%A6'),     # 北京 出租车
+    ('finance', 10, '/api/search?q=%E9%85%92%E5%BA%97&limit=50'),                        # 酒店
+    ('finance', 10, '/dashboard'),
+]
+SLOW_PATH = '/all_records/export.csv'
+
+
+def accounts(url, clients):
+    """每个客户端用不同的普通用户，财务账号轮流使用。"""
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        users = conn.execute(select(User.username).where(User.role == 'user')
+                             .order_by(User.id).limit(clients)).scalars().all()
+        finance = conn.execute(select(User.username).where(User.role == 'finance')
+                               .order_by(User.id)).scalars().all()
+    engine.dispose()
+    return [(users[i % len(users)], finance[i % len(finance)]) for i in range(clients)]
+
+
+def run_profile(name, workdir, url, args):
+    profile = PROFILES[name]
+    driver = HttpDriver(None, workdir, url, profile['gunicorn_args'], profile['env'], pdf_worker=False)
+    fast, slow = [], []                               # (开始时间, 路径, 状态, 毫秒)
+    lock = threading.Lock()
+    stop = threading.Event()
+    try:
+        sessions = [(driver.login(u), driver.login(f))
+                    for u, f in accounts(url, args.clients + args.slow_clients)]
+        start = time.monotonic()
+        measure_from = start + args.warmup
+        end = measure_from + args.duration
+
+        def client(index, user, finance):
+            rnd = random.Random(index)
+            population = [(user if role == 'user' else finance, path) for role, _, path in MIX]
+            weights = [w for _, w, _ in MIX]
+            while not stop.is_set() and time.monotonic() < end:
+                opener, path = rnd.choices(population, weights)[0]
+                t = time.monotonic()
+                try:
+                    status = driver.send(opener, {'method': 'GET', 'path': path})[0]
+                except OSError as exc:               # 连接被重置 / 超时
+                    status = f'exception: {type(exc).__name__}'
+                with lock:
+                    fast.append((t, path, status, (time.monotonic() - t) * 1000))
+
+        def slow_client(finance):
+            while not stop.is_set() and time.monotonic() < end:
+                t = time.monotonic()
+                try:
+                    status = driver.send(finance, {'method': 'GET', 'path': SLOW_PATH})[0]
+                except OSError as exc:
+                    status = f'exception: {type(exc).__name__}'
+                if time.monotonic() <= end:          # 测试结束时被打断的不算
+                    with lock:
+                        slow.append((t, SLOW_PATH, status, (time.monotonic() - t) * 1000))
+
+        threads = [threading.Thread(target=client, args=(i, *sessions[i]), daemon=True)
+                   for i in range(args.clients)]
+        threads += [threading.Thread(target=slow_client, args=(sessions[args.clients + i][1],), daemon=True)
+                    for i in range(args.slow_clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads[:args.clients]:
+            thread.join()
+        stop.set()
+    finally:
+        driver.close()                               # 仍在进行的导出随服务一起结束
+    return {'fast': report(fast, measure_from, args.duration), 'slow': report(slow, measure_from, args.duration)}
+
+
+def report(samples, measure_from, duration):
+    samples = [s for s in samples if s[0] >= measure_from]
+    statuses, latencies, errors = {}, [], 0
+    for _, _, status, ms in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append(ms)
+        else:
+            errors += 1
+    result = summarize(latencies, statuses, [], errors)
+    result['rps'] = round(len(latencies) / duration, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', required=True, help='benchmarks.seed 生成的数据集目录')
+    parser.add_argument('--url', help='数据库连接串（数据集不是 SQLite 时必填）')
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                        help='要测的配置，可重复，默认 old 和 new 都测')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--slow-clients', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=30, help='每个配置的计时秒数')
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--output', help='结果 JSON 路径')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir).resolve()
+    dataset_file = workdir / 'dataset.json'
+    if not dataset_file.exists():
+        parser.error(f'{workdir} 下没有 dataset.json，先运行 python -m benchmarks.seed --workdir {workdir}')
+    dataset = json.loads(dataset_file.read_text(encoding='utf-8'))
+    url = args.url or dataset.get('url')
+    if not url:
+        parser.error('需要 --url')
+
+    results = {'meta': {
+        'created': datetime.now().isoformat(timespec='seconds'), 'git': git_revision(),
+        'cpus': os.cpu_count(), 'dataset': dataset, 'clients': args.clients,
+        'slow_clients': args.slow_clients, 'duration': args.duration, 'warmup': args.warmup,
+    }, 'profiles': {}}
+    for name in args.profile or ['old', 'new']:
+        print(f'== {name}：{args.clients} 个客户端 + {args.slow_clients} 个导出，{args.duration:.0f} s')
+        result = results['profiles'][name] = run_profile(name, workdir, url, args)
+        fast, slow = result['fast'], result['slow']
+        if 'p50_ms' in fast:
+            print(f'   快请求 {fast["rps"]:8.1f} req/s  p50 {fast["p50_ms"]:8.1f}  p95 {fast["p95_ms"]:8.1f}  '
+                  f'p99 {fast["p99_ms"]:8.1f} ms  错误 {fast["errors"]}')
+        else:
+            print(f'   快请求 没有成功的请求，错误 {fast["errors"]}')
+        print(f'   导出   完成 {slow["n"]} 次' + (f'，p50 {slow["p50_ms"] / 1000:.1f} s' if slow['n'] else '')
+              + f'，失败 {slow["errors"]}')
+
+    profiles = results['profiles']
+    if 'old' in profiles and 'new' in profiles and profiles['old']['fast']['rps']:
+        old, new = profiles['old']['fast'], profiles['new']['fast']
+        print(f'\nnew / old：吞吐量 {new["rps"] / old["rps"]:.2f}x' +
+              (f'，p95 延迟 {new["p95_ms"] / old["p95_ms"]:.2f}x' if 'p95_ms' in old and 'p95_ms' in new else ''))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+压测数据生成：按 models.py 的表结构生成可复现（固定随机种子）的用户、报销类型、报销单和发票文件。
+
+    python -m benchmarks.seed --workdir /data/bench --users 1000 --expenses 1000000
+    python -m benchmarks.seed --workdir /data/bench --url "mssql+pyodbc://..." --expenses 1000000
+
+workdir 是应用运行时的工作目录（app.py 的 instance/、static/invoices/ 都相对于当前目录）：
+- 发票文件按 invoice_store 的分片布局写入 workdir/static/invoices，并登记 invoice_blob 引用数
+- 默认数据库为 workdir/bench.db（SQLite）；--url 指向其他库时会清空并重建全部表，请只用于测试库
+- 生成参数写入 workdir/dataset.json，benchmarks.suite 读取它来连接数据库并记录在结果里
+- word_templates 以符号链接放进 workdir，PDF 生成可以直接在 workdir 下运行
+
+账号：财务 finance1..N、老板 boss、普通用户 user1..N，密码都是 bench。
+报销单的月度汇总表和全文索引在最后一并重建。
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+from sqlalchemy import bindparam, create_engine, insert, update  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from invoice_store import shard_path  # noqa: E402
+from models import Expense, ExpenseType, InvoiceBlob, User, db  # noqa: E402
+from reporting import rebuild_rollups  # noqa: E402
+from search import rebuild_search_index  # noqa: E402
+
+PASSWORD = 'bench'
+STATUS_PENDING, STATUS_APPROVED, STATUS_REJECTED = '待审批', '通过审批', '驳回'
+
+TYPE_NAMES = ['交通', '住宿', '餐饮', '办公用品', '差旅补助', '通讯', '招待', '培训', '快递',
+              '会议', '维修', '其他']
+SURNAMES   = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗'
+GIVEN      = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华'
+CITIES     = ['北京', '上海', '深圳', '广州', '杭州', '成都', '武汉', '西安', '南京', '苏州']
+ITEMS      = ['出租车费', '滴滴打车', '高铁票', '机票', '酒店住宿', '客户招待餐费', '办公用品', '快递费',
+              '会议室租赁', '加班餐', '停车费', '过路费', '打印耗材', '培训报名费']
+PURPOSES   = ['拜访客户', '项目验收', '参加展会', '供应商考察', '年度审计', '团队培训', '设备调试', '合同签署']
+REASONS    = ['缺少发票原件', '金额与发票不符', '超出差旅标准', '事由填写不清', '重复报销', '发票抬头错误']
+START_DATE = date(2021, 1, 1)
+DAYS       = 1500
+
+
+# ------------------- 发票文件 -------------------
+def invoice_png(rnd, width=874, height=1240):
+    """A5 @150DPI 的"扫描件"：浅色底、表格线、文字块和扫描噪点，PNG 约一两百 KB。"""
+    img = Image.new('L', (width, height), 245)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([40, 40, width - 40, height - 40], outline=60, width=3)
+    y = 120
+    while y < height - 120:
+        draw.line([60, y, width - 60, y], fill=150, width=1)
+        x = 80
+        while x < width - 120:
+            w = rnd.randint(20, 160)
+            draw.rectangle([x, y + 12, x + w, y + 30], fill=rnd.randint(30, 90))
+            x += w + rnd.randint(15, 40)
+        y += rnd.randint(45, 70)
+    noise = Image.effect_noise((width, height), rnd.randint(8, 16))
+    img = Image.blend(img, noise, 0.12).convert('RGB')
+    buf = BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def invoice_pdf(rnd, n):
+    buf = BytesIO()
+    can = canvas.Canvas(buf, pagesize=(420, 595))
+    can.setFont('Helvetica', 12)
+    can.drawString(40, 540, f'INVOICE No. {rnd.randrange(10 ** 8):08d}')
+    for i in range(rnd.randint(3, 8)):
+        can.drawString(40, 500 - i * 24, f'Item {i + 1}  {rnd.randrange(100, 100000) / 100:.2f}')
+    can.drawString(40, 120, f'Total  {rnd.randrange(1000, 500000) / 100:.2f}   #{n}')
+    can.save()
+    return buf.getvalue()
+
+
+def write_invoices(root, count, rnd):
+    """生成 count 个发票文件（约 3/4 为图片、1/4 为 PDF），返回 [(sha256, 相对路径, 大小)]。"""
+    blobs = []
+    for n in range(count):
+        data, ext = (invoice_pdf(rnd, n), '.pdf') if n % 4 == 3 else (invoice_png(rnd), '.png')
+        digest = hashlib.sha256(data).hexdigest()
+        relpath = shard_path(digest, ext)
+        path = Path(root) / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        blobs.append((digest, relpath, len(data)))
+    return blobs
+
+
+# ------------------- 数据库 -------------------
+def _realname(rnd):
+    return rnd.choice(SURNAMES) + ''.join(rnd.choice(GIVEN) for _ in range(rnd.randint(1, 2)))
+
+
+def seed(engine, invoice_root, users=1000, expenses=1_000_000, finance=5, invoices=200,
+         pending_ratio=0.01, rejected_ratio=0.05, batch=20000, seed=42, log=print):
+    """清空并生成全部数据，返回写入 dataset.json 的参数与统计。"""
+    rnd = random.Random(seed)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+
+    t = time.perf_counter()
+    blobs = write_invoices(invoice_root, invoices, rnd)
+    log(f'发票文件 {len(blobs)} 个，{sum(b[2] for b in blobs) / 1e6:.1f} MB，{time.perf_counter() - t:.1f} s')
+
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    staff = ([{'username': f'finance{i}', 'role': 'finance'} for i in range(1, finance + 1)]
+             + [{'username': 'boss', 'role': 'boss'}]
+             + [{'username': f'user{i}', 'role': 'user'} for i in range(1, users + 1)])
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [dict(u, id=i, password=password, realname=_realname(rnd))
+                                              for i, u in enumerate(staff, 1)])
+        conn.execute(insert(ExpenseType.__table__), [{'id': i, 'name': name}
+                                                     for i, name in enumerate(TYPE_NAMES, 1)])
+        # 引用数在报销单写完后回填
+        conn.execute(insert(InvoiceBlob.__table__), [
+            {'sha256': digest, 'path': relpath, 'size': size, 'ref_count': 0, 'normalized': True}
+            for digest, relpath, size in blobs])
+    finance_ids = list(range(1, finance + 1))
+    user_ids = list(range(finance + 2, len(staff) + 1))
+
+    t = time.perf_counter()
+    refs = [0] * len(blobs)
+    weights = [1 - pending_ratio - rejected_ratio, pending_ratio, rejected_ratio]
+    for offset in range(0, expenses, batch):
+        chunk = []
+        for _ in range(min(batch, expenses - offset)):
+            status = rnd.choices([STATUS_APPROVED, STATUS_PENDING, STATUS_REJECTED], weights)[0]
+            blob = rnd.randrange(len(blobs))
+            refs[blob] += 1
+            chunk.append({
+                'date': START_DATE + timedelta(days=rnd.randrange(DAYS)),
+                'type_id': rnd.randint(1, len(TYPE_NAMES)),
+                'title': f'{rnd.choice(CITIES)}{rnd.choice(ITEMS)}',
+                'amount': Decimal(rnd.randrange(100, 500000)) / 100,
+                'invoice': blobs[blob][1],
+                'invoice_name': f'发票{blob + 1}{os.path.splitext(blobs[blob][1])[1]}',
+                'invoice_sha256': blobs[blob][0],
+                'description': (f'{rnd.choice(PURPOSES)}，{rnd.choice(CITIES)}往返'
+                                if rnd.random() < 0.7 else None),
+                'status': status,
+                'submitter_id': rnd.choice(user_ids),
+                'approver_id': rnd.choice(finance_ids) if status != STATUS_PENDING else None,
+                'reject_reason': rnd.choice(REASONS) if status == STATUS_REJECTED else None,
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(Expense.__table__), chunk)
+        if (offset // batch) % 10 == 9:
+            log(f'  报销单 {offset + len(chunk)} / {expenses}')
+    blob_table = InvoiceBlob.__table__
+    with engine.begin() as conn:
+        conn.execute(update(blob_table).where(blob_table.c.sha256 == bindparam('digest'))
+                     .values(ref_count=bindparam('refs')),
+                     [{'digest': digest, 'refs': refs[i]} for i, (digest, _, _) in enumerate(blobs)])
+    log(f'报销单 {expenses} 条，{time.perf_counter() - t:.1f} s')
+
+    t = time.perf_counter()
+    rollups = rebuild_rollups(engine)
+    indexed = rebuild_search_index(engine)
+    log(f'月度汇总 {rollups} 行，全文索引 {indexed} 条，{time.perf_counter() - t:.1f} s')
+    return {'users': users, 'finance': finance, 'expenses': expenses, 'invoices': len(blobs),
+            'pending_ratio': pending_ratio, 'rejected_ratio': rejected_ratio, 'seed': seed,
+            'types': len(TYPE_NAMES)}
+
+
+def prepare_workdir(workdir):
+    """建立 workdir，并把运行时用到的仓库目录（docx 模板）链接进去。"""
+    workdir = Path(workdir).resolve()
+    (workdir / 'static' / 'invoices').mkdir(parents=True, exist_ok=True)
+    (workdir / 'instance').mkdir(exist_ok=True)
+    link = workdir / 'word_templates'
+    if not link.exists():
+        link.symlink_to(Path(ROOT) / 'word_templates', target_is_directory=True)
+    return workdir
+
+
+def default_url(workdir):
+    return f'sqlite:///{Path(workdir).resolve() / "bench.db"}'
+
+
+def seed_workdir(workdir, url=None, **params):
+    workdir = prepare_workdir(workdir)
+    url = url or default_url(workdir)
+    engine = create_engine(url)
+    dataset = seed(engine, workdir / 'static' / 'invoices', **params)
+    engine.dispose()
+    # 只记录数据库类型，不把连接串（可能含密码）写进文件
+    dataset.update(url=url if url.startswith('sqlite') else None, dialect=engine.dialect.name,
+                   created=datetime.now().isoformat(timespec='seconds'))
+    (workdir / 'dataset.json').write_text(json.dumps(dataset, ensure_ascii=False, indent=2), encoding='utf-8')
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--url', help='数据库连接串，默认 workdir/bench.db')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--finance', type=int, default=5)
+    parser.add_argument('--expenses', type=int, default=1_000_000)
+    parser.add_argument('--invoices', type=int, default=200, help='不同发票文件的个数（报销单随机引用）')
+    parser.add_argument('--pending-ratio', type=float, default=0.01)
+    parser.add_argument('--rejected-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    dataset = seed_workdir(args.workdir, args.url, users=args.users, finance=args.finance,
+                           expenses=args.expenses, invoices=args.invoices,
+                           pending_ratio=args.pending_ratio, rejected_ratio=args.rejected_ratio,
+                           seed=args.seed)
+    print(f'完成，共 {time.perf_counter() - t:.1f} s：{json.dumps(dataset, ensure_ascii=False)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+报销单状态流转并发压测：多个进程同时审批 / 驳回 / 编辑 / 删除同一批报销单，
+结束后检查乐观锁是否守住了不变量。
+
+    python -m benchmarks.stress_transitions --clients 8 --expenses 200
+    python -m benchmarks.stress_transitions --url "mssql+pyodbc://..."   # SQL Server 测试库
+
+每个客户端是一个独立进程，用 Flask test client 走真实的路由：
+- 审批人：读出待审批记录（id, version, title），带 version 调 /approve/batch
+- 提交人：带 version 调 /edit/<id> 改标题
+- 删除人：带 version 调 /expense_delete/<id>
+
+检查：
+1. 每条报销单至多被成功审批 / 驳回一次
+2. 审批通过的记录，最终标题就是审批人当时看到的标题（审批后没有编辑落地），
+   且 version 恰好是审批时的版本 + 1（驳回的记录允许提交人继续修改）
+3. 删除成功的记录确实不存在；没有任何请求返回 5xx
+4. 月度汇总表（reporting.py）与 expense 表的实时聚合一致
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_app(url):
+    # app.py 在导入时读取数据库配置
+    os.environ['USE_SQLSERVER'] = '1'
+    os.environ['SQLALCHEMY_DATABASE_URI'] = url
+    import app as appmod
+    appmod.app.config['TESTING'] = True
+    appmod.app.config['INVOICE_NORMALIZE'] = False
+    return appmod
+
+
+def seed(url, n_expenses, n_approvers):
+    appmod = _import_app(url)
+    from datetime import date
+    from decimal import Decimal
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Expense, ExpenseType
+    from reporting import rebuild_rollups
+    from search import rebuild_search_index
+    with appmod.app.app_context():
+        db.drop_all()
+        db.create_all()
+        pw = generate_password_hash('pw', method='pbkdf2:sha256:1000')
+        db.session.add(User(username='submitter', realname='提交人', password=pw, role='user'))
+        for i in range(n_approvers + 1):
+            db.session.add(User(username=f'finance{i}', realname=f'财务{i}', password=pw, role='finance'))
+        db.session.add(ExpenseType(name='交通'))
+        db.session.commit()
+        submitter = User.query.filter_by(username='submitter').one()
+        db.session.add_all([Expense(date=date(2024, 1, 1), type_id=1, title=f'报销 {i}',
+                                    amount=Decimal('10.00'), submitter_id=submitter.id,
+                                    status=appmod.STATUS_PENDING)
+                            for i in range(n_expenses)])
+        db.session.commit()
+        rebuild_rollups(db.engine)
+        rebuild_search_index(db.engine)
+
+
+def client_main(args):
+    role, index, url, n_expenses, seconds = args
+    appmod = _import_app(url)
+    from models import Expense
+    rnd = random.Random(index)
+    app = appmod.app
+    client = app.test_client()
+    username = 'submitter' if role == 'editor' else f'finance{index}'
+    client.post('/login', data={'username': username, 'password': 'pw'})
+
+    log = {'decided': [], 'edited': [], 'deleted': [], 'conflicts': 0, 'errors': 0, 'requests': 0}
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        ids = rnd.sample(range(1, n_expenses + 1), k=min(5, n_expenses))
+        with app.app_context():
+            seen = {e.id: (e.version, e.title, e.status) for e in
+                    Expense.query.filter(Expense.id.in_(ids))}
+        if not seen:
+            continue
+        log['requests'] += 1
+        if role == 'approver':
+            pending = {i: v for i, v in seen.items() if v[2] == appmod.STATUS_PENDING}
+            if not pending:
+                continue
+            action = rnd.choice(['approve', 'reject'])
+            r = client.post('/approve/batch', json={
+                'ids': list(pending), 'action': action, 'reject_reason': '压测',
+                'versions': {str(i): v[0] for i, v in pending.items()}})
+            if r.status_code >= 500:
+                log['errors'] += 1
+                continue
+            for item in r.get_json()['results']:
+                if item['result'] in ('approved', 'rejected'):
+                    version, title, _ = pending[item['id']]
+                    log['decided'].append((item['id'], item['result'], version, title))
+                elif item['result'] == 'conflict':
+                    log['conflicts'] += 1
+        elif role == 'editor':
+            i = rnd.choice(list(seen))
+            version, title, _ = seen[i]
+            new_title = f'{title.split("#")[0]}#{index}-{rnd.randrange(10 ** 6)}'
+            r = client.post(f'/edit/{i}', data={'version': version, 'date': '2024-01-02', 'type': '1',
+                                                'title': new_title, 'amount': '11.00', 'description': ''})
+            if r.status_code >= 500:
+                log['errors'] += 1
+                continue
+            with client.session_transaction() as sess:
+                messages = [m for _, m in sess.pop('_flashes', [])]
+            if '修改成功' in messages:
+                log['edited'].append((i, new_title))
+            elif appmod.CONFLICT_MESSAGE in messages:
+                log['conflicts'] += 1
+        else:                                               # deleter，偶尔删一条
+            time.sleep(0.05)
+            i = rnd.choice(list(seen))
+            r = client.post(f'/expense_delete/{i}', data={'version': seen[i][0]})
+            if r.status_code >= 500:
+                log['errors'] += 1
+                continue
+            with client.session_transaction() as sess:
+                messages = [m for _, m in sess.pop('_flashes', [])]
+            if '报销单已删除' in messages:
+                log['deleted'].append(i)
+            elif appmod.CONFLICT_MESSAGE in messages:
+                log['conflicts'] += 1
+    return role, log
+
+
+def check(url, logs):
+    appmod = _import_app(url)
+    from models import db, Expense
+    from reporting import check_rollups
+    decided = defaultdict(list)
+    deleted = set()
+    for _, log in logs:
+        for expense_id, result, version, title in log['decided']:
+            decided[expense_id].append((result, version, title))
+        deleted.update(log['deleted'])
+
+    problems = []
+    with appmod.app.app_context():
+        rows = {e.id: e for e in Expense.query.all()}
+        for expense_id, decisions in decided.items():
+            if len(decisions) > 1:
+                problems.append(f'#{expense_id} 被审批了 {len(decisions)} 次：{decisions}')
+                continue
+            e = rows.get(expense_id)
+            if e is None:
+                continue                                    # 审批后被财务删除，允许
+            result, version, title = decisions[0]
+            expected = appmod.STATUS_APPROVED if result == 'approved' else appmod.STATUS_REJECTED
+            if e.status != expected:
+                problems.append(f'#{expense_id} 状态 {e.status}，应为 {expected}')
+            # 驳回的记录允许提交人修改后重新提交，只检查审批通过的
+            if result == 'approved' and (e.title != title or e.version != version + 1):
+                problems.append(f'#{expense_id} 审批通过后仍被修改：{title!r}@{version} -> {e.title!r}@{e.version}')
+            if result == 'rejected' and e.version <= version:
+                problems.append(f'#{expense_id} 驳回后版本号未增加')
+        for expense_id in deleted:
+            if expense_id in rows:
+                problems.append(f'#{expense_id} 删除成功但仍存在')
+        for key, stored, live in check_rollups(db.engine):
+            problems.append(f'月度汇总 {key}：汇总表 {stored}，实际 {live}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8, help='审批人进程数（另有 1 个提交人、1 个删除人）')
+    parser.add_argument('--expenses', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        # 多进程写同一个 SQLite 文件：拉长锁等待，模拟 SQL Server 的行锁排队
+        url = f'sqlite:///{os.path.join(tmpdir.name, "stress.db")}?timeout=30'
+    seed(url, args.expenses, args.clients)
+
+    jobs = ([('approver', i, url, args.expenses, args.seconds) for i in range(args.clients)]
+            + [('editor', args.clients, url, args.expenses, args.seconds),
+               ('deleter', args.clients, url, args.expenses, args.seconds)])
+    start = time.perf_counter()
+    with get_context('spawn').Pool(len(jobs)) as pool:
+        logs = pool.map(client_main, jobs)
+    elapsed = time.perf_counter() - start
+
+    totals = Counter()
+    for _, log in logs:
+        totals['requests']  += log['requests']
+        totals['decided']   += len(log['decided'])
+        totals['edited']    += len(log['edited'])
+        totals['deleted']   += len(log['deleted'])
+        totals['conflicts'] += log['conflicts']
+        totals['errors']    += log['errors']
+    print(f'{len(jobs)} 个客户端，{elapsed:.1f} s：' +
+          '，'.join(f'{k} {v}' for k, v in totals.items()))
+
+    problems = check(url, logs)
+    if totals['errors']:
+        problems.append(f'{totals["errors"]} 个请求返回 5xx')
+    for p in problems:
+        print('  ✗', p)
+    print('不变量检查：' + ('失败' if problems else '通过'))
+    if tmpdir:
+        tmpdir.cleanup()
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
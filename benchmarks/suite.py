@@ -0,0 +1,502 @@
+"""
+压测套件：在 benchmarks.seed 生成的数据集上驱动应用的真实路由，记录各场景的延迟分布，
+结果写成 JSON，并可与之前保存的基线对比。
+
+    python -m benchmarks.seed  --workdir /data/bench --users 1000 --expenses 1000000
+    python -m benchmarks.suite --workdir /data/bench --output results.json
+    python -m benchmarks.suite --workdir /data/bench --baseline baseline.json    # 有回归时退出码为 1
+    python -m benchmarks.suite --workdir /data/bench --server gunicorn --workers 4
+    python -m benchmarks.suite --quick --output quick.json                        # 临时目录里的小数据集
+
+驱动方式：
+- testclient（默认）：进程内 Flask test client，不经过网络和 WSGI 服务器；
+  SQL 条数取自响应头 X-SQL-Statements（TESTING 模式）
+- gunicorn：用 gunicorn.conf.py 在 workdir 启动本地 gunicorn 和 PDF 任务进程后走 HTTP；
+  给出 --base-url 时改为连接已在运行的服务（PDF 场景需要对方也在运行 pdf_jobs.py）
+
+场景（SCENARIOS）：本人记录 /records、全部记录 /all_records 的每种筛选和排序、
+审批列表 / 单条审批 / 批量审批、带 1 / 5 / 10 个发票文件的 /submit、
+5 / 20 / 50 条报销单的 /generate_pdf（计到 PDF 生成完成；testclient 模式找不到 soffice 时只计入队）。
+审批、提交、生成 PDF 会改变数据；严格对比两次结果时，每次运行前用相同参数重新生成数据集。
+
+对比基线：某场景 p50 比基线慢 --tolerance（默认 20%）且多出 --min-delta-ms（默认 5 ms），
+或每请求 SQL 条数增加、出现基线没有的错误，记为回归。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime
+from http.cookiejar import CookieJar
+from io import BytesIO
+from pathlib import Path
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, select  # noqa: E402
+
+from benchmarks.seed import PASSWORD, default_url, invoice_png, seed_workdir  # noqa: E402
+from models import Expense, User  # noqa: E402
+
+GUNICORN_CONF = os.path.join(ROOT, 'gunicorn.conf.py')
+QUICK_DATASET = {'users': 100, 'expenses': 20000, 'invoices': 20, 'pending_ratio': 0.1}
+
+
+# --------------------------------------------------
+#                    场景
+# --------------------------------------------------
+class Scenario:
+    """
+    name:     结果中的键，保持稳定以便与基线对比
+    role:     用哪个账号发请求（'user' / 'finance'）
+    make:     make(ctx) -> 请求描述 dict（method / path / form / files / json），返回 None 表示数据用完
+    expect:   正常的状态码
+    weight:   迭代次数的倍数（慢场景少跑几次）
+    """
+
+    def __init__(self, name, role, make, expect=200, weight=1.0, pdf=False):
+        self.name, self.role, self.make = name, role, make
+        self.expect, self.weight, self.pdf = expect, weight, pdf
+
+
+def _get(path, **params):
+    return lambda ctx: {'method': 'GET', 'path': path + ('?' + urlencode(params) if params else '')}
+
+
+def _approve_one(ctx):
+    if not ctx['pending']:
+        return None
+    expense_id, version = ctx['pending'].pop()
+    return {'method': 'POST', 'path': '/approve',
+            'form': {'expense_id': expense_id, 'action': 'approve', 'version': version}}
+
+
+def _approve_batch(size):
+    def make(ctx):
+        if len(ctx['pending']) < size:
+            return None
+        batch = [ctx['pending'].pop() for _ in range(size)]
+        return {'method': 'POST', 'path': '/approve/batch',
+                'json': {'ids': [i for i, _ in batch], 'action': 'approve',
+                         'versions': {str(i): v for i, v in batch}}}
+    return make
+
+
+def _submit(entries):
+    def make(ctx):
+        rnd = ctx['rnd']
+        form, files = {}, {}
+        for i in range(1, entries + 1):
+            form.update({f'date_{i}': date(2024, rnd.randint(1, 12), rnd.randint(1, 28)).isoformat(),
+                         f'type_{i}': rnd.choice(ctx['type_ids']),
+                         f'title_{i}': f'压测提交 {uuid.uuid4().hex[:8]}',
+                         f'amount_{i}': f'{rnd.randrange(100, 500000) / 100:.2f}',
+                         f'description_{i}': '压测'})
+            # 每次上传内容都不同，走完整的落盘 + 登记流程而不是去重命中
+            files[f'invoice_{i}'] = (f'发票{i}.png', ctx['invoice'] + uuid.uuid4().bytes, 'image/png')
+        return {'method': 'POST', 'path': '/submit', 'form': form, 'files': files}
+    return make
+
+
+def _generate_pdf(size):
+    def make(ctx):
+        ids = ctx['approved'][:size]
+        if len(ids) < size:
+            return None
+        return {'method': 'POST', 'path': '/generate_pdf', 'form': {'selected_ids': ','.join(map(str, ids))}}
+    return make
+
+
+SCENARIOS = [
+    Scenario('records',                     'user',    _get('/records')),
+    Scenario('records sort=amount_desc',    'user',    _get('/records', sort='amount_desc')),
+    Scenario('records status=驳回',          'user',    _get('/records', status='驳回')),
+    Scenario('all_records',                 'finance', _get('/all_records')),
+    Scenario('all_records 日期区间',         'finance', _get('/all_records', start_date='2022-01-01',
+                                                            end_date='2022-03-31')),
+    Scenario('all_records status=待审批',    'finance', _get('/all_records', status='待审批')),
+    Scenario('all_records type',            'finance', lambda ctx: _get('/all_records', type=ctx['type_ids'][2])(ctx)),
+    Scenario('all_records username',        'finance', lambda ctx: _get('/all_records', username=ctx['user'])(ctx)),
+    Scenario('all_records q=北京 出租车',     'finance', _get('/all_records', q='北京 出租车')),
+    Scenario('all_records sort=date_asc',   'finance', _get('/all_records', sort='date_asc')),
+    Scenario('all_records sort=date_desc',  'finance', _get('/all_records', sort='date_desc')),
+    Scenario('all_records sort=amount_asc', 'finance', _get('/all_records', sort='amount_asc')),
+    Scenario('all_records sort=amount_desc', 'finance', _get('/all_records', sort='amount_desc')),
+    Scenario('approve 列表',                 'finance', _get('/approve'), weight=0.5),
+    Scenario('approve 单条',                 'finance', _approve_one, expect=302),
+    Scenario('approve/batch 50',            'finance', _approve_batch(50), weight=0.5),
+    Scenario('submit 1 张发票',              'user',    _submit(1), expect=302),
+    Scenario('submit 5 张发票',              'user',    _submit(5), expect=302, weight=0.5),
+    Scenario('submit 10 张发票',             'user',    _submit(10), expect=302, weight=0.5),
+    Scenario('generate_pdf 5 条',            'user',    _generate_pdf(5), expect=202, weight=0.2, pdf=True),
+    Scenario('generate_pdf 20 条',           'user',    _generate_pdf(20), expect=202, weight=0.2, pdf=True),
+    Scenario('generate_pdf 50 条',           'user',    _generate_pdf(50), expect=202, weight=0.2, pdf=True),
+]
+
+
+def load_context(url, seed=42):
+    """场景需要的 id：压测账号、待审批（id, version）、本人已通过的报销单、报销类型。"""
+    engine = create_engine(url)
+    e = Expense.__table__
+    with engine.connect() as conn:
+        finance = conn.execute(select(User.username).where(User.role == 'finance')
+                               .order_by(User.id).limit(1)).scalar()
+        # 已通过的报销单最多的用户：PDF 场景需要至少 50 条
+        user_id, username = conn.execute(
+            select(User.id, User.username).where(User.role == 'user').order_by(User.id).limit(1)).one()
+        approved = conn.execute(select(e.c.id).where(e.c.submitter_id == user_id, e.c.status == '通过审批')
+                                .order_by(e.c.id).limit(50)).scalars().all()
+        pending = conn.execute(select(e.c.id, e.c.version).where(e.c.status == '待审批')
+                               .order_by(e.c.id.desc()).limit(5000)).all()
+        type_ids = conn.execute(select(e.c.type_id).distinct().order_by(e.c.type_id)).scalars().all()
+    engine.dispose()
+    rnd = random.Random(seed)
+    return {'finance': finance, 'user': username, 'approved': approved,
+            'pending': [tuple(row) for row in reversed(pending)], 'type_ids': type_ids,
+            'invoice': invoice_png(rnd), 'rnd': rnd}
+
+
+# --------------------------------------------------
+#                    驱动
+# --------------------------------------------------
+class TestClientDriver:
+    """进程内 Flask test client。"""
+    mode = 'testclient'
+
+    def __init__(self, workdir, url):
+        os.chdir(workdir)
+        os.environ['USE_SQLSERVER'] = '1'               # app.py 据此从环境变量读连接串
+        os.environ['SQLALCHEMY_DATABASE_URI'] = url
+        os.environ.setdefault('INVOICE_NORMALIZE', '0')
+        import app as appmod
+        appmod.app.config['TESTING'] = True
+        self.appmod = appmod
+        self.app = appmod.app
+        self.soffice = shutil.which(self.app.config['SOFFICE_BIN'])
+
+    def login(self, username):
+        client = self.app.test_client()
+        resp = client.post('/login', data={'username': username, 'password': PASSWORD})
+        if resp.status_code != 302:
+            raise RuntimeError(f'{username} 登录失败')
+        return client
+
+    def send(self, client, req):
+        """发出请求并读完响应体，返回 (状态码, SQL 条数或 None, JSON 或 None)。"""
+        data = dict(req.get('form') or {})
+        for field, (filename, content, _) in (req.get('files') or {}).items():
+            data[field] = (BytesIO(content), filename)
+        resp = client.open(req['path'], method=req['method'], data=data or None, json=req.get('json'),
+                           content_type='multipart/form-data' if req.get('files') else None)
+        resp.get_data()
+        sql = resp.headers.get('X-SQL-Statements')
+        return resp.status_code, int(sql) if sql else None, resp.get_json(silent=True)
+
+    def finish_pdf(self, client, job):
+        """找得到 soffice 时在本进程里执行任务，否则把任务标记为失败（避免触发每人并发任务上限）。"""
+        import pdf_jobs
+        from models import PdfJob, db
+        with self.app.app_context():
+            if self.soffice:
+                claimed = pdf_jobs.claim_next_job()
+                if claimed:
+                    pdf_jobs.run_job(claimed)
+                return PdfJob.query.get(job['job_id']).status == 'done'
+            PdfJob.query.filter_by(id=job['job_id']).update({'status': 'failed', 'error': 'benchmark'})
+            db.session.commit()
+            return None
+
+    def close(self):
+        pass
+
+
+class _NoRedirect(urlrequest.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """
+    HTTP 客户端。不给 base_url 时在 workdir 启动本地 gunicorn（命令行参数 gunicorn_args，
+    环境变量额外加上 env），pdf_worker 为真时再启动 PDF 任务进程。
+    """
+    mode = 'http'
+
+    def __init__(self, base_url=None, workdir=None, url=None, gunicorn_args=(), env=None,
+                 pdf_worker=True, pdf_timeout=300):
+        self.procs = []
+        self.pdf_timeout = pdf_timeout
+        self.soffice = True
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+            return
+        port = _free_port()
+        self.base_url = f'http://127.0.0.1:{port}'
+        env = dict(os.environ, USE_SQLSERVER='1', SQLALCHEMY_DATABASE_URI=url,
+                   PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''), **(env or {}))
+        env.setdefault('INVOICE_NORMALIZE', '0')
+        self.procs.append(subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--chdir', str(workdir), *gunicorn_args,
+             '-b', f'127.0.0.1:{port}', 'app:app'], env=env))
+        if pdf_worker:
+            self.procs.append(subprocess.Popen([sys.executable, os.path.join(ROOT, 'pdf_jobs.py')],
+                                               cwd=workdir, env=env))
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                urlrequest.urlopen(self.base_url + '/login', timeout=2).read()
+                return
+            except OSError:
+                time.sleep(0.5)
+        self.close()
+        raise RuntimeError('gunicorn 启动超时')
+
+    def login(self, username):
+        opener = urlrequest.build_opener(urlrequest.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+        status, _, _ = self.send(opener, {'method': 'POST', 'path': '/login',
+                                          'form': {'username': username, 'password': PASSWORD}})
+        if status != 302:
+            raise RuntimeError(f'{username} 登录失败')
+        return opener
+
+    def send(self, opener, req):
+        headers, body = {}, None
+        if req.get('files'):
+            body, content_type = _multipart(req.get('form') or {}, req['files'])
+            headers['Content-Type'] = content_type
+        elif req.get('json') is not None:
+            body = json.dumps(req['json']).encode()
+            headers['Content-Type'] = 'application/json'
+        elif req.get('form'):
+            body = urlencode(req['form']).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        r = urlrequest.Request(self.base_url + req['path'], data=body, headers=headers, method=req['method'])
+        try:
+            with opener.open(r, timeout=600) as resp:
+                status, data, ctype = resp.status, resp.read(), resp.headers.get('Content-Type', '')
+        except HTTPError as exc:                         # 4xx / 5xx 以及未跟随的重定向
+            status, data, ctype = exc.code, exc.read(), exc.headers.get('Content-Type', '')
+        payload = json.loads(data) if ctype.startswith('application/json') and data else None
+        return status, None, payload
+
+    def finish_pdf(self, opener, job):
+        """轮询任务状态直到完成或失败。"""
+        deadline = time.time() + self.pdf_timeout
+        while time.time() < deadline:
+            _, _, state = self.send(opener, {'method': 'GET', 'path': job['status_url']})
+            if state and state.get('status') in ('done', 'failed'):
+                return state['status'] == 'done'
+            time.sleep(0.1)
+        return False
+
+    def close(self):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            proc.wait(timeout=30)
+        self.procs = []
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _multipart(form, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# --------------------------------------------------
+#                  运行 / 统计
+# --------------------------------------------------
+def percentile(sorted_values, p):
+    """最近秩法。"""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, statuses, sql, errors, note=None):
+    values = sorted(latencies)
+    result = {'n': len(values), 'errors': errors,
+              'status': {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))}}
+    if values:
+        result.update({
+            'min_ms':  round(values[0], 3),
+            'mean_ms': round(sum(values) / len(values), 3),
+            'p50_ms':  round(percentile(values, 50), 3),
+            'p90_ms':  round(percentile(values, 90), 3),
+            'p95_ms':  round(percentile(values, 95), 3),
+            'p99_ms':  round(percentile(values, 99), 3),
+            'max_ms':  round(values[-1], 3),
+        })
+    if sql:
+        result['sql_statements'] = sorted(sql)[len(sql) // 2]
+    if note:
+        result['note'] = note
+    return result
+
+
+def run_scenario(driver, clients, scenario, ctx, iterations, warmup):
+    client = clients[scenario.role]
+    latencies, statuses, sql, errors, note = [], {}, [], 0, None
+    total = max(1, int(round(iterations * scenario.weight)))
+    for i in range(warmup + total):
+        req = scenario.make(ctx)
+        if req is None:
+            note = '数据用完，提前结束'
+            break
+        start = time.perf_counter()
+        try:
+            status, statements, payload = driver.send(client, req)
+        except Exception as exc:                     # 记为错误，继续后面的场景
+            status, statements, payload = f'exception: {type(exc).__name__}', None, None
+        done = None
+        if scenario.pdf and status == scenario.expect and payload:
+            done = driver.finish_pdf(client, payload)
+            if done is None:
+                note = '未找到 soffice，只计入队耗时'
+            elif not done:
+                status = 'pdf failed'
+        elapsed = (time.perf_counter() - start) * 1000
+        if i < warmup:
+            continue
+        statuses[status] = statuses.get(status, 0) + 1
+        if status != scenario.expect:
+            errors += 1
+            continue
+        latencies.append(elapsed)
+        if statements is not None:
+            sql.append(statements)
+    return summarize(latencies, statuses, sql, errors, note)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """打印与基线的对比，返回回归的场景名列表。"""
+    regressions = []
+    print(f'\n与基线对比（{baseline["meta"].get("git")} @ {baseline["meta"].get("created")}）：')
+    if baseline['meta'].get('dataset') != results['meta'].get('dataset'):
+        print('  注意：数据集参数与基线不同，对比结果仅供参考')
+    for name, now in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if not base or 'p50_ms' not in base or 'p50_ms' not in now:
+            print(f'  {name:<32} 无可比数据')
+            continue
+        change = now['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        reasons = []
+        if change > tolerance and now['p50_ms'] - base['p50_ms'] > min_delta_ms:
+            reasons.append(f'p50 +{change:.0%}')
+        if now.get('sql_statements', 0) > base.get('sql_statements', now.get('sql_statements', 0)):
+            reasons.append(f'SQL {base["sql_statements"]} -> {now["sql_statements"]}')
+        if now['errors'] > base['errors']:
+            reasons.append(f'错误 {base["errors"]} -> {now["errors"]}')
+        flag = '  回归：' + '，'.join(reasons) if reasons else ''
+        print(f'  {name:<32} {base["p50_ms"]:9.2f} -> {now["p50_ms"]:9.2f} ms ({change:+7.1%}){flag}')
+        if reasons:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', help='benchmarks.seed 生成的数据集目录')
+    parser.add_argument('--url', help='数据库连接串（数据集不是 SQLite 时必填）')
+    parser.add_argument('--quick', action='store_true', help='在临时目录生成小数据集后运行')
+    parser.add_argument('--server', choices=['testclient', 'gunicorn'], default='testclient')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker 数')
+    parser.add_argument('--base-url', help='连接已在运行的服务，如 http://127.0.0.1:5000')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', action='append', default=[], help='只运行名称包含该子串的场景，可重复')
+    parser.add_argument('--output', help='结果 JSON 路径')
+    parser.add_argument('--baseline', help='之前保存的结果 JSON，对比后有回归时退出码为 1')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.quick:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.workdir = tmpdir.name
+        seed_workdir(args.workdir, **QUICK_DATASET)
+    if not args.workdir and not args.base_url:
+        parser.error('需要 --workdir、--quick 或 --base-url')
+    workdir = Path(args.workdir).resolve() if args.workdir else None
+    dataset = (json.loads((workdir / 'dataset.json').read_text(encoding='utf-8'))
+               if workdir and (workdir / 'dataset.json').exists() else None)
+    if workdir and not dataset and not args.url:
+        parser.error(f'{workdir} 下没有 dataset.json，先运行 python -m benchmarks.seed --workdir {workdir}')
+    url = args.url or (dataset or {}).get('url') or (default_url(workdir) if workdir else None)
+    if not url:
+        parser.error('需要 --url')
+
+    ctx = load_context(url)
+    if args.base_url or args.server == 'gunicorn':
+        driver = HttpDriver(args.base_url, workdir, url, ['-c', GUNICORN_CONF, '-w', str(args.workers)])
+    else:
+        driver = TestClientDriver(workdir, url)
+    scenarios = [s for s in SCENARIOS if not args.only or any(o in s.name for o in args.only)]
+    results = {'meta': {
+        'created': datetime.now().isoformat(timespec='seconds'), 'git': git_revision(),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'mode': driver.mode if args.base_url or args.server != 'gunicorn' else f'gunicorn -w {args.workers}',
+        'dataset': dataset, 'iterations': args.iterations, 'warmup': args.warmup,
+    }, 'scenarios': {}}
+    try:
+        clients = {'user': driver.login(ctx['user']), 'finance': driver.login(ctx['finance'])}
+        for scenario in scenarios:
+            result = run_scenario(driver, clients, scenario, ctx, args.iterations, args.warmup)
+            results['scenarios'][scenario.name] = result
+            sql = f'  SQL {result["sql_statements"]:>3}' if 'sql_statements' in result else ''
+            timing = (f'p50 {result["p50_ms"]:9.2f}  p95 {result["p95_ms"]:9.2f} ms'
+                      if 'p50_ms' in result else '无成功请求'.ljust(32))
+            print(f'{scenario.name:<32} {timing}  n={result["n"]:<3} 错误 {result["errors"]}{sql}'
+                  + (f'  （{result["note"]}）' if result.get('note') else ''))
+    finally:
+        driver.close()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    status = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f'\n{len(regressions)} 个场景回归' if regressions else '\n没有回归')
+        status = 1 if regressions else 0
+    if tmpdir:
+        tmpdir.cleanup()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+gunicorn 生产配置：gunicorn -c gunicorn.conf.py app:app
+
+用 gthread（每个 worker 进程一个线程池）而不是 gevent：数据库访问走 pyodbc、发票处理走 PIL，
+都是 gevent 无法打补丁的阻塞 C 调用，协程会在这些调用上整体卡住；线程在等数据库、读写文件时会释放 GIL。
+- 进程数默认等于 CPU 核数：模板渲染、XLSX 写入等纯 Python 计算受 GIL 限制，靠多进程利用多核
+- 每个进程 GUNICORN_THREADS 个线程（默认 8），一个慢请求（导出、大批量上传）只占一个线程；
+  app.py 的数据库连接池大小默认与线程数一致
+- timeout 在 gthread 下只用于判断 worker 是否卡死（心跳由主循环发送，与请求耗时无关），
+  单个请求的时限由应用按路由控制，见 request_timeouts.py
+- 定期重启 worker（max_requests）回收 PDF / XLSX 处理后碎片化的内存
+
+所有项都可以用环境变量覆盖，见下方各项。
+"""
+import os
+import shutil
+
+bind         = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers      = int(os.environ.get('GUNICORN_WORKERS', max(2, os.cpu_count() or 1)))
+threads      = int(os.environ.get('GUNICORN_THREADS', 8))
+
+timeout          = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive        = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+max_requests        = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# 心跳文件放在内存文件系统，避免磁盘繁忙时 worker 被误判为超时
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# 不 preload：app 导入时会创建进程池 / 线程等对象，应在各 worker 里各自创建
+preload_app = False
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog  = '-'
+loglevel  = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    """启动时清掉上次运行留下的指标快照（见 metrics.py），计数从零开始。"""
+    metrics_dir = os.environ.get('METRICS_DIR', os.path.join('instance', 'metrics'))
+    if os.path.isdir(metrics_dir):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -0,0 +1,234 @@
+"""
+上传发票图片的规范化：按 EXIF 方向摆正、缩到打印所需的最大分辨率、去掉元数据、重新压缩。
+
+上传请求里发票先原样入库（见 invoice_store.py），提交后把文件交给进程池处理，
+处理完在回调线程里用新文件替换原文件的全部引用：
+- 新文件照常按内容哈希存储，invoice_blob.source_sha256 记录它由哪个原文件生成，
+  之后再上传同一原文件时直接复用结果，不再重复处理
+- 原文件引用归零后回收；配置了冷存储目录时先复制一份过去
+- PDF / GIF 以及处理后没有变小、也不需要旋转缩放的图片保持原样，只标记为已处理
+
+    python invoice_ingest.py report    # 统计现有发票规范化后能省多少空间（不改动任何文件）
+    python invoice_ingest.py apply     # 处理现有发票中尚未规范化的部分
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+
+from PIL import ExifTags, Image, ImageOps
+from sqlalchemy import or_, select, update
+
+from invoice_store import CHUNK_SIZE, shard_path
+from models import db, Expense, InvoiceBlob
+
+NORMALIZE_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+
+# ------------------- 单个文件处理（在子进程中执行） -------------------
+def normalize_image(src, out_dir, max_side=2480, quality=85):
+    """
+    规范化一张发票图片，结果写入 out_dir 下的临时文件。
+    返回 (临时文件路径, sha256, 扩展名, 新大小, 原大小)；不需要处理时返回 None。
+    """
+    orig_size = os.path.getsize(src)
+    with Image.open(src) as img:
+        fmt = img.format
+        if fmt not in NORMALIZE_FORMATS or getattr(img, 'is_animated', False):
+            return None
+        orig_dims = img.size
+        orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+        if fmt == 'JPEG':
+            img.draft('RGB', (max_side, max_side))     # 大照片解码时直接按 2 的幂缩小
+        rotated = ImageOps.exif_transpose(img)
+        rotated.thumbnail((max_side, max_side), Image.LANCZOS)
+        reshaped = orientation != 1 or rotated.size not in (orig_dims, orig_dims[::-1])
+
+        # 不带 exif / icc_profile / info 参数保存，即去掉全部元数据
+        tmp = os.path.join(out_dir, f'ingest_{uuid.uuid4().hex}')
+        if fmt == 'JPEG':
+            rotated.convert('RGB').save(tmp, 'JPEG', quality=quality, optimize=True, progressive=True)
+        elif fmt == 'WEBP':
+            rotated.save(tmp, 'WEBP', quality=quality, method=6)
+        else:
+            if rotated.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                rotated = rotated.convert('RGBA')
+            rotated.save(tmp, 'PNG', optimize=True)
+
+    size = os.path.getsize(tmp)
+    if size >= orig_size and not reshaped:
+        os.remove(tmp)
+        return None
+    sha = hashlib.sha256()
+    with open(tmp, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return tmp, sha.hexdigest(), NORMALIZE_FORMATS[fmt], size, orig_size
+
+
+# ------------------- 替换引用（在 app context 中执行） -------------------
+def apply_normalized(store, old_digest, result, cold_root=None):
+    """
+    把引用 old_digest 的报销单全部改指向规范化后的文件，并在一个事务内调整两边的引用数。
+    返回被回收文件的相对路径列表。
+    """
+    blob, expense = InvoiceBlob.__table__, Expense.__table__
+    if result is None:
+        db.session.execute(update(blob).where(blob.c.sha256 == old_digest).values(normalized=True))
+        db.session.commit()
+        return []
+
+    tmp, digest, ext, size, _ = result
+    try:
+        relpath = store.acquire(digest, shard_path(digest, ext), size, refs=0)
+        moved = db.session.execute(update(expense).where(expense.c.invoice_sha256 == old_digest)
+                                   .values(invoice=relpath, invoice_sha256=digest)).rowcount
+        if not moved or digest == old_digest:       # 处理期间报销单已删除 / 结果与原文件相同
+            db.session.rollback()
+            Path(tmp).unlink(missing_ok=True)
+            return []
+        db.session.execute(update(blob).where(blob.c.sha256 == digest)
+                           .values(ref_count=blob.c.ref_count + moved, normalized=True,
+                                   source_sha256=old_digest))
+        db.session.execute(update(blob).where(blob.c.sha256 == old_digest)
+                           .values(ref_count=blob.c.ref_count - moved))
+        target = store.abspath(relpath)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, target)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+    old_path = db.session.execute(select(blob.c.path).where(blob.c.sha256 == old_digest)).scalar()
+    if cold_root and old_path and store.abspath(old_path).exists():
+        cold = Path(cold_root) / old_path
+        if not cold.exists():
+            cold.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(store.abspath(old_path), cold)
+    return store.collect(old_digest)
+
+
+class InvoiceIngest:
+    """把新上传的发票交给进程池规范化，结果在回调线程里落库。"""
+
+    def __init__(self, app, store, max_workers=2, max_side=2480, quality=85,
+                 cold_root=None, on_removed=None):
+        self.app         = app
+        self.store       = store
+        self.max_workers = max_workers
+        self.max_side    = max_side
+        self.quality     = quality
+        self.cold_root   = cold_root
+        self.on_removed  = on_removed or (lambda relpath: None)
+        self._executor   = None
+        self._lock       = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:                        # gthread worker 的多个线程可能同时首次提交
+            if self._executor is None:
+                # 与 PDF 渲染进程池一样用 spawn，避免 fork 时继承 soffice worker 线程的管道
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def pending(self, digests=None):
+        """[(sha256, 相对路径)]：尚未规范化的文件；digests 为 None 时返回全部。"""
+        blob = InvoiceBlob.__table__
+        query = select(blob.c.sha256, blob.c.path).where(
+            or_(blob.c.normalized.is_(None), blob.c.normalized == False),   # noqa: E712
+            blob.c.ref_count > 0)
+        if digests is not None:
+            query = query.where(blob.c.sha256.in_(list(digests)))
+        return db.session.execute(query).all()
+
+    def submit(self, digests):
+        """提交后调用；返回 Future 列表（请求里不需要等待）。"""
+        digests = set(filter(None, digests))
+        if not digests:
+            return []
+        self.store.tmp_dir.mkdir(parents=True, exist_ok=True)
+        futures = []
+        for digest, relpath in self.pending(digests):
+            fut = self.executor.submit(normalize_image, str(self.store.abspath(relpath)),
+                                       str(self.store.tmp_dir), self.max_side, self.quality)
+            fut.add_done_callback(partial(self._done, digest))
+            futures.append(fut)
+        return futures
+
+    def _done(self, digest, fut):
+        with self.app.app_context():
+            try:
+                removed = apply_normalized(self.store, digest, fut.result(), self.cold_root)
+            except Exception:
+                self.app.logger.exception('发票规范化失败：%s', digest)
+                return
+            for relpath in removed:
+                self.on_removed(relpath)
+
+
+# --------------------------------------------------
+#              命令行：节省空间统计 / 批量处理
+# --------------------------------------------------
+def _fmt(n):
+    return f'{n / 1024 / 1024:8.2f} MB'
+
+
+def report(root, max_side, quality, workers):
+    """对 root 下全部发票试跑规范化（结果写到临时目录后删除），打印节省的空间。"""
+    files = sorted(p for p in Path(root).rglob('*')
+                   if p.is_file() and '.tmp' not in p.parts)
+    before = after = 0
+    with tempfile.TemporaryDirectory() as tmpdir, ProcessPoolExecutor(workers) as pool:
+        futs = {pool.submit(normalize_image, str(p), tmpdir, max_side, quality): p for p in files}
+        for fut in as_completed(futs):
+            path = futs[fut]
+            orig = path.stat().st_size
+            try:
+                result = fut.result()
+            except Exception as exc:
+                print(f'  跳过 {path.relative_to(root)}：{exc}')
+                result = None
+            new = result[3] if result else orig
+            if result:
+                os.remove(result[0])
+            before += orig
+            after  += new
+            print(f'  {str(path.relative_to(root)):<72} {_fmt(orig)} -> {_fmt(new)}')
+    saved = before - after
+    print(f'共 {len(files)} 个文件：{_fmt(before)} -> {_fmt(after)}，'
+          f'节省 {_fmt(saved)}（{saved / before:.0%}）' if before else '没有发票文件')
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='发票图片规范化')
+    parser.add_argument('command', choices=['report', 'apply'])
+    args = parser.parse_args(argv)
+
+    from app import app, invoice_ingest, invoice_store
+    cfg = app.config
+    if args.command == 'report':
+        report(invoice_store.root, cfg['INVOICE_MAX_PRINT_PX'], cfg['INVOICE_JPEG_QUALITY'],
+               cfg['INVOICE_INGEST_WORKERS'])
+        return
+    with app.app_context():
+        pending = invoice_ingest.pending()
+        print(f'待处理 {len(pending)} 个文件')
+        futures = invoice_ingest.submit(digest for digest, _ in pending)
+        for fut in as_completed(futures):
+            fut.result()
+    invoice_ingest.executor.shutdown(wait=True)     # 等回调全部落库
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+发票文件按内容寻址存储。
+
+上传文件在写入磁盘的同时计算 SHA-256，存为 static/invoices/ab/cd/<sha256><扩展名>，
+同样内容的发票只保存一份。扩展名按文件头魔数判断，不信任上传时的文件名。
+invoice_blob 表记录每个文件被多少条报销单引用：
+
+- 报销单提交 / 更换发票时 acquire，引用数 +1
+- 报销单删除 / 更换发票时 release，引用数 -1
+- 提交事务后对 release 过的文件调用 collect，引用数归零的文件连同记录一起删除
+- 提交失败回滚后对本次保存的文件调用 discard，删除没有被任何记录引用的文件
+
+表单解析时文件内容由 UploadSpool 直接写入临时目录（见 app.UploadRequest），
+同时计算哈希、检查大小上限和文件类型，保存时只需把临时文件移动到最终位置。
+临时目录不能放在 static 下（未通过检查、写到一半的文件会被直接访问到），
+默认是 instance/invoice_tmp；它必须和存储目录在同一个文件系统上，移动才是原子的 rename。
+
+旧版本按 "原文件名_uuid.扩展名" 平铺保存的文件由 dedupe_invoices 一次性迁入
+（已加入 migrations.MIGRATIONS，可重复执行）。
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import bindparam, exists, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from models import db, Expense, InvoiceBlob
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_ROOT = os.path.join('static', 'invoices')
+DEFAULT_TMP_DIR = os.path.join('instance', 'invoice_tmp')
+
+# 允许的发票类型：文件头魔数 -> 存储扩展名
+MAGIC_NUMBERS = (
+    (b'%PDF-',             '.pdf'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff',      '.jpg'),
+    (b'GIF87a',            '.gif'),
+    (b'GIF89a',            '.gif'),
+)
+SNIFF_BYTES = 12
+
+
+def sniff(head):
+    """按文件头判断类型，返回扩展名；不是允许的类型返回 None。"""
+    for magic, ext in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def shard_path(digest, ext=''):
+    """哈希 -> 存储相对路径（两级目录分片，避免单目录文件过多）。"""
+    return f'{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+
+class UploadSpool:
+    """
+    上传文件的落盘缓冲，供 werkzeug 表单解析写入（Request._get_file_stream）。
+
+    边写边计算哈希；超过 max_bytes 抛 413，文件头不是允许的类型抛 415，
+    出错或未被保存（close 时仍未 place）都会删除临时文件。
+    """
+
+    def __init__(self, store, max_bytes=None):
+        store.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.path      = store.tmp_dir / uuid.uuid4().hex
+        self.max_bytes = max_bytes
+        self.size      = 0
+        self.ext       = None
+        self.placed    = False
+        self._head = b''
+        self._sha  = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(f'单个发票文件不能超过 {self.max_bytes // (1024 * 1024)} MB')
+        if self.ext is None and len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_type()
+        self._sha.update(data)
+        return self._file.write(data)
+
+    def _check_type(self):
+        self.ext = sniff(self._head)
+        if self.ext is None:
+            self.close()
+            raise UnsupportedMediaType('发票只支持 PDF、JPG、PNG、GIF、WebP 文件')
+
+    def finish(self):
+        """写入结束，返回 sha256；文件不足 SNIFF_BYTES 字节时在这里补做类型检查。"""
+        if self.ext is None:
+            self._check_type()
+        self._file.flush()
+        return self._sha.hexdigest()
+
+    # werkzeug 写完后会 seek(0)，FileStorage 也可能再读取
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+        if not self.placed:
+            self.path.unlink(missing_ok=True)
+
+
+class InvoiceStore:
+    def __init__(self, root=DEFAULT_ROOT, tmp_dir=DEFAULT_TMP_DIR):
+        self.root = Path(root)
+        self.tmp_dir = Path(tmp_dir)
+
+    def abspath(self, relpath):
+        return self.root / relpath
+
+    # ---------- 写入 ----------
+    def spool(self, max_bytes=None):
+        return UploadSpool(self, max_bytes)
+
+    def write(self, stream, max_bytes=None):
+        """把任意文件流复制进一个新的 UploadSpool（上传没有经过 UploadRequest 时使用）。"""
+        spool = self.spool(max_bytes)
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        return spool
+
+    def place(self, spool, relpath):
+        """临时文件原子地放到最终位置；内容相同，已存在时直接覆盖。"""
+        target = self.abspath(relpath)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        spool.placed = True                     # 关闭时不再删除临时文件
+        spool.close()
+        try:
+            os.replace(spool.path, target)
+        except OSError:
+            spool.path.unlink(missing_ok=True)
+            raise
+
+    # ---------- 引用计数 ----------
+    def acquire(self, digest, relpath, size, refs=1):
+        """
+        在当前会话中给文件记录加 refs 个引用（记录不存在则创建），返回实际存储路径。
+        同一内容以不同扩展名上传时沿用第一次保存的路径。
+        """
+        blob = InvoiceBlob.__table__
+        bump = update(blob).where(blob.c.sha256 == digest).values(ref_count=blob.c.ref_count + refs)
+        if not db.session.execute(bump).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(blob).values(
+                        sha256=digest, path=relpath, size=size, ref_count=refs))
+                return relpath
+            except IntegrityError:                  # 并发上传了同一文件
+                db.session.execute(bump)
+        return db.session.execute(select(blob.c.path).where(blob.c.sha256 == digest)).scalar_one()
+
+    def save(self, file_storage, max_bytes=None):
+        """
+        保存上传的 FileStorage 并计入引用，返回 (相对路径, sha256)。
+        传入 None 或空文件名则返回 (None, None)。
+        """
+        return self.save_many([file_storage], max_bytes)[0]
+
+    def save_many(self, file_storages, max_bytes=None):
+        """
+        批量版 save，返回与输入一一对应的 (相对路径, sha256) 列表。
+        不论多少个文件，都只查一次已有记录、插入一次新记录、更新一次引用数。
+        """
+        results = [(None, None)] * len(file_storages)
+        spools = {}
+        try:
+            for idx, fs in enumerate(file_storages):
+                if fs and fs.filename:
+                    spool = fs.stream
+                    spools[idx] = spool if isinstance(spool, UploadSpool) else self.write(spool, max_bytes)
+            if not spools:
+                return results
+            digests = {idx: spool.finish() for idx, spool in spools.items()}
+
+            blob = InvoiceBlob.__table__
+            rows = db.session.execute(
+                select(blob.c.sha256, blob.c.path, blob.c.size, blob.c.source_sha256)
+                .where(or_(blob.c.sha256.in_(set(digests.values())),
+                           blob.c.source_sha256.in_(set(digests.values()))))).all()
+            known   = {row.sha256: row.path for row in rows}
+            # 同一原文件之前已规范化过（见 invoice_ingest.py）：直接引用处理后的文件
+            derived = {row.source_sha256: row for row in rows if row.source_sha256}
+
+            new, refs, to_place = {}, Counter(), {}
+            for idx, digest in digests.items():
+                if digest in derived:
+                    row = derived[digest]
+                    results[idx] = (row.path, row.sha256)
+                    refs[row.sha256] += 1
+                    continue
+                if digest not in known and digest not in new:
+                    new[digest] = (shard_path(digest, spools[idx].ext), spools[idx].size)
+                relpath = known.get(digest) or new[digest][0]
+                results[idx] = (relpath, digest)
+                refs[digest] += 1
+                to_place.setdefault(digest, (spools[idx], relpath))
+
+            if new:
+                new_refs = {digest: refs.pop(digest) for digest in new}
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(blob), [
+                            {'sha256': digest, 'path': relpath, 'size': size, 'ref_count': new_refs[digest]}
+                            for digest, (relpath, size) in new.items()])
+                except IntegrityError:              # 并发上传了同一文件：逐个按已有记录处理
+                    for digest, (relpath, size) in new.items():
+                        actual = self.acquire(digest, relpath, size, new_refs[digest])
+                        if actual != relpath:
+                            to_place[digest] = (to_place[digest][0], actual)
+                            results = [(actual, d) if d == digest else (p, d) for p, d in results]
+            if refs:
+                db.session.execute(
+                    update(blob).where(blob.c.sha256 == bindparam('b_sha256'))
+                    .values(ref_count=blob.c.ref_count + bindparam('b_refs')),
+                    [{'b_sha256': digest, 'b_refs': n} for digest, n in refs.items()])
+            # 先记引用再落盘：与 _remove_file 的 "先移走文件、再确认无引用" 配合，不会误删
+            for spool, relpath in to_place.values():
+                self.place(spool, relpath)
+        finally:
+            for spool in spools.values():
+                spool.close()
+        return results
+
+    def release(self, digest):
+        """在当前会话中给文件记录 -1 引用，返回 digest，提交后交给 collect。"""
+        if not digest:
+            return None
+        blob = InvoiceBlob.__table__
+        db.session.execute(update(blob).where(blob.c.sha256 == digest)
+                                       .values(ref_count=blob.c.ref_count - 1))
+        return digest
+
+    def _remove_file(self, relpath, still_used):
+        """
+        先把文件移到一边，再调用 still_used() 确认是否仍被引用：
+        仍被引用（期间有新上传重新引用了它）就放回去，否则删除。返回是否删除。
+        """
+        target = self.abspath(relpath)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        trash = self.tmp_dir / f'gc_{uuid.uuid4().hex}'
+        try:
+            os.replace(target, trash)
+        except FileNotFoundError:
+            still_used()
+            return False
+        if still_used():
+            os.replace(trash, target)
+            return False
+        trash.unlink(missing_ok=True)
+        return True
+
+    def collect(self, *digests):
+        """
+        删除引用数已归零的文件，返回被删除文件的相对路径列表；
+        须在 release 所在事务提交之后调用。
+        """
+        blob = InvoiceBlob.__table__
+        removed = []
+        for digest in filter(None, digests):
+            relpath = db.session.execute(
+                select(blob.c.path).where(blob.c.sha256 == digest, blob.c.ref_count <= 0)
+            ).scalar()
+            if relpath is None:
+                continue
+
+            def still_used():
+                deleted = db.session.execute(
+                    blob.delete().where(blob.c.sha256 == digest, blob.c.ref_count <= 0)).rowcount
+                db.session.commit()
+                return not deleted
+
+            if self._remove_file(relpath, still_used):
+                removed.append(relpath)
+        return removed
+
+    def discard(self, saved):
+        """
+        提交失败并 rollback 之后，删除本次 save 写入、但没有任何记录引用的文件。
+        saved 为 save 返回的 (相对路径, sha256) 列表；已存在的同内容文件不受影响。
+        """
+        blob = InvoiceBlob.__table__
+        removed = []
+        for relpath, digest in set(saved):
+            if not relpath:
+                continue
+
+            def still_used():
+                return db.session.execute(select(exists().where(blob.c.sha256 == digest))).scalar()
+
+            if self._remove_file(relpath, still_used):
+                removed.append(relpath)
+        return removed
+
+
+# --------------------------------------------------
+#              旧平铺目录去重迁移
+# --------------------------------------------------
+def _hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _strip_uid(filename):
+    """'张三_1a2b3c4d.png' -> '张三.png'（secure_filename_cn 附加的 8 位 uuid）。"""
+    name, ext = os.path.splitext(filename)
+    head, sep, uid = name.rpartition('_')
+    if sep and len(uid) == 8 and all(c in '0123456789abcdef' for c in uid):
+        name = head
+    return name + ext
+
+
+def dedupe_invoices(engine, root=DEFAULT_ROOT):
+    """
+    把 root 下平铺保存的旧发票迁入内容寻址存储，并改写报销单引用。
+
+    1. 逐个文件计算哈希，链接 / 复制到分片路径（同一内容只保留一份）
+    2. 一个事务内改写 expense.invoice / invoice_sha256，按实际引用重算 ref_count
+    3. 事务提交后再删除平铺的旧文件，以及没有被任何报销单引用的文件和记录；中途失败可直接重跑
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    # 旧版本把上传临时文件放在 root/.tmp（可经 /static 访问），临时目录已移出，清掉遗留的
+    shutil.rmtree(root / '.tmp', ignore_errors=True)
+    # 有扩展名的排前面，同一内容优先用它决定存储扩展名
+    flat = sorted((p for p in root.iterdir() if p.is_file() and not p.name.startswith('.')),
+                  key=lambda p: (not p.suffix, p.name))
+    if not flat:
+        return []
+
+    store = InvoiceStore(root)
+    mapping, sizes = {}, {}
+    for path in flat:
+        digest = _hash_file(path)
+        mapping[path.name] = digest
+        sizes.setdefault(digest, (path, path.stat().st_size))
+
+    blob, expense = InvoiceBlob.__table__, Expense.__table__
+    with engine.connect() as conn:
+        known = dict(conn.execute(select(blob.c.sha256, blob.c.path)
+                                  .where(blob.c.sha256.in_(list(sizes)))).all())
+
+    # 已有记录的沿用记录里的路径，其余按首个文件的扩展名分片存放
+    paths = {digest: known.get(digest) or shard_path(digest, path.suffix)
+             for digest, (path, _) in sizes.items()}
+    store.tmp_dir.mkdir(parents=True, exist_ok=True)
+    for digest, (path, _) in sizes.items():
+        target = store.abspath(paths[digest])
+        if target.exists():
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = store.tmp_dir / uuid.uuid4().hex
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+    with engine.begin() as conn:
+        new_rows = [{'sha256': digest, 'path': paths[digest], 'size': size, 'ref_count': 0}
+                    for digest, (_, size) in sizes.items() if digest not in known]
+        if new_rows:
+            conn.execute(insert(blob), new_rows)
+
+        for name, digest in mapping.items():
+            conn.execute(update(expense).where(expense.c.invoice == name)
+                         .values(invoice=paths[digest], invoice_sha256=digest,
+                                 invoice_name=_strip_uid(name)))
+        refs = (select(func.count(expense.c.id))
+                .where(expense.c.invoice_sha256 == blob.c.sha256)
+                .scalar_subquery())
+        conn.execute(update(blob).where(blob.c.sha256.in_(list(sizes))).values(ref_count=refs))
+        orphans = conn.execute(select(blob.c.sha256, blob.c.path)
+                               .where(blob.c.sha256.in_(list(sizes)), blob.c.ref_count <= 0)).all()
+
+    for path in flat:
+        path.unlink(missing_ok=True)
+    # 与 collect 相同的删除顺序，只是不经过 db.session（迁移时直接用 engine）
+    removed = 0
+    for digest, relpath in orphans:
+        def still_used(digest=digest):
+            with engine.begin() as conn:
+                return not conn.execute(blob.delete().where(blob.c.sha256 == digest,
+                                                            blob.c.ref_count <= 0)).rowcount
+
+        removed += store._remove_file(relpath, still_used)
+    return [f'{len(flat)} 个文件去重为 {len(sizes)} 个（删除 {removed} 个未被任何报销单引用的文件）']
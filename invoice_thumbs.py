@@ -0,0 +1,101 @@
+"""
+发票缩略图 / 网页预览图。
+
+原图多为手机照片和扫描件（几百 KB 到几 MB），列表页、预览页只需要小图：
+- thumb：列表内嵌缩略图（长边 240px）
+- preview：预览页大图（长边 1600px）
+
+首次请求时生成并缓存到磁盘，之后直接返回缓存文件；PDF 发票取第一页生成。
+发票按内容哈希存储（见 invoice_store.py），同一路径的内容不会变，
+所以衍生图以 "尺寸/原文件相对路径" 为键，永不需要失效。
+"""
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from pdf2image import convert_from_path
+from PIL import Image, ImageOps, features
+
+VARIANTS = {
+    'thumb':   (240, 70),       # (长边像素, 压缩质量)
+    'preview': (1600, 80),
+}
+
+# Pillow 没编译 WebP 支持时退回 JPEG
+FORMAT, EXT, MIMETYPE = (('WEBP', '.webp', 'image/webp') if features.check('webp')
+                         else ('JPEG', '.jpg', 'image/jpeg'))
+
+
+# 同一张图并发请求时只生成一次；按键哈希分到固定数量的锁上，不随图片数量增长
+LOCK_STRIPES = 64
+
+
+class DerivativeError(RuntimeError):
+    """原文件无法解码为图片（损坏、格式不支持、缺少 poppler 等）。"""
+
+
+class InvoiceDerivatives:
+    def __init__(self, source_root, cache_root):
+        self.source_root = Path(source_root)
+        self.cache_root  = Path(cache_root)
+        self._locks      = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _lock_for(self, key):
+        return self._locks[hash(key) % LOCK_STRIPES]
+
+    def _open(self, source, max_side):
+        if source.suffix.lower() == '.pdf':
+            # 只渲染第一页，按目标尺寸直接栅格化，避免先生成 300DPI 大图
+            pages = convert_from_path(str(source), first_page=1, last_page=1,
+                                      size=(max_side, None))
+            if not pages:
+                raise DerivativeError(f'PDF 没有页面：{source.name}')
+            return pages[0]
+        with Image.open(source) as img:
+            img.draft('RGB', (max_side, max_side))   # JPEG 解码时直接按比例缩小，省内存和时间
+            # 手机照片按 EXIF 方向摆正；返回的是解码好的新图，原文件随 with 关闭
+            return ImageOps.exif_transpose(img)
+
+    def _render(self, source, target, variant):
+        max_side, quality = VARIANTS[variant]
+        try:
+            img = self._open(source, max_side)
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+        except DerivativeError:
+            raise
+        except Exception as exc:
+            raise DerivativeError(f'无法生成{variant}：{source.name}（{exc}）') from exc
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f'.{target.name}.{uuid.uuid4().hex}')
+        if FORMAT == 'WEBP':
+            img.save(tmp, FORMAT, quality=quality, method=4)
+        else:
+            img.save(tmp, FORMAT, quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, target)
+
+    def get(self, relpath, variant):
+        """
+        返回衍生图的磁盘路径，不存在时生成。
+        relpath 为 static/invoices 下的相对路径（Expense.invoice）；
+        路径越界或原文件不存在时抛 FileNotFoundError。
+        """
+        if variant not in VARIANTS:
+            raise KeyError(variant)
+        source = (self.source_root / relpath).resolve()
+        if self.source_root.resolve() not in source.parents or not source.is_file():
+            raise FileNotFoundError(relpath)
+        target = self.cache_root / variant / (relpath + EXT)
+        if target.exists():
+            return target
+        with self._lock_for((variant, relpath)):
+            if not target.exists():
+                self._render(source, target, variant)
+        return target
+
+    def discard(self, relpath):
+        """原文件被回收后删除它的全部衍生图。"""
+        for variant in VARIANTS:
+            (self.cache_root / variant / (relpath + EXT)).unlink(missing_ok=True)
@@ -0,0 +1,266 @@
+"""
+请求级性能指标，/metrics 以 Prometheus 文本格式输出。
+
+- 请求耗时：按路由（url_rule，而不是原始路径）、方法、状态码记直方图；流式响应（导出）
+  在最后一块数据发出后才结束计时
+- SQL：对所有 Engine 挂 before / after_cursor_execute 事件，在请求上下文里累加到
+  g.sql_statements / g.sql_seconds，请求结束时按路由记直方图；
+  超过 SQL_STATEMENT_BUDGET 条记一条 warning，TESTING / DEBUG 模式下还会通过响应头
+  X-SQL-Statements 返回条数，方便发现 N+1 查询
+- span(name)：命名的计时片段，记入 span_seconds{span=name}，PDF 生成的各阶段用它
+- 慢请求日志：SLOW_REQUEST_SECONDS > 0 时，超过该耗时的请求记一条 warning（含 SQL 条数 / 耗时）
+
+gunicorn 的多个 worker、PDF 任务进程各自在内存里计数，每隔 METRICS_FLUSH_INTERVAL 秒
+把本进程的累计值原子写入 METRICS_DIR/<主机名>-<pid>.json；/metrics 汇总目录下全部文件输出。
+进程退出后文件保留（计数器不能变小），部署启动时清空目录即可。
+"""
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS   = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Registry:
+    """
+    进程内的计数器 / 直方图，线程安全。
+    计数器的值为数字；直方图的值为 [各桶计数..., +Inf 桶计数, 观测值之和]（桶计数不累积）。
+    """
+
+    def __init__(self):
+        self._meta       = {}          # name -> (类型, 说明, 标签名, 桶上界)
+        self._values     = {}          # name -> {标签值元组: 值}
+        self._collectors = []
+        self._lock       = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        self._meta[name] = ('counter', help, tuple(labelnames), None)
+        self._values.setdefault(name, {})
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help, tuple(labelnames), tuple(buckets))
+        self._values.setdefault(name, {})
+
+    def add_collector(self, collect):
+        """collect() -> {计数器名: {标签值元组: 当前值}}，取快照时调用（用于已有自己计数的模块）。"""
+        self._collectors.append(collect)
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            values = self._values[name]
+            values[labels] = values.get(labels, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = self._meta[name][3]
+        index = bisect_left(buckets, value)         # 第一个 >= value 的桶，超出时为 +Inf 桶
+        with self._lock:
+            row = self._values[name].get(labels)
+            if row is None:
+                row = self._values[name][labels] = [0] * (len(buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    # ---------- 跨进程汇总 ----------
+    def snapshot(self):
+        """{name: [[标签值列表, 值], ...]}，可直接序列化为 JSON。"""
+        with self._lock:
+            data = {name: [[list(labels), list(v) if isinstance(v, list) else v]
+                           for labels, v in values.items()]
+                    for name, values in self._values.items()}
+        for collect in self._collectors:
+            for name, values in collect().items():
+                data[name] = [[list(labels), v] for labels, v in values.items()]
+        return data
+
+    def flush(self, directory):
+        """把本进程的快照原子写入 directory/<主机名>-<pid>.json。"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f'.{uuid.uuid4().hex}.tmp'
+        tmp.write_text(json.dumps(self.snapshot()), encoding='utf-8')
+        os.replace(tmp, directory / _snapshot_name())
+
+    def collect(self, directory):
+        """汇总 directory 下所有进程的快照（本进程用内存中的最新值），返回 {name: {标签值元组: 值}}。"""
+        merged = {name: {} for name in self._meta}
+        snapshots = [self.snapshot()]
+        own = _snapshot_name()
+        for path in Path(directory).glob('*.json'):
+            if path.name == own:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):            # 刚被删除 / 无法读取：跳过这一份
+                continue
+        for snapshot in snapshots:
+            for name, rows in snapshot.items():
+                if name not in merged:               # 旧版本进程留下的、已不存在的指标
+                    continue
+                values = merged[name]
+                for labels, value in rows:
+                    labels = tuple(labels)
+                    current = values.get(labels)
+                    if current is None:
+                        values[labels] = list(value) if isinstance(value, list) else value
+                    elif isinstance(value, list) and len(value) == len(current):
+                        values[labels] = [a + b for a, b in zip(current, value)]
+                    elif not isinstance(value, list):
+                        values[labels] = current + value
+        return merged
+
+    def render(self, merged):
+        """Prometheus 文本格式。"""
+        lines = []
+        for name, (kind, help, labelnames, buckets) in self._meta.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(merged.get(name, {}).items()):
+                pairs = list(zip(labelnames, labels))
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(pairs + [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(pairs)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_labels(pairs)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _snapshot_name():
+    return f'{socket.gethostname()}-{os.getpid()}.json'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escape = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')  # noqa: E731
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+REGISTRY.histogram('http_request_duration_seconds', '请求耗时（秒）', ('method', 'route', 'status'))
+REGISTRY.histogram('http_request_sql_statements', '每个请求执行的 SQL 条数', ('route',),
+                   buckets=STATEMENT_BUCKETS)
+REGISTRY.histogram('http_request_db_seconds', '每个请求的数据库耗时（秒）', ('route',))
+REGISTRY.histogram('span_seconds', '命名计时片段耗时（秒）', ('span',))
+
+
+# ------------------- 计时片段 -------------------
+@contextmanager
+def span(name):
+    """with span('pdf.soffice'): ...  出异常也计时。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_span(name, time.perf_counter() - start)
+
+
+def observe_span(name, seconds):
+    """记一次已测好的耗时（如子进程里测的、随结果一起返回的耗时）。"""
+    REGISTRY.observe('span_seconds', seconds, (name,))
+
+
+# ------------------- SQL -------------------
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None and has_request_context():
+        g.sql_seconds = g.get('sql_seconds', 0.0) + time.perf_counter() - started
+
+
+def sql_statement_count():
+    """当前请求到目前为止执行的 SQL 条数。"""
+    return g.get('sql_statements', 0)
+
+
+# ------------------- 汇总输出 -------------------
+_last_flush = 0.0
+
+
+def flush_metrics(directory, interval=0):
+    """距上次写入超过 interval 秒时写入本进程快照（interval=0 立即写）。"""
+    global _last_flush
+    now = time.monotonic()
+    if now - _last_flush < interval:
+        return
+    _last_flush = now
+    REGISTRY.flush(directory)
+
+
+def render_metrics(directory):
+    flush_metrics(directory)
+    return REGISTRY.render(REGISTRY.collect(directory))
+
+
+def init_metrics(app):
+    for name, listener in (('before_cursor_execute', _before_execute),
+                           ('after_cursor_execute', _after_execute)):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def report_sql_statements(response):
+        g.response_status = response.status_code
+        count  = sql_statement_count()
+        budget = app.config.get('SQL_STATEMENT_BUDGET')
+        if budget and count > budget:
+            app.logger.warning('%s %s 执行了 %d 条 SQL（上限 %d）',
+                               request.method, request.path, count, budget)
+        if app.testing or app.debug:
+            response.headers['X-SQL-Statements'] = str(count)
+        return response
+
+    @app.teardown_request
+    def observe_request(exc):
+        # 流式响应在生成器结束时才到这里，耗时和 SQL 包含整个响应体
+        started = g.get('request_started')
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        route   = request.url_rule.rule if request.url_rule else '<unmatched>'
+        status  = g.get('response_status', 500)
+        count, db_seconds = sql_statement_count(), g.get('sql_seconds', 0.0)
+        REGISTRY.observe('http_request_duration_seconds', elapsed, (request.method, route, str(status)))
+        REGISTRY.observe('http_request_sql_statements', count, (route,))
+        REGISTRY.observe('http_request_db_seconds', db_seconds, (route,))
+
+        slow = app.config.get('SLOW_REQUEST_SECONDS')
+        if slow and elapsed >= slow:
+            app.logger.warning('慢请求 %s %s -> %s：%.3f s，SQL %d 条 / %.3f s',
+                               request.method, request.full_path.rstrip('?'), status,
+                               elapsed, count, db_seconds)
+        flush_metrics(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+
+    atexit.register(lambda: flush_metrics(app.config['METRICS_DIR']))
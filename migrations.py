@@ -0,0 +1,76 @@
+"""
+数据库结构升级。
+
+db.create_all() 只会创建缺失的表，不会给已有的表补索引或字段。
+这里按顺序执行一组幂等的升级步骤，每一步先检查现有结构再补齐，
+可以重复运行；SQLite 与 SQL Server 通用。
+
+    python migrations.py
+"""
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from models import db
+from invoice_store import dedupe_invoices
+from reporting import ensure_rollups
+from search import ensure_search_index
+
+
+def ensure_columns(engine):
+    """
+    给已有的表补上 models.py 里新增的字段。
+    新增字段须允许为空或带 server_default，否则已有数据行无法补列。
+    """
+    insp = inspect(engine)
+    added = []
+    quote = engine.dialect.identifier_preparer.format_table
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {col['name'] for col in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {quote(table)} ADD {ddl}')
+                    added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def ensure_indexes(engine):
+    """创建 models.py 里声明、但数据库中还不存在的索引。"""
+    insp = inspect(engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {ix['name'] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
+# 按顺序执行；新增结构变更时追加到末尾
+MIGRATIONS = [
+    ensure_columns,
+    ensure_indexes,
+    dedupe_invoices,
+    ensure_rollups,
+    ensure_search_index,
+]
+
+
+def upgrade(engine):
+    db.metadata.create_all(bind=engine)
+    for step in MIGRATIONS:
+        changed = step(engine)
+        if changed:
+            print(f'{step.__name__}: {", ".join(changed)}')
+
+
+if __name__ == '__main__':
+    from app import app
+    with app.app_context():
+        upgrade(db.engine)
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Numeric
 
@@ -16,15 +18,38 @@ class ExpenseType(db.Model):
     id   = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Unicode(40), unique=True, nullable=False)
 
+class InvoiceBlob(db.Model):
+    """按内容存储的发票文件，见 invoice_store.py。"""
+    __tablename__ = 'invoice_blob'
+    sha256     = db.Column(db.String(64), primary_key=True)
+    path       = db.Column(db.Unicode(200), nullable=False)               # static/invoices 下的相对路径
+    size       = db.Column(db.BigInteger, nullable=False)
+    ref_count  = db.Column(db.Integer, nullable=False, default=0)         # 引用它的报销单数
+    normalized    = db.Column(db.Boolean)                                # 已经过 invoice_ingest 处理
+    source_sha256 = db.Column(db.String(64), index=True)                 # 由哪个原文件规范化而来
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
 class Expense(db.Model):
     __tablename__ = 'expense'
+    # 对应列表页的常用筛选 / 排序（见 app.filter_records / RECORD_SORTS）；
+    # 索引末尾隐含主键，可直接支撑 (排序列, id) 的键集分页
+    __table_args__ = (
+        db.Index('ix_expense_submitter_date',   'submitter_id', 'date'),
+        db.Index('ix_expense_submitter_amount', 'submitter_id', 'amount'),
+        db.Index('ix_expense_status_date',      'status', 'date'),
+        db.Index('ix_expense_type_date',        'type_id', 'date'),
+        db.Index('ix_expense_date',             'date'),
+    )
     id          = db.Column(db.Integer, primary_key=True)
     date        = db.Column(db.Date,      nullable=False)
     type_id     = db.Column(db.Integer, db.ForeignKey('expense_type.id'), nullable=False)
     type        = db.relationship('ExpenseType')
     title       = db.Column(db.Unicode(200),  nullable=False)
     amount      = db.Column(Numeric(10, 2),   nullable=False)
-    invoice     = db.Column(db.Unicode(200))                # 允许中英文文件名
+    invoice     = db.Column(db.Unicode(200))                # static/invoices 下的相对路径
+    invoice_name   = db.Column(db.Unicode(200))             # 上传时的原始文件名
+    invoice_sha256 = db.Column(db.String(64), db.ForeignKey('invoice_blob.sha256'))
+    invoice_blob   = db.relationship('InvoiceBlob')
     description = db.Column(db.UnicodeText)
     status      = db.Column(db.Unicode(20),  default='待审批') # 中文流程状态
 
@@ -36,3 +61,52 @@ class Expense(db.Model):
     approver  = db.relationship('User', foreign_keys=[approver_id],
                                 backref='expenses_approved')
     reject_reason = db.Column(db.String(255))
+
+    # 乐观锁：每次修改 +1；ORM 的 UPDATE / DELETE 自动带上 WHERE version = 旧值，
+    # 审批等批量 UPDATE 自己维护（见 app.decide_expenses）
+    version = db.Column(db.Integer, nullable=False, default=1, server_default=db.text('1'))
+    __mapper_args__ = {'version_id_col': version}
+
+class PdfJob(db.Model):
+    """后台生成报销单 PDF 的任务，由 pdf_jobs.py 独立进程消费。"""
+    __tablename__ = 'pdf_job'
+    __table_args__ = (
+        db.Index('ix_pdf_job_status_created', 'status', 'created_at'),
+        db.Index('ix_pdf_job_user_status',    'user_id', 'status'),
+        # 每个排队 / 生成中的任务占用该用户的一个名额（0 ~ 上限-1），结束时释放；
+        # 并发提交抢到同一个名额时插入失败，保证不超过 PDF_JOB_MAX_ACTIVE_PER_USER
+        db.Index('ux_pdf_job_user_slot', 'user_id', 'active_slot', unique=True,
+                 mssql_where=db.text('active_slot IS NOT NULL'),
+                 sqlite_where=db.text('active_slot IS NOT NULL')),
+    )
+    id          = db.Column(db.String(32), primary_key=True)                # uuid4 hex
+    user_id     = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expense_ids = db.Column(db.UnicodeText, nullable=False)                # 逗号分隔
+    status      = db.Column(db.String(20), nullable=False, default='queued') # queued / running / done / failed
+    stage       = db.Column(db.String(20))                                 # render / convert / merge
+    done_pages  = db.Column(db.Integer, nullable=False, default=0)
+    total_pages = db.Column(db.Integer, nullable=False, default=0)
+    filename    = db.Column(db.Unicode(200))                               # 下载文件名
+    result_path = db.Column(db.Unicode(500))                               # 生成的 PDF 路径
+    error       = db.Column(db.Unicode(500))
+    created_at  = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    started_at  = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)                                  # 领取及每次汇报进度时刷新
+    finished_at = db.Column(db.DateTime)
+    active_slot = db.Column(db.SmallInteger)                               # 见 ux_pdf_job_user_slot
+
+class ExpenseRollup(db.Model):
+    """
+    报销单按 (月份, 类型, 报销人, 状态) 预聚合的条数 / 金额，见 reporting.py。
+    随报销单的提交 / 审批 / 编辑 / 删除在同一事务内增量维护，可随时从 expense 表重建。
+    """
+    __tablename__ = 'expense_rollup'
+    __table_args__ = (
+        db.Index('ix_expense_rollup_submitter_month', 'submitter_id', 'month'),
+    )
+    month        = db.Column(db.Date, primary_key=True)                    # 当月 1 日
+    type_id      = db.Column(db.Integer, primary_key=True)
+    submitter_id = db.Column(db.Integer, primary_key=True)
+    status       = db.Column(db.Unicode(20), primary_key=True)
+    count        = db.Column(db.Integer, nullable=False, default=0)
+    amount       = db.Column(Numeric(16, 2), nullable=False, default=0)
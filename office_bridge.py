@@ -0,0 +1,96 @@
+"""
+常驻 soffice 的转换桥（由 office_pool.OfficeWorker 启动，不直接使用）。
+
+    /usr/bin/python3 office_bridge.py <soffice> <UserInstallation URL> <pipe 名>
+
+需要带 uno 模块的 Python（Debian 的 python3-uno，只装在系统 Python 里），所以单独成一个脚本、
+不导入项目里的其他模块。启动一个 soffice --accept 监听进程并通过 UNO 连接，
+之后从 stdin 逐行读取任务 JSON {"docx": [...], "outdir": "..."}，
+每个任务向 stdout 写一行结果：{"ok": true} 或 {"error": "..."}。
+就绪时先输出一行 {"ready": true}。stdin 关闭（父进程退出）时关闭 soffice 并退出。
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import uno
+from com.sun.star.beans import PropertyValue
+from com.sun.star.connection import NoConnectException
+
+CONNECT_TIMEOUT = 60            # 秒，等 soffice 开始监听
+
+
+def _props(**kwargs):
+    return tuple(PropertyValue(Name=k, Value=v) for k, v in kwargs.items())
+
+
+def _reply(**kwargs):
+    sys.stdout.write(json.dumps(kwargs, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+def connect(soffice, profile_url, pipe_name):
+    """启动 soffice 监听进程，返回 (进程, Desktop)。"""
+    proc = subprocess.Popen([soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+                             '--nolockcheck', f'-env:UserInstallation={profile_url}',
+                             f'--accept=pipe,name={pipe_name};urp;StarOffice.ComponentContext'],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            ctx = resolver.resolve(f'uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext')
+            break
+        except NoConnectException:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError('soffice 未能启动监听')
+            time.sleep(0.1)
+    desktop = ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+    return proc, desktop
+
+
+def convert(desktop, docx_path, outdir):
+    pdf_path = os.path.join(outdir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+    doc = desktop.loadComponentFromURL(uno.systemPathToFileUrl(os.path.abspath(docx_path)), '_blank', 0,
+                                       _props(Hidden=True, ReadOnly=True))
+    if doc is None:
+        raise RuntimeError(f'无法打开 {docx_path}')
+    try:
+        doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                       _props(FilterName='writer_pdf_Export'))
+    finally:
+        doc.close(True)
+
+
+def main():
+    soffice, profile_url, pipe_name = sys.argv[1:4]
+    proc, desktop = connect(soffice, profile_url, pipe_name)
+    _reply(ready=True)
+    try:
+        for line in sys.stdin:
+            job = json.loads(line)
+            try:
+                for docx_path in job['docx']:
+                    convert(desktop, docx_path, job['outdir'])
+            except Exception as exc:    # 单个文档失败不影响监听进程；soffice 本身崩溃时下一个任务会失败退出
+                if proc.poll() is not None:
+                    raise
+                _reply(error=f'{type(exc).__name__}: {exc}')
+            else:
+                _reply(ok=True)
+    finally:
+        try:
+            desktop.terminate()
+        except Exception:
+            pass
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+if __name__ == '__main__':
+    main()
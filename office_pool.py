@@ -0,0 +1,315 @@
+"""
+LibreOffice（soffice）docx -> pdf 转换进程池。
+
+每个 worker 线程常驻一个 soffice 监听进程（--accept，经 office_bridge.py 用 UNO 驱动），
+启动时就把 soffice 拉起来，之后的任务直接交给这个已在运行的进程转换，不再每次冷启动；
+每个 worker 独占一个配置目录（-env:UserInstallation），互不抢锁。
+同一个请求的全部 docx 作为一个任务交给同一个 worker。
+
+- 池大小、单任务超时可配置
+- 任务超时、soffice 崩溃或桥接进程退出时，worker 杀掉整个进程组（桥接进程和它启动的 soffice），
+  清空配置目录并重新拉起监听进程
+- 找不到带 uno 模块的 Python（bridge_python，Debian 上是 python3-uno）或监听进程起不来时，
+  退回每个任务调用一次 soffice --convert-to（冷启动，每次多 1~2 秒），配置目录仍会预先初始化
+- worker 线程意外退出时，下次提交任务会自动补齐
+- 配置目录按进程存放，池关闭或进程退出时删除；启动时顺带清掉已退出进程留下的目录
+- 每次转换的耗时记入 metrics.span_seconds{span="pdf.soffice"}
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from metrics import span
+
+BRIDGE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'office_bridge.py')
+
+log = logging.getLogger(__name__)
+
+
+class OfficeConversionError(RuntimeError):
+    """soffice 转换失败（超时、异常退出或未生成目标文件）。"""
+
+
+class _Job:
+    __slots__ = ('docx_paths', 'outdir', 'timeout', 'future')
+
+    def __init__(self, docx_paths, outdir, timeout):
+        self.docx_paths = list(docx_paths)
+        self.outdir     = outdir
+        self.timeout    = timeout
+        self.future     = Future()
+
+
+def _kill_group(proc):
+    """杀掉 proc 所在的整个进程组（soffice 启动脚本 fork 出的 soffice.bin、桥接进程启动的 soffice）。"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class _Listener:
+    """一个 office_bridge.py 进程及其常驻 soffice；按行收发 JSON。"""
+
+    def __init__(self, bridge_python, soffice_bin, profile_uri, pipe_name):
+        self.proc = subprocess.Popen([bridge_python, BRIDGE_SCRIPT, soffice_bin, profile_uri, pipe_name],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0,
+                                     start_new_session=True)
+        self._buf = b''
+
+    def request(self, message, timeout):
+        self.proc.stdin.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        return self.read(timeout)
+
+    def read(self, timeout):
+        """读一行回复；超时抛 TimeoutError，进程退出抛 EOFError。"""
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self._buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            # 每秒检查一次桥接进程是否还在：它启动的进程可能还握着 stdout，不一定能读到 EOF
+            if not select.select([fd], [], [], min(remaining, 1))[0]:
+                if self.proc.poll() is not None:
+                    raise EOFError
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError
+            self._buf += chunk
+        line, self._buf = self._buf.split(b'\n', 1)
+        return json.loads(line)
+
+    def close(self, wait=5):
+        """关闭 stdin 让桥接进程自行关掉 soffice，超时后整组杀掉。"""
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=wait)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        _kill_group(self.proc)
+        self.proc.wait()
+        self.proc.stdout.close()
+
+
+class OfficeWorker(threading.Thread):
+    def __init__(self, pool, index):
+        super().__init__(name=f'office-worker-{index}', daemon=True)
+        self.pool     = pool
+        self.index    = index
+        self.profile  = Path(pool.profile_root) / f'worker_{index}'
+        self.listener = None
+
+    def _base_cmd(self):
+        return [self.pool.soffice_bin, '--headless', '--invisible', '--nologo',
+                '--norestore', '--nodefault', '--nolockcheck',
+                f'-env:UserInstallation={self.profile.resolve().as_uri()}']
+
+    # ---------- 常驻 soffice ----------
+    def warm_up(self):
+        """拉起常驻 soffice；不可用时退回冷启动模式，只初始化配置目录。"""
+        self.profile.mkdir(parents=True, exist_ok=True)
+        if self.pool.bridge_python and not self.pool.cold_start:
+            listener = None
+            try:
+                listener = _Listener(self.pool.bridge_python, self.pool.soffice_bin,
+                                     self.profile.resolve().as_uri(), f'baoxiao_{os.getpid()}_{self.index}')
+                if listener.read(self.pool.job_timeout).get('ready'):
+                    self.listener = listener
+                    return
+            except (OSError, ValueError, EOFError, TimeoutError):
+                pass
+            if listener:
+                listener.close(wait=0)
+            # 一般是没有 python3-uno；整个池都退回冷启动，不再每个 worker 重试
+            log.warning('无法启动常驻 soffice（%s %s），改为每个任务冷启动 soffice',
+                        self.pool.bridge_python, BRIDGE_SCRIPT)
+            self.pool.cold_start = True
+        self._init_profile()
+
+    def _init_profile(self):
+        """冷启动模式：预先初始化配置目录；目录已存在时几乎不耗时。"""
+        if (self.profile / 'user').is_dir():
+            return
+        try:
+            proc = subprocess.Popen(self._base_cmd() + ['--terminate_after_init'],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError:
+            return
+        try:
+            proc.wait(timeout=self.pool.job_timeout)
+        except subprocess.TimeoutExpired:
+            # 预热失败不致命，第一次转换时 soffice 会自己初始化
+            _kill_group(proc)
+            proc.wait()
+
+    def stop(self):
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+
+    def restart(self):
+        """杀掉 soffice，丢弃可能已损坏的配置目录并重新拉起。"""
+        self.stop()
+        shutil.rmtree(self.profile, ignore_errors=True)
+        self.warm_up()
+
+    # ---------- 任务循环 ----------
+    def run(self):
+        self.warm_up()
+        try:
+            while True:
+                job = self.pool._queue.get()
+                if job is None:
+                    break
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with span('pdf.soffice'):
+                        result = self._convert(job)
+                    job.future.set_result(result)
+                except BaseException as exc:    # 任何异常都交给调用方，线程本身继续服务
+                    job.future.set_exception(exc)
+        finally:
+            self.stop()
+
+    def _convert(self, job):
+        if self.listener:
+            self._convert_warm(job)
+        else:
+            self._convert_cold(job)
+        pdf_paths = [os.path.join(job.outdir, os.path.splitext(os.path.basename(p))[0] + '.pdf')
+                     for p in job.docx_paths]
+        missing = [p for p in pdf_paths if not os.path.exists(p)]
+        if missing:
+            raise OfficeConversionError(f'soffice 未生成：{", ".join(missing)}')
+        return pdf_paths
+
+    def _convert_warm(self, job):
+        try:
+            reply = self.listener.request({'docx': [os.path.abspath(p) for p in job.docx_paths],
+                                           'outdir': os.path.abspath(job.outdir)}, job.timeout)
+        except TimeoutError:
+            self.restart()
+            raise OfficeConversionError(f'soffice 转换超时（{job.timeout}s）')
+        except (OSError, ValueError, EOFError):
+            self.restart()
+            raise OfficeConversionError('soffice 异常退出')
+        if 'error' in reply:
+            raise OfficeConversionError(f'soffice 转换失败：{reply["error"]}')
+
+    def _convert_cold(self, job):
+        cmd = self._base_cmd() + ['--convert-to', 'pdf', '--outdir', job.outdir] + job.docx_paths
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+        try:
+            _, stderr = proc.communicate(timeout=job.timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            proc.communicate()
+            self.restart()
+            raise OfficeConversionError(f'soffice 转换超时（{job.timeout}s）')
+        if proc.returncode != 0:
+            self.restart()
+            raise OfficeConversionError(
+                f'soffice 异常退出（{proc.returncode}）：{stderr.decode(errors="replace").strip()}')
+
+
+_PROFILE_PREFIX = 'baoxiao_soffice_'
+
+
+def _remove_stale_profiles(tmpdir):
+    """删除已退出进程留下的配置目录（被 SIGKILL 的进程来不及在 atexit 里清理）。"""
+    try:
+        names = os.listdir(tmpdir)
+    except OSError:
+        return
+    for name in names:
+        pid = name[len(_PROFILE_PREFIX):]
+        if not name.startswith(_PROFILE_PREFIX) or not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(tmpdir, name), ignore_errors=True)
+        except PermissionError:                 # 进程还在，属于其他用户
+            pass
+
+
+class OfficePool:
+    def __init__(self, size=2, job_timeout=120, soffice_bin='soffice', profile_root=None,
+                 bridge_python='/usr/bin/python3'):
+        self.size          = max(1, int(size))
+        self.job_timeout   = job_timeout
+        self.soffice_bin   = soffice_bin
+        self.bridge_python = bridge_python or None
+        self.cold_start    = not (self.bridge_python and os.path.exists(self.bridge_python))
+        # 按进程区分，避免多个 gunicorn worker 抢同一份配置目录；
+        # 自动生成的目录归本进程所有，关闭时删除，调用方指定的目录保留
+        self._owns_profile_root = profile_root is None
+        if self._owns_profile_root:
+            _remove_stale_profiles(tempfile.gettempdir())
+            profile_root = os.path.join(tempfile.gettempdir(), f'{_PROFILE_PREFIX}{os.getpid()}')
+        self.profile_root = profile_root
+        self._queue   = queue.Queue()
+        self._workers = []
+        self._lock    = threading.Lock()
+        # 常驻 soffice 在独立的进程组里，进程退出时要显式关掉
+        atexit.register(self._at_exit)
+
+    def start(self):
+        """启动（或补齐已退出的）worker；提交任务时也会自动调用。"""
+        with self._lock:
+            alive = [w for w in self._workers if w.is_alive()]
+            used  = {w.index for w in alive}
+            free  = (i for i in range(self.size * 2) if i not in used)
+            while len(alive) < self.size:
+                worker = OfficeWorker(self, next(free))
+                worker.start()
+                alive.append(worker)
+            self._workers = alive
+
+    def submit(self, docx_paths, outdir, timeout=None):
+        """提交一批 docx，返回 Future，结果为与输入一一对应的 pdf 路径列表。"""
+        self.start()
+        job = _Job(docx_paths, outdir, timeout or self.job_timeout)
+        self._queue.put(job)
+        return job.future
+
+    def convert(self, docx_paths, outdir, timeout=None):
+        """同步转换：整批 docx 交给同一个 soffice。"""
+        if not docx_paths:
+            return []
+        return self.submit(docx_paths, outdir, timeout).result()
+
+    def shutdown(self):
+        with self._lock:
+            for _ in self._workers:
+                self._queue.put(None)
+            for w in self._workers:
+                w.join()
+            self._workers = []
+        self._remove_profile_root()
+
+    def _at_exit(self):
+        # worker 线程是 daemon，这时可能正卡在转换里，不等它们，直接杀掉常驻 soffice
+        for worker in list(self._workers):
+            listener = worker.listener
+            if listener:
+                _kill_group(listener.proc)
+        self._remove_profile_root()
+
+    def _remove_profile_root(self):
+        if self._owns_profile_root:
+            shutil.rmtree(self.profile_root, ignore_errors=True)
@@ -0,0 +1,133 @@
+"""
+已渲染 A5 报销单页面（PDF）的磁盘缓存。
+
+键 = sha256(页面上下文 JSON + 模板文件内容哈希)，同样内容的页面重复导出时
+直接复用缓存里的 PDF，跳过 docx 渲染和 soffice 转换。
+
+- 缓存文件按模板哈希分目录存放；模板文件变化后旧目录整体删除
+- 总大小超过上限时按最近使用时间（mtime，命中时会刷新）淘汰；
+  本进程写入的字节数累计超过上限，或距上次扫描超过 scan_interval 秒（其他进程也在写）时才遍历目录
+- 命中时把缓存文件硬链接（跨文件系统时复制）到调用方的临时目录再返回，
+  之后其他进程淘汰或清理模板目录都不影响正在进行的导出
+- hits / misses 为进程内计数
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+class PageCache:
+    def __init__(self, root, template_path, max_bytes=200 * 1024 * 1024, scan_interval=600):
+        self.root          = root
+        self.template_path = template_path
+        self.max_bytes     = max_bytes
+        self.scan_interval = scan_interval
+        self.hits   = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size      = None                  # 上次扫描得到的总大小 + 之后本进程写入的字节数
+        self._last_scan = 0.0
+        self._template_stamp = None
+        self._template_hash  = None
+
+    # ---------- 模板哈希 ----------
+    def template_hash(self):
+        """模板文件内容哈希；按 (mtime, size) 判断是否需要重新计算。"""
+        st = os.stat(self.template_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp != self._template_stamp:
+                with open(self.template_path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                if digest != self._template_hash:
+                    self._template_hash = digest
+                    self._purge_other_templates(digest)
+                self._template_stamp = stamp
+            return self._template_hash
+
+    def _purge_other_templates(self, digest):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name != digest:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    # ---------- 读写 ----------
+    def _path(self, context):
+        template_hash = self.template_hash()
+        payload = json.dumps(context, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        key = hashlib.sha256(payload + template_hash.encode()).hexdigest()
+        return os.path.join(self.root, template_hash, key[:2], key + '.pdf')
+
+    def get(self, context, dest):
+        """命中时把缓存 PDF 链接 / 复制到 dest 并返回 dest，否则返回 None。"""
+        path = self._path(context)
+        try:
+            os.utime(path)                      # 刷新最近使用时间
+            try:
+                os.link(path, dest)
+            except FileNotFoundError:
+                raise
+            except OSError:                     # 跨文件系统等，不能硬链接
+                shutil.copyfile(path, dest)
+        except FileNotFoundError:               # 未命中，或刚被其他进程淘汰
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return dest
+
+    def put(self, context, pdf_path):
+        path = self._path(context)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        shutil.copyfile(pdf_path, tmp)
+        os.replace(tmp, path)                   # 原子替换，并发写同一页也安全
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+        return path
+
+    def evict(self, force=False):
+        """总大小超过上限时，从最久未使用的文件开始删除；没到扫描时机且 force 为假时直接返回。"""
+        with self._lock:
+            due = (self._size is None or self._size > self.max_bytes
+                   or time.monotonic() - self._last_scan >= self.scan_interval)
+        if not (due or force):
+            return 0
+        entries, total = [], 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total   -= size
+                removed += 1
+                if total <= self.max_bytes:
+                    break
+        with self._lock:
+            self._size      = total
+            self._last_scan = time.monotonic()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
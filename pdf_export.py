@@ -0,0 +1,360 @@
+"""
+报销单 PDF 生成：A5 docx 渲染 -> soffice 转 PDF -> 每两张 A5 拼成一页 A4
+（上下排列，中间留 1mm 间隙）。
+
+拼版方式：
+- vector（默认）：直接在 PDF 空间里把 A5 页面按变换矩阵合并到 A4 页面，
+  文字保持可选中，体积小，不经过位图
+- raster：旧实现，先用 pdf2image 转成位图，再用 reportlab 画到 A4 上
+
+export_pdf 把各页并行处理：docx 渲染 / 位图化在进程池中执行，
+soffice 转换按 worker 数切成连续的几批并行提交，
+A4 页面按顺序在对应页面就绪后立即拼版写入。
+
+输出用 SheetWriter 逐张写盘：每张 A4 拼好后连同它引用的字体、图片等对象立即写入文件并释放，
+内存里只留对象偏移表，峰值内存与总页数无关（PdfWriter 要把整份文档留在内存里直到最后 write）。
+A5 位图只在拼版时读入，用完即丢。
+
+各阶段耗时记入 metrics.span_seconds：pdf.render（每页 docx）、pdf.soffice（每批转换，
+见 office_pool.py）、pdf.rasterize（每页位图化）、pdf.merge（每张 A4 拼版）、pdf.write（每张 A4 写入文件）。
+子进程里执行的阶段在子进程计时，随结果带回主进程记录。
+"""
+import gc
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO
+
+from pdf2image import convert_from_path
+from PIL import Image
+from PyPDF2 import PageObject, PdfReader, Transformation
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, RectangleObject, StreamObject
+from reportlab.pdfgen import canvas
+
+from metrics import observe_span, span
+from template_registry import templates
+
+IMPOSE_VECTOR = 'vector'
+IMPOSE_RASTER = 'raster'
+
+A4_WIDTH, A4_HEIGHT = 595.2756, 841.8898        # pt，与 reportlab.lib.pagesizes.A4 一致
+GAP = 72 / 25.4                                 # 1mm，pt
+SLOT_Y = (A4_HEIGHT / 2 + GAP / 2, 0)           # 上半张 / 下半张的左下角 y 坐标
+
+
+def _slot_scale(width, height):
+    """A5 页面放进半张 A4 时的缩放比例（与旧位图实现相同的计算方式）。"""
+    return min(A4_WIDTH / width, (A4_HEIGHT - GAP) / 2 / height)
+
+
+# ------------------- 单页处理（可在子进程中执行） -------------------
+def _timed(fn, *args):
+    """在子进程中执行 fn 并计时，返回 (结果, 秒)。"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def render_docx(template_path, context, out_path):
+    templates.render(template_path, context, out_path)
+    return out_path
+
+
+def rasterize_a5(pdf_path, png_path):
+    image = convert_from_path(pdf_path, dpi=300, size=(int(A4_WIDTH), None))[0]  # 每个A5只有一页
+    image.save(png_path)
+    return png_path
+
+
+# ------------------- 逐页写出 -------------------
+class SheetWriter:
+    """
+    边生成边写的 PDF 文件：add_page 把页面和它引用的全部对象重新编号后立即写入，不保留页面本身。
+
+        with SheetWriter(out_path) as writer:
+            for ...:
+                writer.add_page(vector_sheet(...))
+
+    先写到 out_path.part，正常结束时写交叉引用表并改名为 out_path，出错时删除。
+    页面来自各自的 PdfReader（每张 A4 用新的 reader），同一 reader 内被多次引用的对象只写一次。
+    """
+    # 不跟随的回指：沿着它们会把来源文档的整棵页面树一起写进来
+    _DROPPED_KEYS = frozenset(['/Parent', '/P'])
+    # 来源 reader 和它的对象互相引用，只有循环 GC 才能回收；图片等大块数据分配次数少，
+    # 触发不了自动 GC，每写出这么多字节手动回收一次已写完的页面（一次完整回收要几十毫秒，不逐页做）
+    COLLECT_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, out_path):
+        self.out_path = out_path
+        self._tmp     = f'{out_path}.part'
+        self._file    = None
+        self._offsets = [None, None]            # 对象号 1：Catalog，2：页面树根，最后写
+        self._kids    = []
+        self._collected_at = 0
+
+    def __enter__(self):
+        self._file = open(self._tmp, 'wb')
+        self._file.write(b'%PDF-1.3\n%\xe2\xe3\xcf\xd3\n')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        done = False
+        try:
+            try:
+                if exc_type is None:
+                    self._finish()
+            finally:
+                self._file.close()
+            if exc_type is None:
+                os.replace(self._tmp, self.out_path)
+                done = True
+        finally:
+            # 出错（包括写交叉引用表、关闭文件时出错，如磁盘已满）时不留下半成品
+            if not done:
+                os.remove(self._tmp)
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _begin(self, num):
+        self._offsets[num - 1] = self._file.tell()
+        self._file.write(b'%d 0 obj\n' % num)
+
+    def _end(self):
+        self._file.write(b'\nendobj\n')
+
+    def add_page(self, page):
+        mapping, pending = {}, []               # (来源 reader, 对象号, 代号) -> 新对象号；待写对象
+
+        def ref(indirect):
+            key = (id(indirect.pdf), indirect.idnum, indirect.generation)
+            num = mapping.get(key)
+            if num is None:
+                num = mapping[key] = self._reserve()
+                pending.append((num, indirect))
+            return num
+
+        page_num = self._reserve()
+        self._kids.append(page_num)
+        self._begin(page_num)
+        self._file.write(b'<<\n/Parent 2 0 R\n')
+        self._write_items(page, ref)
+        self._file.write(b'>>')
+        self._end()
+        while pending:
+            num, indirect = pending.pop()
+            self._begin(num)
+            self._write(indirect.get_object(), ref)
+            self._end()
+        if self._file.tell() - self._collected_at > self.COLLECT_BYTES:
+            gc.collect()
+            self._collected_at = self._file.tell()
+        return page_num
+
+    def _write(self, obj, ref):
+        f = self._file
+        if isinstance(obj, IndirectObject):
+            f.write(b'%d 0 R' % ref(obj))
+        elif isinstance(obj, StreamObject):
+            data = obj._data                     # 来源中的 /Length 可能是间接对象，按实际长度重写
+            f.write(b'<<\n')
+            self._write_items(obj, ref, skip='/Length')
+            f.write(b'/Length %d\n>>\nstream\n' % len(data))
+            f.write(data)
+            f.write(b'\nendstream')
+        elif isinstance(obj, DictionaryObject):
+            f.write(b'<<\n')
+            self._write_items(obj, ref)
+            f.write(b'>>')
+        elif isinstance(obj, ArrayObject):
+            f.write(b'[')
+            for value in obj:
+                f.write(b' ')
+                self._write(value, ref)
+            f.write(b' ]')
+        else:
+            obj.write_to_stream(f, None)
+
+    def _write_items(self, obj, ref, skip=None):
+        for key, value in obj.items():
+            if key in self._DROPPED_KEYS or key == skip:
+                continue
+            key.write_to_stream(self._file, None)
+            self._file.write(b' ')
+            self._write(value, ref)
+            self._file.write(b'\n')
+
+    def _finish(self):
+        f = self._file
+        self._begin(2)
+        f.write(b'<<\n/Type /Pages\n/Count %d\n/Kids [%s]\n>>'
+                % (len(self._kids), b' '.join(b'%d 0 R' % k for k in self._kids)))
+        self._end()
+        self._begin(1)
+        f.write(b'<<\n/Type /Catalog\n/Pages 2 0 R\n>>')
+        self._end()
+        xref = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(self._offsets) + 1))
+        f.write(b''.join(b'%010d 00000 n \n' % offset for offset in self._offsets))
+        f.write(b'trailer\n<<\n/Size %d\n/Root 1 0 R\n>>\nstartxref\n%d\n%%%%EOF\n'
+                % (len(self._offsets) + 1, xref))
+
+
+# ------------------- A4 拼版 -------------------
+def vector_sheet(pdfs):
+    """把 1~2 个 A5 PDF 合并成一页 A4（PageObject）。"""
+    sheet = PageObject.create_blank_page(width=A4_WIDTH, height=A4_HEIGHT)
+    for pdf, y in zip(pdfs, SLOT_Y):
+        page = PdfReader(pdf).pages[0]
+        box = page.mediabox
+        scale = _slot_scale(float(box.width), float(box.height))
+        width, height = float(box.width) * scale, float(box.height) * scale
+        page.add_transformation(Transformation()
+                                .translate(-float(box.left), -float(box.bottom))
+                                .scale(scale, scale)
+                                .translate(0, y))
+        # merge_page 按被合并页的 mediabox 裁剪，需同步成变换后的位置
+        page.mediabox = RectangleObject([0, y, width, y + height])
+        sheet.merge_page(page)
+    return sheet
+
+
+def raster_sheet(images):
+    """把 1~2 张 A5 图片（PIL 图片或图片路径）画到一页 A4 上（PageObject）。"""
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(A4_WIDTH, A4_HEIGHT))
+    for img, y in zip(images, SLOT_Y):
+        if isinstance(img, str):
+            with Image.open(img) as im:
+                img_width, img_height = im.size
+        else:
+            img_width, img_height = img.size
+        scale = _slot_scale(img_width, img_height)
+        can.drawInlineImage(img, 0, y, width=img_width * scale, height=img_height * scale)
+    can.save()
+    packet.seek(0)
+    return PdfReader(packet).pages[0]
+
+
+def impose_a4_vector(pdf_files, writer):
+    for i in range(0, len(pdf_files), 2):
+        writer.add_page(vector_sheet(pdf_files[i:i + 2]))
+
+
+def impose_a4_raster(pdf_files, writer):
+    # 每2张A5拼成1页A4，位图只在拼这一张时转换
+    for i in range(0, len(pdf_files), 2):
+        images = [convert_from_path(pdf, dpi=300, size=(int(A4_WIDTH), None))[0]
+                  for pdf in pdf_files[i:i + 2]]
+        writer.add_page(raster_sheet(images))
+
+
+def impose_a4(pdf_files, out_path, mode=IMPOSE_VECTOR):
+    """顺序拼版，逐张写入 out_path。"""
+    with SheetWriter(out_path) as writer:
+        if mode == IMPOSE_RASTER:
+            impose_a4_raster(pdf_files, writer)
+        else:
+            impose_a4_vector(pdf_files, writer)
+
+
+# ------------------- 并行流水线 -------------------
+def _split(items, n):
+    """切成不超过 n 段的连续分片，保证靠前的页面先完成。"""
+    size = -(-len(items) // max(1, n)) if items else 0
+    return [items[i:i + size] for i in range(0, len(items), size)] if size else []
+
+
+def export_pdf(contexts, out_path, template_path, office_pool, executor,
+               cache=None, mode=IMPOSE_VECTOR, progress=None):
+    """
+    按页面上下文生成 A4 报销单 PDF，写入 out_path。
+
+    executor:  docx 渲染 / 位图化使用的进程池（concurrent.futures.Executor）
+    cache:     PageCache，命中的页面跳过渲染和转换
+    progress:  progress(stage, done_pages, total_pages)，只在调用线程中回调
+    """
+    progress = progress or (lambda stage, done, total: None)
+    total = len(contexts)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # 命中的页面链接到 tmpdir，拼版时不受其他进程淘汰缓存的影响
+        pdf_files = [cache.get(context, os.path.join(tmpdir, f'cached_{idx + 1}.pdf')) if cache else None
+                     for idx, context in enumerate(contexts)]
+        missing = [idx for idx, pdf in enumerate(pdf_files) if pdf is None]
+
+        render_futs, convert_futs, raster_futs = {}, [], {}
+        try:
+            # 1. docx 渲染；某一批全部渲染完就立即提交 soffice 转换
+            chunks = _split(missing, office_pool.size)
+            chunk_of = {idx: cid for cid, chunk in enumerate(chunks) for idx in chunk}
+            remaining = [len(chunk) for chunk in chunks]
+            docx_files = {idx: os.path.join(tmpdir, f'baoxiao_{idx + 1}.docx') for idx in missing}
+            convert_futs.extend([None] * len(chunks))
+            for idx in missing:
+                render_futs[executor.submit(_timed, render_docx, template_path, contexts[idx], docx_files[idx])] = idx
+            pending, rendered = set(render_futs), total - len(missing)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    observe_span('pdf.render', fut.result()[1])
+                    idx = render_futs[fut]
+                    rendered += 1
+                    progress('render', rendered, total)
+                    cid = chunk_of[idx]
+                    remaining[cid] -= 1
+                    if not remaining[cid]:
+                        convert_futs[cid] = office_pool.submit([docx_files[i] for i in chunks[cid]], tmpdir)
+
+            # 2. 按顺序等待各批转换结果，逐页拼版写入
+            def page_ready(idx):
+                if pdf_files[idx] is None:
+                    cid = chunk_of[idx]
+                    for i, pdf in zip(chunks[cid], convert_futs[cid].result()):
+                        if cache:
+                            cache.put(contexts[i], pdf)
+                        pdf_files[i] = pdf
+                    progress('convert', chunks[cid][-1] + 1, total)
+                if mode != IMPOSE_RASTER:
+                    return pdf_files[idx]
+                if idx not in raster_futs:
+                    submit_raster(idx)
+                png_path, seconds = raster_futs[idx].result()
+                observe_span('pdf.rasterize', seconds)
+                return png_path
+
+            def submit_raster(idx):
+                raster_futs[idx] = executor.submit(_timed, rasterize_a5, pdf_files[idx],
+                                                   os.path.join(tmpdir, f'a5_{idx + 1}.png'))
+
+            with SheetWriter(out_path) as writer:
+                for i in range(0, total, 2):
+                    pages = [page_ready(idx) for idx in range(i, min(i + 2, total))]
+                    if mode == IMPOSE_RASTER:
+                        # 预先提交后两页的位图化，与当前页拼版重叠
+                        for idx in range(i + 2, min(i + 4, total)):
+                            if pdf_files[idx] is not None and idx not in raster_futs:
+                                submit_raster(idx)
+                        with span('pdf.merge'):
+                            sheet = raster_sheet(pages)
+                        for png_path in pages:           # 位图已画进这一页，不再需要
+                            os.remove(png_path)
+                    else:
+                        with span('pdf.merge'):
+                            sheet = vector_sheet(pages)
+                    with span('pdf.write'):
+                        writer.add_page(sheet)
+                    del sheet
+                    progress('merge', min(i + 2, total), total)
+        except BaseException:
+            # 其他页面的渲染 / 转换 / 位图化可能还在往 tmpdir 写文件：
+            # 取消还没开始的，等正在执行的结束，再让 with 删除 tmpdir
+            futures = [*render_futs, *filter(None, convert_futs), *raster_futs.values()]
+            for fut in futures:
+                fut.cancel()
+            wait(futures)
+            raise
+        if cache and missing:
+            cache.evict()
+    return total
@@ -0,0 +1,137 @@
+"""
+报销单 PDF 后台任务进程。
+
+    python pdf_jobs.py
+
+/generate_pdf 只负责登记 PdfJob（status=queued）并立即返回任务号；
+本进程轮询数据库，逐个领取任务、执行 docx 渲染 / soffice 转换 / A4 拼版，
+按页更新进度，把结果写到 PDF_JOB_DIR，页面通过 /pdf_jobs/<id> 轮询后下载。
+同时定期清理超过 PDF_JOB_RETENTION_HOURS 的任务记录和文件，
+并把异常中断（进程崩溃）遗留的 running 任务标记为失败：执行中的任务在领取和每次汇报进度时
+刷新 heartbeat_at，超过 SOFFICE_JOB_TIMEOUT 的 3 倍没有刷新才算中断（单批 soffice 转换最长
+SOFFICE_JOB_TIMEOUT，期间不会汇报进度），还在执行的长任务不会被误判。
+可以启动多个本进程并行消费，领取任务用条件 UPDATE 保证不会重复执行。
+数据库暂时不可用（断线、主备切换）时记录日志、等待后重试，不退出；
+进程本身仍应由外部守护（见 dockerfile 的重启循环），崩溃后自动拉起。
+各阶段耗时（metrics.span）在每个任务结束后写入 METRICS_DIR，由 web 进程的 /metrics 一并输出。
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from app import (app, render_expense_pdf, warm_up_pdf_pipeline, STATUS_APPROVED,
+                 JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+from metrics import flush_metrics, span
+from models import db, User, Expense, PdfJob
+
+CLEANUP_INTERVAL = 600          # 秒
+DB_RETRY_INTERVAL = 10          # 秒，数据库不可用时的重试间隔
+
+
+def claim_next_job():
+    """领取最早排队的任务；被其他进程抢先时返回 None。"""
+    job = (PdfJob.query.filter_by(status=JOB_QUEUED)
+           .order_by(PdfJob.created_at.asc()).first())
+    if not job:
+        return None
+    now = datetime.now()
+    claimed = (PdfJob.query.filter_by(id=job.id, status=JOB_QUEUED)
+               .update({'status': JOB_RUNNING, 'started_at': now, 'heartbeat_at': now},
+                       synchronize_session=False))
+    db.session.commit()
+    if not claimed:
+        return None
+    db.session.refresh(job)
+    return job
+
+
+def run_job(job):
+    def progress(stage, done, total):
+        job.stage       = stage
+        job.done_pages  = done
+        job.total_pages = total
+        job.heartbeat_at = datetime.now()
+        db.session.commit()
+
+    try:
+        id_list = [int(i) for i in job.expense_ids.split(',')]
+        user = User.query.get(job.user_id)
+        expenses = (Expense.query
+                    .filter(Expense.id.in_(id_list), Expense.submitter_id==job.user_id,
+                            Expense.status==STATUS_APPROVED)
+                    .order_by(Expense.date.asc()).all())
+        if not user or len(expenses) != len(set(id_list)):
+            raise ValueError('部分报销记录不存在或无权操作')
+
+        out_dir = app.config['PDF_JOB_DIR']
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, f'{job.id}.pdf')
+        with span('pdf.job'):
+            render_expense_pdf(expenses, user.realname, out_path, progress)
+
+        job.status      = JOB_DONE
+        job.result_path = out_path
+        # 生成文件名始终为'报销单_日期.pdf'，不包含用户名
+        job.filename    = f'报销单_{datetime.now().strftime("%Y%m%d")}.pdf'
+    except Exception as exc:
+        db.session.rollback()
+        job.status = JOB_FAILED
+        job.error  = str(exc)[:500]
+    job.finished_at = datetime.now()
+    job.active_slot = None                  # 释放该用户的名额
+    db.session.commit()
+
+
+def cleanup():
+    now = datetime.now()
+    # 进程崩溃遗留的 running 任务：心跳停了才算（升级前领取的任务没有心跳，按开始时间）
+    stale = now - timedelta(seconds=app.config['SOFFICE_JOB_TIMEOUT'] * 3)
+    (PdfJob.query.filter(PdfJob.status==JOB_RUNNING,
+                         func.coalesce(PdfJob.heartbeat_at, PdfJob.started_at) < stale)
+     .update({'status': JOB_FAILED, 'error': '任务中断，请重新生成', 'finished_at': now,
+              'active_slot': None},
+             synchronize_session=False))
+    # 过期任务及其文件
+    expired = now - timedelta(hours=app.config['PDF_JOB_RETENTION_HOURS'])
+    for job in PdfJob.query.filter(PdfJob.created_at < expired,
+                                   PdfJob.status.in_([JOB_DONE, JOB_FAILED])).all():
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        # 生成中途进程被杀时留下的半成品（见 pdf_export.SheetWriter）
+        partial = os.path.join(app.config['PDF_JOB_DIR'], f'{job.id}.pdf.part')
+        if os.path.exists(partial):
+            os.remove(partial)
+        db.session.delete(job)
+    db.session.commit()
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        warm_up_pdf_pipeline()
+        last_cleanup = 0
+        while True:
+            try:
+                if time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                    cleanup()
+                    last_cleanup = time.monotonic()
+                job = claim_next_job()
+                if job:
+                    run_job(job)
+                    flush_metrics(app.config['METRICS_DIR'])
+                else:
+                    time.sleep(app.config['PDF_JOB_POLL_INTERVAL'])
+            except OperationalError:
+                # 执行到一半的任务停在 running，由 cleanup 按超时标记为失败
+                app.logger.exception('数据库不可用，%d 秒后重试', DB_RETRY_INTERVAL)
+                db.session.rollback()
+                time.sleep(DB_RETRY_INTERVAL)
+            finally:
+                db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
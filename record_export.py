@@ -0,0 +1,198 @@
+"""
+报销记录导出：CSV / XLSX 边查边写。
+
+两种格式都是生成器，每处理 chunk_rows 行向响应吐出一段字节，内存占用与导出行数无关：
+- CSV：UTF-8 带 BOM（Excel 直接双击打开不乱码）；以 = + - @ 开头的文本前加 '，防止被当成公式
+- XLSX：不依赖 openpyxl，直接按 SpreadsheetML 写一个只有一张表的最小工作簿；
+  zip 写到不可 seek 的管道上（每个文件带 data descriptor），工作表 XML 边写边压缩
+
+行的取值类型决定单元格格式：Decimal -> 两位小数，date -> yyyy-mm-dd，
+int / float -> 数字，None -> 空，其余按文本。footer() 在全部行写完后调用，返回合计行。
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# XML 1.0 不允许的控制字符（报销说明里偶尔会粘进来）
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_EXCEL_EPOCH = date(1899, 12, 30)
+
+
+# ------------------- CSV -------------------
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows, footer=None, chunk_rows=1000):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    yield '\ufeff'.encode('utf-8') + buf.getvalue().encode('utf-8')
+    buf.seek(0), buf.truncate()
+
+    n = 0
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row])
+        n += 1
+        if n % chunk_rows == 0:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0), buf.truncate()
+    if footer:
+        writer.writerow([_csv_value(v) for v in footer()])
+    yield buf.getvalue().encode('utf-8')
+
+
+# ------------------- XLSX -------------------
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>')
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>')
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>')
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>')
+
+# cellXfs：0 默认，1 金额（0.00），2 日期（yyyy-mm-dd），3 表头 / 合计行（粗体）
+_STYLE_AMOUNT, _STYLE_DATE, _STYLE_BOLD = 1, 2, 3
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="2" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="2" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '</styleSheet>')
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>')
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _Pipe:
+    """zipfile 的写入目标：没有 tell / seek，zipfile 会按流式方式写（data descriptor）。"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cell(value, bold=False):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, Decimal):
+        return f'<c s="{_STYLE_BOLD if bold else _STYLE_AMOUNT}"><v>{value}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, date):
+        if isinstance(value, datetime):
+            value = value.date()
+        return f'<c s="{_STYLE_DATE}"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    style = f' s="{_STYLE_BOLD}"' if bold else ''
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(index, values, bold=False):
+    return f'<row r="{index}">' + ''.join(_cell(v, bold) for v in values) + '</row>'
+
+
+def stream_xlsx(header, rows, footer=None, chunk_rows=1000, sheet_name='报销记录'):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name, {'"': '&quot;'})))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        zf.writestr('xl/styles.xml', _STYLES)
+        yield pipe.drain()
+
+        # 行数事先未知，按 zip64 写，超过 4 GB 也不出错
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            parts = [_SHEET_HEAD, _row(1, header, bold=True)]
+            index = 1
+            for row in rows:
+                index += 1
+                parts.append(_row(index, row))
+                if index % chunk_rows == 0:
+                    sheet.write(''.join(parts).encode('utf-8'))
+                    parts.clear()
+                    yield pipe.drain()
+            if footer:
+                parts.append(_row(index + 1, footer(), bold=True))
+            parts.append(_SHEET_TAIL)
+            sheet.write(''.join(parts).encode('utf-8'))
+        yield pipe.drain()
+    yield pipe.drain()                      # 中央目录
+
+
+EXPORT_FORMATS = {
+    'csv':  (stream_csv,  'text/csv; charset=utf-8'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
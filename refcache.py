@@ -0,0 +1,90 @@
+"""
+参考数据（报销类型、用户名录）的进程内缓存。
+
+这些表很小、几乎不变，但几乎每个页面都要整表查一次。这里把查询结果缓存在进程内，
+用磁盘上的版本戳文件在多个 gunicorn worker 之间同步失效：
+- 修改参考数据并提交后调用 bump(name)，原子替换 <stamp_dir>/<name>.stamp
+- get(name) 先 stat 版本戳（不查库），与缓存时记下的不一致就重新加载
+- 另设 TTL 兜底：多台机器不共享 instance 目录、或有人直接改库时，最多延迟 ttl 秒
+
+缓存的是 namedtuple 等普通值而不是 ORM 对象，跨请求使用不会碰到已关闭的 session。
+hits / misses / reloads 为进程内计数。
+"""
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+class RefCache:
+    def __init__(self, stamp_dir, ttl=300, logger=None):
+        self.stamp_dir = Path(stamp_dir)
+        self.ttl       = ttl
+        self.logger    = logger
+        self._loaders  = {}
+        self._entries  = {}            # name -> (版本戳, 加载时间, 值)
+        self._counts   = {}            # name -> {'hits', 'misses', 'reloads'}
+        self._lock     = threading.Lock()
+
+    def register(self, name, loader):
+        """loader() 在 app context 中调用，返回要缓存的值（不要返回 ORM 对象）。"""
+        self._loaders[name] = loader
+        self._counts[name]  = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    # ---------- 版本戳 ----------
+    def _stamp_path(self, name):
+        return self.stamp_dir / f'{name}.stamp'
+
+    def _stamp(self, name):
+        try:
+            st = os.stat(self._stamp_path(name))
+        except FileNotFoundError:
+            return None
+        # bump 每次都换新文件，inode 变化；mtime 精度不够时也能区分
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def bump(self, *names):
+        """参考数据已修改（在 commit 之后调用），让所有进程的缓存失效。"""
+        self.stamp_dir.mkdir(parents=True, exist_ok=True)
+        for name in names:
+            path = self._stamp_path(name)
+            tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}')
+            tmp.write_text(uuid.uuid4().hex)
+            os.replace(tmp, path)
+
+    # ---------- 读取 ----------
+    def get(self, name):
+        stamp = self._stamp(name)
+        now   = time.monotonic()
+        entry = self._entries.get(name)
+        counts = self._counts[name]
+        if entry and entry[0] == stamp and now - entry[1] < self.ttl:
+            with self._lock:
+                counts['hits'] += 1
+            return entry[2]
+
+        # 先取版本戳再加载：加载期间又被 bump 的话，下一次 get 会再加载一遍
+        value = self._loaders[name]()
+        with self._lock:
+            counts['misses'] += 1
+            if entry:
+                counts['reloads'] += 1
+            self._entries[name] = (stamp, now, value)
+        if entry and self.logger:
+            self.logger.info('参考数据 %s 已重新加载（%s，命中率 %.1f%%）', name,
+                             '版本戳变化' if entry[0] != stamp else 'TTL 到期',
+                             self.hit_rate(name) * 100)
+        return value
+
+    # ---------- 统计 ----------
+    def hit_rate(self, name):
+        counts = self._counts[name]
+        total = counts['hits'] + counts['misses']
+        return counts['hits'] / total if total else 0.0
+
+    def stats(self):
+        """{name: {'hits', 'misses', 'reloads', 'hit_rate'}}"""
+        with self._lock:
+            return {name: dict(counts, hit_rate=self.hit_rate(name))
+                    for name, counts in self._counts.items()}
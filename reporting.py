@@ -0,0 +1,207 @@
+"""
+报销统计：按 (月份, 类型, 报销人, 状态) 预聚合的 expense_rollup 表。
+
+- 维护：提交 / 审批 / 编辑 / 删除报销单时，在同一事务内调用 apply_rollup 增减对应行的
+  条数和金额；事务回滚（如乐观锁冲突）时汇总也一起回滚，不会与 expense 表不一致
+- 查询：统计页和 /api/rollups 只读汇总表，行数取决于 月份 × 类型 × 人数，与报销单总量无关
+- 重建：rebuild_rollups 从 expense 表整体重算；check_rollups 对比两边找出偏差
+
+    python reporting.py check      # 对比汇总表与 expense 表的实时聚合
+    python reporting.py rebuild    # 从 expense 表重建汇总表（建议在业务低峰执行）
+"""
+import sys
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import bindparam, delete, extract, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Expense, ExpenseRollup
+
+RollupRow = namedtuple('RollupRow', 'month type_id submitter_id status amount')
+
+# 查询时可用的分组维度
+DIMENSIONS = ('month', 'type', 'submitter', 'status')
+_COLUMNS = {'month': 'month', 'type': 'type_id', 'submitter': 'submitter_id', 'status': 'status'}
+
+
+def month_start(d):
+    return d.replace(day=1)
+
+
+def rollup_row(expense, status=None):
+    """
+    报销单在汇总表中对应的键和金额。expense 可以是 Expense 对象，
+    也可以是带 date / type_id / submitter_id / amount 列的查询结果行（此时需传入 status）。
+    """
+    return RollupRow(month_start(expense.date), expense.type_id, expense.submitter_id,
+                     status or expense.status, Decimal(expense.amount))
+
+
+# ------------------- 增量维护（在调用方的事务中执行） -------------------
+def apply_rollup(added=(), removed=()):
+    """
+    added / removed 为 RollupRow 列表：各自计 +1 / -1 条及对应金额。不提交事务。
+    不论涉及多少个汇总行，都只发固定几条语句（批量审批时键可能有上百个）：
+    加锁读出已存在的行 -> executemany 更新 -> 批量插入新行 -> 删除条数归零的行。
+    """
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for sign, rows in ((1, added), (-1, removed)):
+        for row in rows:
+            delta = deltas[row[:4]]
+            delta[0] += sign
+            delta[1] += sign * row.amount
+    deltas = {key: d for key, d in deltas.items() if d[0] or d[1]}
+    if not deltas:
+        return
+
+    rollup = ExpenseRollup.__table__
+    key_cols = (rollup.c.month, rollup.c.type_id, rollup.c.submitter_id, rollup.c.status)
+    # SQL Server 不支持 (a, b) IN (...)，按各列取值的笛卡尔积查出超集再在本地过滤；
+    # FOR UPDATE 锁住这些行，防止在更新前被并发事务删除
+    scope = [col.in_(sorted({key[i] for key in deltas})) for i, col in enumerate(key_cols)]
+    existing = {tuple(row) for row in db.session.execute(select(*key_cols).where(*scope)
+                                                         .with_for_update())} & set(deltas)
+
+    def params(key):
+        count, amount = deltas[key]
+        return {'k_month': key[0], 'k_type_id': key[1], 'k_submitter_id': key[2], 'k_status': key[3],
+                'd_count': count, 'd_amount': amount}
+
+    bump = (update(rollup)
+            .where(*[col == bindparam(f'k_{col.name}') for col in key_cols])
+            .values(count=rollup.c.count + bindparam('d_count'),
+                    amount=rollup.c.amount + bindparam('d_amount')))
+    if existing:
+        db.session.execute(bump, [params(key) for key in sorted(existing)])
+    missing = sorted(set(deltas) - existing)
+    if missing:
+        rows = [{'month': key[0], 'type_id': key[1], 'submitter_id': key[2], 'status': key[3],
+                 'count': deltas[key][0], 'amount': deltas[key][1]} for key in missing]
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(rollup), rows)
+        except IntegrityError:                      # 并发事务刚插入了其中某行：逐行处理
+            for key in missing:
+                _bump_one(bump, key, params(key))
+    if any(count < 0 for count, _ in deltas.values()):
+        # 不保留空行，删除报销类型后汇总里也不会残留它
+        db.session.execute(delete(rollup).where(*scope, rollup.c.count <= 0))
+
+
+def _bump_one(bump, key, params):
+    if db.session.execute(bump, params).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(ExpenseRollup.__table__).values(
+                month=key[0], type_id=key[1], submitter_id=key[2], status=key[3],
+                count=params['d_count'], amount=params['d_amount']))
+    except IntegrityError:
+        db.session.execute(bump, params)
+
+
+# ------------------- 重建 / 校验 -------------------
+def _live_rollups(conn):
+    """从 expense 表实时聚合，返回 {(month, type_id, submitter_id, status): (count, amount)}。"""
+    e = Expense.__table__
+    year, month = extract('year', e.c.date), extract('month', e.c.date)
+    query = (select(year, month, e.c.type_id, e.c.submitter_id, e.c.status,
+                    func.count(e.c.id), func.sum(e.c.amount))
+             .where(e.c.submitter_id.is_not(None), e.c.status.is_not(None))
+             .group_by(year, month, e.c.type_id, e.c.submitter_id, e.c.status))
+    return {(date(int(y), int(m), 1), type_id, submitter_id, status): (count, Decimal(amount or 0))
+            for y, m, type_id, submitter_id, status, count, amount in conn.execute(query)}
+
+
+def rebuild_rollups(engine, batch=1000):
+    """清空并从 expense 表重算汇总表，返回写入的行数。"""
+    rollup = ExpenseRollup.__table__
+    with engine.begin() as conn:
+        # 先清空：期间并发的 apply_rollup 会等本事务提交，不会被重算结果覆盖掉
+        conn.execute(delete(rollup))
+        rows = [{'month': month, 'type_id': type_id, 'submitter_id': submitter_id, 'status': status,
+                 'count': count, 'amount': amount}
+                for (month, type_id, submitter_id, status), (count, amount)
+                in _live_rollups(conn).items()]
+        for i in range(0, len(rows), batch):
+            conn.execute(insert(rollup), rows[i:i + batch])
+    return len(rows)
+
+
+def check_rollups(engine):
+    """对比汇总表与实时聚合，返回不一致的 [(键, 汇总表中的值, 实际值)]。"""
+    rollup = ExpenseRollup.__table__
+    with engine.connect() as conn:
+        live = _live_rollups(conn)
+        stored = {(month, type_id, submitter_id, status): (count, Decimal(amount))
+                  for month, type_id, submitter_id, status, count, amount
+                  in conn.execute(select(rollup))}
+    return [(key, stored.get(key), live.get(key))
+            for key in sorted(set(live) | set(stored))
+            if stored.get(key) != live.get(key)]
+
+
+def ensure_rollups(engine):
+    """升级步骤：汇总表为空而已有报销单时（首次部署）从 expense 表生成。"""
+    with engine.connect() as conn:
+        if conn.execute(select(ExpenseRollup.month).limit(1)).first() is not None:
+            return []
+        if conn.execute(select(Expense.id).limit(1)).first() is None:
+            return []
+    return [f'生成 {rebuild_rollups(engine)} 行月度汇总']
+
+
+# ------------------- 查询 -------------------
+def query_rollups(group_by=('month',), start=None, end=None, statuses=None, type_id=None,
+                  submitter_id=None, order_by_amount=False, limit=None):
+    """
+    按 group_by 中的维度（见 DIMENSIONS）汇总条数和金额，返回行列表，
+    每行依次为各维度的值、count、amount。start / end 为月份（当月 1 日），均包含在内。
+    """
+    rollup = ExpenseRollup.__table__
+    cols = [rollup.c[_COLUMNS[g]] for g in group_by]
+    total = func.sum(rollup.c.amount)
+    query = select(*cols, func.sum(rollup.c.count).label('count'), total.label('amount'))
+    if cols:
+        query = query.group_by(*cols)
+    if start:
+        query = query.where(rollup.c.month >= start)
+    if end:
+        query = query.where(rollup.c.month <= end)
+    if statuses:
+        query = query.where(rollup.c.status.in_(list(statuses)))
+    if type_id:
+        query = query.where(rollup.c.type_id == type_id)
+    if submitter_id:
+        query = query.where(rollup.c.submitter_id == submitter_id)
+    query = query.order_by(total.desc()) if order_by_amount else query.order_by(*cols)
+    if limit:
+        query = query.limit(limit)
+    return db.session.execute(query).all()
+
+
+# --------------------------------------------------
+#                    命令行
+# --------------------------------------------------
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='报销月度汇总表维护')
+    parser.add_argument('command', choices=['check', 'rebuild'])
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        if args.command == 'rebuild':
+            print(f'已重建，共 {rebuild_rollups(db.engine)} 行')
+            return 0
+        diffs = check_rollups(db.engine)
+        for key, stored, live in diffs[:50]:
+            print(f'  {key}: 汇总表 {stored} / 实际 {live}')
+        print(f'{len(diffs)} 处不一致' if diffs else '汇总表与报销单一致')
+        return 1 if diffs else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
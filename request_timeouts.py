@@ -0,0 +1,113 @@
+"""
+按路由的请求时限。
+
+gunicorn 的 timeout 只有一个值，在 gthread worker 下只用来判断 worker 进程是否还活着
+（心跳在主循环里发，与单个请求跑多久无关），限制不了单个请求。这里在应用内给每个请求一个截止时间：
+
+- 默认 REQUEST_TIMEOUT 秒，ROUTE_TIMEOUTS（endpoint -> 秒）给导出、上传等长请求单独的时限，0 为不限
+- 每条 SQL 的超时设为剩余时间：SQL Server（pyodbc）用连接的 query timeout，
+  SQLite 用 progress handler 中断；截止时间已过则不再执行新的语句
+- 因此失败的请求返回 504
+
+只能中断数据库语句，不打断 Python 代码本身（Word 渲染、soffice 转换有各自的超时）；
+流式导出（stream_results / yield_per）只限制查询语句的执行，不限制之后逐批取数据和发送：
+SQLite 边取边执行，progress handler 在取数据时也会触发，所以这类语句执行后就清掉截止时间。
+
+    ROUTE_TIMEOUTS="export_records=900,submit_expense=600"   # 环境变量覆盖默认表
+"""
+import math
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from werkzeug.exceptions import GatewayTimeout
+
+TIMEOUT_MESSAGE = '请求处理超时，请缩小查询范围后重试'
+
+_NO_DEADLINE = math.inf
+_DEADLINE_KEY = 'request_deadline'
+_SQLITE_PROGRESS_STEPS = 10000          # 每执行这么多条虚拟机指令检查一次截止时间
+
+
+def parse_route_timeouts(value):
+    """"endpoint=秒,endpoint=秒" -> {endpoint: 秒}。"""
+    timeouts = {}
+    for item in value.split(','):
+        if item.strip():
+            endpoint, _, seconds = item.partition('=')
+            timeouts[endpoint.strip()] = float(seconds)
+    return timeouts
+
+
+def request_deadline():
+    """当前请求的截止时间（time.monotonic()），不在请求中或不限时为 inf。"""
+    if not has_request_context():
+        return _NO_DEADLINE
+    return g.get('deadline', _NO_DEADLINE)
+
+
+def _remaining():
+    deadline = request_deadline()
+    if deadline == _NO_DEADLINE:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise GatewayTimeout(TIMEOUT_MESSAGE)
+    return remaining
+
+
+# ------------------- 数据库语句超时 -------------------
+def _sqlite_connect(dbapi_connection, connection_record):
+    # progress handler 在连接建立时装一次，截止时间放在连接记录的 info 里按语句更新
+    if not hasattr(dbapi_connection, 'set_progress_handler'):
+        return
+    info = connection_record.info
+    dbapi_connection.set_progress_handler(
+        lambda: time.monotonic() > info.get(_DEADLINE_KEY, _NO_DEADLINE), _SQLITE_PROGRESS_STEPS)
+
+
+def _before_execute(conn, clauseelement, multiparams, params, execution_options):
+    # pyodbc 在创建游标时读取连接的 timeout，所以要在游标创建之前（before_execute）设置
+    remaining = _remaining()
+    if conn.dialect.driver == 'pyodbc':
+        conn.connection.dbapi_connection.timeout = math.ceil(remaining) if remaining else 0
+    elif conn.dialect.name == 'sqlite':
+        conn.info[_DEADLINE_KEY] = request_deadline()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # ORM flush 等内部语句不经过 before_execute，这里再检查一次，并清掉上一个请求留下的截止时间
+    if conn.dialect.name == 'sqlite':
+        conn.info[_DEADLINE_KEY] = request_deadline()
+    _remaining()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 流式结果之后逐批取数据时 SQLite 仍在执行这条语句，不能让截止时间把响应中途打断
+    if conn.dialect.name == 'sqlite' and context.execution_options.get('stream_results'):
+        conn.info[_DEADLINE_KEY] = _NO_DEADLINE
+
+
+def init_request_timeouts(app):
+    for name, listener in (('connect', _sqlite_connect),
+                           ('before_execute', _before_execute),
+                           ('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+    @app.before_request
+    def start_request_deadline():
+        seconds = app.config['ROUTE_TIMEOUTS'].get(request.endpoint, app.config['REQUEST_TIMEOUT'])
+        if seconds:
+            g.deadline = time.monotonic() + seconds
+
+    @app.errorhandler(OperationalError)
+    def database_timeout(exc):
+        # 语句被超时中断（pyodbc 的 HYT00 / SQLite 的 interrupted）时截止时间一定已过；其他数据库错误照旧 500
+        if request_deadline() <= time.monotonic():
+            app.logger.warning('%s %s 超过时限，语句被中断', request.method, request.path)
+            return GatewayTimeout(TIMEOUT_MESSAGE)
+        raise exc
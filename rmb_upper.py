@@ -0,0 +1,108 @@
+"""
+金额转中文大写（报销单、导出合计用）。
+
+- 全程按分的整数计算：float 先取 repr 再转 Decimal，四舍五入到分（ROUND_HALF_UP），
+  不受二进制浮点误差影响
+- 整数部分每 4 位一节：节内 仟佰拾，节间 万 / 亿，亿以上继续 万亿、亿亿，不设上限；
+  节内和节间的连续零只读一个"零"（100100 -> 壹拾万零壹佰元）
+- 角分的写法与原实现保持一致：无角分写"整"，角为零时不补"零"（1.05 -> 壹元伍分）
+
+    num_to_rmb_upper(1234.56)                     # 壹仟贰佰叁拾肆元伍角陆分
+    nums_to_rmb_upper([Decimal('10'), 0.5, 10])  # 一列金额一次转换
+"""
+from decimal import ROUND_HALF_UP, Context, Decimal
+from functools import lru_cache
+
+_DIGITS = '零壹贰叁肆伍陆柒捌玖'
+_SECTION_UNITS = ('', '拾', '佰', '仟')
+# 默认精度 28 位，超过约 10^26 的金额 scaleb 会丢位；报销金额用不到，放宽到 60 位
+_CONTEXT = Context(prec=60, rounding=ROUND_HALF_UP)
+
+
+def to_cents(num):
+    """int / float / Decimal / 数字字符串 -> 以分为单位的整数（四舍五入）。"""
+    if not isinstance(num, Decimal):
+        if isinstance(num, int):
+            return num * 100
+        num = Decimal(repr(num)) if isinstance(num, float) else Decimal(num)
+    return int(num.scaleb(2, _CONTEXT).to_integral_value(ROUND_HALF_UP))
+
+
+@lru_cache(maxsize=None)
+def _section(n):
+    """1 ~ 9999 的读法（不含节单位），最多 9999 项，按需缓存。"""
+    words, zero = [], False
+    for pos in (3, 2, 1, 0):
+        d = n // 10 ** pos % 10
+        if not d:
+            zero = True
+            continue
+        if zero and words:
+            words.append('零')
+        words.append(_DIGITS[d] + _SECTION_UNITS[pos])
+        zero = False
+    return ''.join(words)
+
+
+def _integer(n):
+    if n < 10000:
+        return _section(n) if n else '零'
+    if n < 10 ** 8:                             # 1 亿以下（绝大多数金额）：万、个两节
+        high, low = divmod(n, 10000)
+        if not low:
+            return _section(high) + '万'
+        return _section(high) + ('万零' if low < 1000 else '万') + _section(low)
+    sections = []
+    while n:
+        n, s = divmod(n, 10000)
+        sections.append(s)
+    words, gap = [], False
+    for k in range(len(sections) - 1, -1, -1):
+        s = sections[k]
+        if s:
+            # 前面已有数字，且本节不满 4 位或中间隔着全零的节：补一个"零"
+            if words and (gap or s < 1000):
+                words.append('零')
+            words.append(_section(s))
+            if k % 2:
+                words.append('万')
+            gap = False
+        else:
+            gap = True
+        # 每两节（8 位）一个"亿"；本节和上一节（万）都为零时不读
+        if k and not k % 2 and (s or (k + 1 < len(sections) and sections[k + 1])):
+            words.append('亿' * (k // 2))
+    return ''.join(words)
+
+
+def _fraction(cents):
+    """0 ~ 99 分的写法。"""
+    if not cents:
+        return '整'
+    jiao, fen = divmod(cents, 10)
+    return (_DIGITS[jiao] + '角' if jiao else '') + (_DIGITS[fen] + '分' if fen else '')
+
+
+_FRACTIONS = [_fraction(i) for i in range(100)]
+
+
+@lru_cache(maxsize=4096)
+def _from_cents(cents):
+    if cents < 0:
+        return '负' + _from_cents(-cents)
+    integer, fraction = divmod(cents, 100)
+    return _integer(integer) + '元' + _FRACTIONS[fraction]
+
+
+def num_to_rmb_upper(num):
+    """
+    数字金额转中文大写金额（支持到分）
+    1234.56 -> 壹仟贰佰叁拾肆元伍角陆分
+    """
+    return _from_cents(to_cents(num))
+
+
+def nums_to_rmb_upper(amounts):
+    """一列金额 -> 同样顺序的大写列表（导出、批量生成 PDF 用）；相同金额命中缓存，只换算一次。"""
+    convert, cents = _from_cents, to_cents
+    return [convert(cents(num)) for num in amounts]
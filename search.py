@@ -0,0 +1,271 @@
+"""
+报销单全文检索：标题、说明、驳回理由。
+
+分词在 Python 里完成，两种数据库存的都是分好词、以空格分隔的文本，行为一致：
+- 连续汉字切成二元组（"出租车费" -> 出租 租车 车费），末字另存一个单字，
+  这样单字查询可以用前缀匹配（"车*" 命中 车费 / 车）
+- 字母数字按词切分并转小写；先做 NFKC 规范化，全角字母数字与半角等同
+
+查询时每个词按同样方式切分，汉字部分作为短语（二元组必须相邻，等价于子串匹配），
+多个词之间是 AND；字母数字词按前缀匹配。
+
+存储：
+- SQLite：FTS5 虚拟表 expense_fts（rowid = expense.id），bm25 排序，标题权重最高
+- SQL Server：影子表 expense_search + 全文索引（中性语言断词、不用停用词表），
+  CONTAINSTABLE 的 RANK 排序；全文索引由 SQL Server 异步填充，写入后通常几秒内可查到
+- 其他数据库：退化为 LIKE 查询原表
+
+索引随报销单的提交 / 编辑 / 审批 / 删除在同一事务内更新（见 app.py）。
+
+    python search.py rebuild       # 从 expense 表重建索引
+    python search.py query 北京 出租车
+"""
+import re
+import sys
+import unicodedata
+
+from sqlalchemy import (Column, Float, Integer, MetaData, Table, UnicodeText, and_, delete, insert,
+                        inspect, or_, select, text, update)
+
+from models import db, Expense
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|([0-9a-z\u00c0-\u024f]+)')
+
+# 不进 models.py：这两张表只在对应数据库上存在，不能交给 db.create_all()
+_meta = MetaData()
+FTS5_TABLE = Table('expense_fts', _meta,
+                   Column('rowid', Integer, primary_key=True),
+                   Column('title', UnicodeText),
+                   Column('description', UnicodeText),
+                   Column('reject_reason', UnicodeText))
+MSSQL_TABLE = Table('expense_search', _meta,
+                    Column('expense_id', Integer, primary_key=True),
+                    Column('title', UnicodeText),
+                    Column('description', UnicodeText),
+                    Column('reject_reason', UnicodeText))
+MSSQL_CATALOG = 'baoxiao_ft'
+
+# bm25 列权重：标题 > 驳回理由 > 说明
+FTS5_WEIGHTS = (3.0, 1.0, 2.0)
+
+
+# ------------------- 分词 -------------------
+def tokenize(value):
+    """文本 -> 词列表（见模块说明）。"""
+    if not value:
+        return []
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(unicodedata.normalize('NFKC', value).lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+    return tokens
+
+
+def index_text(value):
+    return ' '.join(tokenize(value))
+
+
+def _query_terms(q):
+    """用户输入 -> [(词元列表, 是否前缀匹配)]，每项对应一个 AND 条件。"""
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(unicodedata.normalize('NFKC', q or '').lower()):
+        if word:
+            terms.append(([word], True))
+        elif len(cjk) == 1:
+            terms.append(([cjk], True))
+        else:
+            terms.append(([cjk[i:i + 2] for i in range(len(cjk) - 1)], False))
+    return terms
+
+
+def match_expression(q, dialect):
+    """生成 FTS5 MATCH / CONTAINSTABLE 查询串；没有可检索的词时返回 None。"""
+    parts = []
+    for tokens, prefix in _query_terms(q):
+        phrase = ' '.join(tokens)
+        if dialect == 'sqlite':
+            parts.append(f'"{phrase}"*' if prefix else f'"{phrase}"')
+        else:
+            parts.append(f'"{phrase}*"' if prefix else f'"{phrase}"')
+    return ' AND '.join(parts) or None
+
+
+# ------------------- 后端 -------------------
+def _dialect(bind=None):
+    return (bind or db.session.get_bind()).dialect.name
+
+
+def _table(dialect):
+    return {'sqlite': FTS5_TABLE, 'mssql': MSSQL_TABLE}.get(dialect)
+
+
+def _rows(expenses):
+    return [{'id': e.id, 'title': index_text(e.title), 'description': index_text(e.description),
+             'reject_reason': index_text(e.reject_reason)} for e in expenses]
+
+
+def _insert(table, rows):
+    key = list(table.c)[0]
+    return insert(table), [{key.name: r['id'], 'title': r['title'], 'description': r['description'],
+                            'reject_reason': r['reject_reason']} for r in rows]
+
+
+# ------------------- 随写入更新（在调用方的事务中执行，不提交） -------------------
+def index_expenses(expenses):
+    """新增或修改后的报销单（需已 flush 得到 id）写入索引。"""
+    table = _table(_dialect())
+    expenses = list(expenses)
+    if table is None or not expenses:
+        return
+    key = list(table.c)[0]
+    db.session.execute(delete(table).where(key.in_([e.id for e in expenses])))
+    db.session.execute(*_insert(table, _rows(expenses)))
+
+
+def set_reject_reason(ids, reason):
+    """审批 / 驳回后只更新驳回理由一列。"""
+    table = _table(_dialect())
+    if table is None or not ids:
+        return
+    key = list(table.c)[0]
+    db.session.execute(update(table).where(key.in_(list(ids))).values(reject_reason=index_text(reason)))
+
+
+def remove_expenses(ids):
+    table = _table(_dialect())
+    if table is None or not ids:
+        return
+    key = list(table.c)[0]
+    db.session.execute(delete(table).where(key.in_(list(ids))))
+
+
+# ------------------- 查询 -------------------
+def ranked_matches(q, bind=None):
+    """
+    匹配 q 的报销单 (id, score) 子查询，score 越大越相关；q 中没有可检索的词时返回 None。
+    可直接用于 Expense.id.in_(select(sub.c.id)) 或 join 后按 score 排序。
+    """
+    dialect = _dialect(bind)
+    expr = match_expression(q, dialect)
+    if expr is None:
+        return None
+    if dialect == 'sqlite':
+        weights = ', '.join(str(w) for w in FTS5_WEIGHTS)
+        stmt = text(f'SELECT rowid AS id, -bm25(expense_fts, {weights}) AS score '
+                    'FROM expense_fts WHERE expense_fts MATCH :fts_query')
+    elif dialect == 'mssql':
+        stmt = text('SELECT [KEY] AS id, RANK AS score FROM CONTAINSTABLE('
+                    'expense_search, (title, description, reject_reason), :fts_query)')
+    else:
+        # 没有全文索引：逐个词 LIKE 原文（各词都要出现在某一列中）
+        conds = []
+        for word in q.split():
+            pattern = f'%{word}%'
+            conds.append(or_(Expense.title.like(pattern), Expense.description.like(pattern),
+                             Expense.reject_reason.like(pattern)))
+        return select(Expense.id.label('id'), Expense.id.label('score')).where(and_(*conds)).subquery()
+    return stmt.bindparams(fts_query=expr).columns(id=Integer, score=Float).subquery()
+
+
+def filter_by_keywords(query, q):
+    """在报销单 query 上加关键词条件（filter_records 用）；q 为空或没有可检索的词时原样返回。"""
+    matches = ranked_matches(q) if q and q.strip() else None
+    if matches is None:
+        return query
+    return query.filter(Expense.id.in_(select(matches.c.id)))
+
+
+# ------------------- 建立 / 重建 -------------------
+def _create(engine):
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5('
+                                 "title, description, reject_reason, tokenize = 'unicode61')")
+    elif dialect == 'mssql':
+        MSSQL_TABLE.create(engine, checkfirst=True)
+        key_index = inspect(engine).get_pk_constraint(MSSQL_TABLE.name)['name']
+        # 全文目录 / 索引的 DDL 不能放在事务里
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{MSSQL_CATALOG}') "
+                f'CREATE FULLTEXT CATALOG {MSSQL_CATALOG}')
+            conn.exec_driver_sql(
+                "IF NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('expense_search')) "
+                'CREATE FULLTEXT INDEX ON expense_search '
+                '(title LANGUAGE 0, description LANGUAGE 0, reject_reason LANGUAGE 0) '
+                f'KEY INDEX {key_index} ON {MSSQL_CATALOG} '
+                'WITH CHANGE_TRACKING AUTO, STOPLIST = OFF')
+
+
+def rebuild_search_index(engine, batch=5000):
+    """清空并从 expense 表重建索引，返回索引的报销单数。"""
+    table = _table(engine.dialect.name)
+    if table is None:
+        return 0
+    _create(engine)
+    e = Expense.__table__
+    n = 0
+    with engine.begin() as conn:
+        conn.execute(delete(table))
+        result = conn.execution_options(yield_per=batch).execute(
+            select(e.c.id, e.c.title, e.c.description, e.c.reject_reason))
+        for chunk in result.partitions():
+            conn.execute(*_insert(table, _rows(chunk)))
+            n += len(chunk)
+        if engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql("INSERT INTO expense_fts(expense_fts) VALUES ('optimize')")
+    return n
+
+
+def ensure_search_index(engine):
+    """升级步骤：建立索引结构；索引为空而已有报销单时（首次部署）整体建立。"""
+    table = _table(engine.dialect.name)
+    if table is None:
+        return []
+    _create(engine)
+    with engine.connect() as conn:
+        if conn.execute(select(list(table.c)[0]).limit(1)).first() is not None:
+            return []
+        if conn.execute(select(Expense.id).limit(1)).first() is None:
+            return []
+    return [f'全文索引 {rebuild_search_index(engine)} 条报销单']
+
+
+# --------------------------------------------------
+#                    命令行
+# --------------------------------------------------
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='报销单全文检索')
+    parser.add_argument('command', choices=['rebuild', 'query'])
+    parser.add_argument('words', nargs='*')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        if args.command == 'rebuild':
+            print(f'已重建，共索引 {rebuild_search_index(db.engine)} 条报销单')
+            return 0
+        q = ' '.join(args.words)
+        matches = ranked_matches(q)
+        if matches is None:
+            print('没有可检索的词')
+            return 1
+        rows = db.session.execute(select(Expense.id, Expense.date, Expense.title, matches.c.score)
+                                  .join(matches, matches.c.id == Expense.id)
+                                  .order_by(matches.c.score.desc(), Expense.id.desc()).limit(20)).all()
+        for row in rows:
+            print(f'  #{row.id:<8} {row.date}  {row.score:8.3f}  {row.title}')
+        print(f'{match_expression(q, db.engine.dialect.name)}：前 {len(rows)} 条')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
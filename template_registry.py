@@ -0,0 +1,111 @@
+"""
+docx 模板注册表：每个进程只读取、解析一次 word_templates/*.docx。
+
+docxtpl 每次渲染都会：解压并解析 docx、对正文 XML 跑一遍 patch_xml 正则清洗、
+再用 jinja2 编译清洗后的 XML。对同一份模板这三步的结果都不会变，
+所以这里缓存已解析的文档对象（渲染时深拷贝一份）、patch_xml 结果和编译好的 jinja 模板。
+模板文件 mtime 变化时自动重新加载。
+"""
+import copy
+import glob
+import os
+import threading
+from io import BytesIO
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+
+class _CachingEnvironment(Environment):
+    """from_string 按源码缓存编译结果。"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._compiled = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        key = (source, template_class)
+        tmpl = self._compiled.get(key) if not globals else None
+        if tmpl is None:
+            tmpl = super().from_string(source, globals, template_class)
+            if not globals:
+                self._compiled[key] = tmpl
+        return tmpl
+
+
+class _PreparedTemplate(DocxTemplate):
+    """patch_xml 结果按源 XML 缓存，缓存字典由同一模板的所有副本共享。"""
+
+    def __init__(self, template_file, patch_cache):
+        super().__init__(template_file)
+        self._patch_cache = patch_cache
+
+    def patch_xml(self, src_xml):
+        patched = self._patch_cache.get(src_xml)
+        if patched is None:
+            patched = self._patch_cache[src_xml] = super().patch_xml(src_xml)
+        return patched
+
+
+class _Entry:
+    __slots__ = ('mtime', 'data', 'parsed', 'patch_cache', 'jinja_env')
+
+    def __init__(self, mtime, data):
+        self.mtime  = mtime
+        self.data   = data
+        self.parsed = DocxTemplate(BytesIO(data))
+        self.parsed.init_docx()
+        self.patch_cache = {}
+        self.jinja_env   = _CachingEnvironment()
+
+
+class TemplateRegistry:
+    def __init__(self, root='word_templates'):
+        self.root = root
+        self._lock    = threading.Lock()
+        self._entries = {}              # 绝对路径 -> _Entry
+
+    def _load(self, path):
+        path  = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get(path)
+        if entry and entry.mtime == mtime:
+            return entry
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry.mtime == mtime:
+                return entry
+            with open(path, 'rb') as f:
+                entry = _Entry(mtime, f.read())
+            self._entries[path] = entry
+            return entry
+
+    def get(self, path):
+        """返回一份可独立渲染的模板副本。"""
+        entry = self._load(path)
+        tpl = _PreparedTemplate(BytesIO(entry.data), entry.patch_cache)
+        tpl.docx = copy.deepcopy(entry.parsed.docx)
+        return tpl
+
+    def render(self, path, context, out):
+        """用模板副本渲染 context 并保存到 out（路径或文件对象）。"""
+        entry = self._load(path)
+        tpl = self.get(path)
+        tpl.render(context, entry.jinja_env)
+        tpl.save(out)
+
+    def preload(self):
+        """加载 root 下的全部 .docx 模板，并空渲染一次填充 patch_xml / jinja 缓存。"""
+        for path in glob.glob(os.path.join(self.root, '*.docx')):
+            try:
+                self.render(path, {}, BytesIO())
+            except Exception:
+                self._load(path)        # 模板不接受空上下文时只做解析
+
+
+templates = TemplateRegistry()
+
+
+def preload_templates():
+    """进程池 initializer：子进程启动时预先加载模板。"""
+    templates.preload()
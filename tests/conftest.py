@@ -0,0 +1,5 @@
+"""测试直接 import 仓库根目录下的模块（app、rmb_upper 等），与从哪个目录运行 pytest 无关。"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
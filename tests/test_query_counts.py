@@ -0,0 +1,107 @@
+"""
+列表页的 SQL 条数上限：渲染时按外键逐行懒加载（N+1）会让条数随行数增长，超过上限即失败。
+
+条数来自 metrics.py 在 TESTING 模式下返回的 X-SQL-Statements 响应头。
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+
+# 当前实现：/records 2 条，/all_records 3 条，/approve 1 条；留一点余量，但远小于行数
+SQL_STATEMENT_BUDGET = 4
+
+SUBMITTERS = 6
+TYPES = ['交通费', '住宿费', '餐费', '办公用品']
+ROWS_PER_SUBMITTER = 40
+
+
+@pytest.fixture(scope='module')
+def client_factory(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('query_counts')
+    with pytest.MonkeyPatch.context() as mp:
+        # app.py 导入时读取连接串，并在当前目录下创建 instance / static 等目录
+        mp.chdir(workdir)
+        mp.setenv('USE_SQLSERVER', '1')
+        mp.setenv('SQLALCHEMY_DATABASE_URI', f'sqlite:///{workdir / "test.db"}')
+        mp.setenv('INVOICE_NORMALIZE', '0')
+        mp.setenv('METRICS_DIR', str(workdir / 'metrics'))      # 进程退出时才写入，那时已不在 workdir
+        import app as appmod
+        from migrations import upgrade
+        from models import db, User, ExpenseType, Expense
+
+        app = appmod.app
+        app.testing = True
+        with app.app_context():
+            db.create_all()
+            finance = User(username='finance', password='x', role='finance', realname='财务')
+            users = [User(username=f'user{i}', password='x', role='user', realname=f'员工{i}')
+                     for i in range(SUBMITTERS)]
+            types = [ExpenseType(name=name) for name in TYPES]
+            db.session.add_all([finance, *users, *types])
+            db.session.flush()
+
+            rnd = random.Random(42)
+            statuses = [appmod.STATUS_PENDING, appmod.STATUS_APPROVED, appmod.STATUS_REJECTED]
+            for user in users:
+                for n in range(ROWS_PER_SUBMITTER):
+                    status = statuses[n % len(statuses)]
+                    db.session.add(Expense(
+                        date=date(2024, 1, 1) + timedelta(days=rnd.randrange(365)),
+                        type_id=rnd.choice(types).id, title=f'测试报销 {n}',
+                        amount=Decimal(rnd.randrange(100, 100000)) / 100, status=status,
+                        submitter_id=user.id, approver_id=finance.id if status != appmod.STATUS_PENDING else None))
+            db.session.commit()
+            upgrade(db.engine)                            # 全文索引、汇总表等按已有数据建好
+            accounts = {'user': (users[0].id, 'user'), 'finance': (finance.id, 'finance')}
+
+        def make_client(account):
+            user_id, role = accounts[account]
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = user_id
+                sess['role'] = role
+                sess['realname'] = account
+            return client
+
+        yield make_client
+
+
+@pytest.mark.parametrize('account, path', [
+    ('user', '/records'),
+    ('finance', '/all_records?page_size=500'),
+    ('finance', '/approve'),
+])
+def test_list_page_sql_statements(client_factory, account, path):
+    client = client_factory(account)
+    client.get(path)                                      # 预热引用数据缓存（报销类型、用户）
+    resp = client.get(path)
+    assert resp.status_code == 200
+    statements = int(resp.headers['X-SQL-Statements'])
+    assert statements <= SQL_STATEMENT_BUDGET, f'{path} 执行了 {statements} 条 SQL'
+
+
+# 提交时全部发票的去重查询、插入、引用计数各只执行一次（当前 1 / 5 / 10 张为 11 / 13 / 18 条，
+# 余下随张数增长的是 ORM 逐行插入 expense）；上限取 app.py 的 SQL_STATEMENT_BUDGET 默认值
+SUBMIT_STATEMENT_BUDGET = 20
+
+
+@pytest.mark.parametrize('files', [1, 5, 10])
+def test_submit_sql_statements(client_factory, files):
+    client = client_factory('user')
+    client.get('/submit')                                 # 预热报销类型缓存
+    rnd = random.Random(files)
+    contents = [b'%PDF-1.4 ' + rnd.randbytes(32) for _ in range(files)]
+    if files > 1:
+        contents[1] = contents[0]                         # 同一张发票上传两次
+    data = {}
+    for idx, content in enumerate(contents, 1):
+        data.update({f'date_{idx}': '2024-03-01', f'type_{idx}': '1', f'title_{idx}': f'提交测试 {idx}',
+                     f'amount_{idx}': '12.50', f'description_{idx}': '',
+                     f'invoice_{idx}': (BytesIO(content), f'发票{idx}.pdf')})
+    resp = client.post('/submit', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 302
+    statements = int(resp.headers['X-SQL-Statements'])
+    assert statements <= SUBMIT_STATEMENT_BUDGET, f'提交 {files} 张发票执行了 {statements} 条 SQL'
@@ -0,0 +1,53 @@
+"""
+request_timeouts 的 SQLite 截止时间：普通语句过时被中断，流式结果取数据时不受截止时间影响。
+"""
+import time
+
+import pytest
+from flask import Flask, g
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from request_timeouts import init_request_timeouts
+
+ROWS = 200000
+BATCH = 1000
+DEADLINE = 0.2
+# 每行都要执行虚拟机指令，取完全部行一定会多次触发 progress handler
+COUNTING = text('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows) '
+                'SELECT i FROM n').bindparams(rows=ROWS)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(REQUEST_TIMEOUT=0, ROUTE_TIMEOUTS={})
+    init_request_timeouts(app)
+    return app
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    yield engine
+    engine.dispose()
+
+
+def test_streaming_fetch_outlives_deadline(app, engine):
+    with app.test_request_context(), engine.connect() as conn:
+        g.deadline = time.monotonic() + DEADLINE
+        result = conn.execution_options(yield_per=BATCH).execute(COUNTING)
+        fetched = len(result.fetchmany(BATCH))
+        time.sleep(DEADLINE * 2)                          # 导出响应发送到一半时请求时限已过
+        fetched += sum(1 for _ in result)
+    assert fetched == ROWS
+
+
+def test_plain_fetch_interrupted_after_deadline(app, engine):
+    with app.test_request_context(), engine.connect() as conn:
+        g.deadline = time.monotonic() + DEADLINE
+        result = conn.execute(COUNTING)
+        result.fetchmany(BATCH)
+        time.sleep(DEADLINE * 2)
+        with pytest.raises(OperationalError, match='interrupted'):
+            result.fetchall()
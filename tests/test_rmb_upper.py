@@ -0,0 +1,186 @@
+"""
+rmb_upper 的随机性质测试（固定种子）：
+
+- 往返：输出解析回数字，等于四舍五入到分的原金额（含亿以上、负数、0）
+- 同一金额以 str / float / Decimal 传入，输出相同
+- 在旧实现（改动前 app.num_to_rmb_upper，复制在下面）能正确处理的范围内与其逐字相同
+- 批量接口与逐条调用结果一致
+"""
+import random
+from decimal import Decimal
+
+import pytest
+
+from rmb_upper import num_to_rmb_upper, nums_to_rmb_upper, to_cents
+
+SEED = 42
+N = 20_000
+
+DIGITS = {c: i for i, c in enumerate('零壹贰叁肆伍陆柒捌玖')}
+SECTION_UNITS = {'拾': 10, '佰': 100, '仟': 1000}
+
+
+def legacy_num_to_rmb_upper(num):
+    """改动前 app.py 中的实现，原样复制作对照。"""
+    units = ["元", "拾", "佰", "仟", "万", "拾", "佰", "仟", "亿"]
+    nums = "零壹贰叁肆伍陆柒捌玖"
+    fraction = ["角", "分"]
+    head = ""
+    if num < 0:
+        head = "负"
+        num = -num
+    num = round(num + 0.0000001, 2)  # 防止浮点误差
+    integer = int(num)
+    decimal = int(round((num - integer) * 100))
+    result = ""
+    # 处理整数部分
+    if integer == 0:
+        result = "零元"
+    else:
+        unit_pos = 0
+        zero = True
+        while integer > 0:
+            n = integer % 10
+            if n == 0:
+                if not zero:
+                    result = nums[0] + result
+                zero = True
+            else:
+                result = nums[n] + units[unit_pos] + result
+                zero = False
+            unit_pos += 1
+            integer //= 10
+    # 处理小数部分
+    if decimal == 0:
+        result += "整"
+    else:
+        jiao = decimal // 10
+        fen = decimal % 10
+        if jiao > 0:
+            result += nums[jiao] + fraction[0]
+        if fen > 0:
+            result += nums[fen] + fraction[1]
+    # 处理零元零角等冗余
+    result = result.replace("零元", "元")
+    result = result.replace("零角", "")
+    result = result.replace("零分", "")
+    result = result.replace("元整", "元整")
+    if result.startswith("元"):
+        result = "零" + result
+    return head + result
+
+
+def parse_upper(words):
+    """大写金额 -> 分（只用于校验，假定输入是 rmb_upper 生成的规范写法）。"""
+    sign = -1 if words.startswith('负') else 1
+    integer_words, _, fraction_words = words.lstrip('负').partition('元')
+    total = block = section = digit = 0
+    yi = 0
+    for ch in integer_words + '#':
+        if ch == '亿':
+            yi += 1
+            continue
+        if yi:                                  # 连续 yi 个"亿"结束：之前的块乘 10^(8*yi)
+            total += (block + section + digit) * 10 ** (8 * yi)
+            block = section = digit = yi = 0
+        if ch in DIGITS:
+            digit = DIGITS[ch]
+        elif ch in SECTION_UNITS:
+            section += digit * SECTION_UNITS[ch]
+            digit = 0
+        elif ch == '万':
+            block += (section + digit) * 10000
+            section = digit = 0
+    total += block + section + digit
+    cents = 0
+    if '角' in fraction_words:
+        cents += DIGITS[fraction_words[0]] * 10
+    if '分' in fraction_words:
+        cents += DIGITS[fraction_words[-2]]
+    return sign * (total * 100 + cents)
+
+
+def legacy_safe(cents):
+    """旧实现能正确处理的金额。"""
+    integer = abs(cents) // 100
+    if integer >= 10 ** 8:
+        return False
+    return integer == 0 or (integer % 10 and (integer < 10 ** 4 or integer // 10 ** 4 % 10))
+
+
+def random_amount(rnd):
+    """金额分布：多数为几元到几万元的两位小数，夹杂整数、零角零分、负数和超大金额。"""
+    kind = rnd.random()
+    if kind < 0.6:
+        cents = rnd.randrange(1, 10 ** rnd.randint(3, 9))
+    elif kind < 0.75:
+        cents = rnd.randrange(1, 10 ** 7) * 100
+    elif kind < 0.85:
+        cents = rnd.randrange(1, 10 ** 6) * 10 ** rnd.randint(0, 6) + rnd.choice([0, 1, 10, 5])
+    elif kind < 0.95:
+        cents = -rnd.randrange(1, 10 ** 8)
+    else:
+        cents = rnd.randrange(10 ** 10, 10 ** 22)
+    return cents
+
+
+
+
+@pytest.fixture(scope='module')
+def amounts():
+    rnd = random.Random(SEED)
+    return [random_amount(rnd) for _ in range(N)]
+
+
+def test_round_trip(amounts):
+    for cents in amounts:
+        words = num_to_rmb_upper(Decimal(cents).scaleb(-2))
+        assert parse_upper(words) == cents, (cents, words)
+
+
+def test_str_float_decimal_agree(amounts):
+    for cents in amounts:
+        amount = Decimal(cents).scaleb(-2)
+        words = num_to_rmb_upper(amount)
+        assert num_to_rmb_upper(str(amount)) == words, amount
+        if abs(cents) < 10 ** 15:               # float 能精确表示到分的范围
+            assert num_to_rmb_upper(float(amount)) == words, amount
+
+
+def test_matches_legacy(amounts):
+    compared = 0
+    for cents in amounts:
+        if not legacy_safe(cents):
+            continue
+        amount = Decimal(cents).scaleb(-2)
+        assert num_to_rmb_upper(amount) == legacy_num_to_rmb_upper(float(amount)), amount
+        compared += 1
+    assert compared > N // 2
+
+
+@pytest.mark.parametrize('value, expected', [
+    (0, '零元整'),
+    (100100, '壹拾万零壹佰元整'),
+    (1.05, '壹元伍分'),
+    (-0.5, '负零元伍角'),
+    (Decimal('100000000'), '壹亿元整'),
+    # 旧实现个位 / 万位为零时漏掉"元" / "万"
+    (10, '壹拾元整'),
+    (100000, '壹拾万元整'),
+])
+def test_examples(value, expected):
+    assert num_to_rmb_upper(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    # 与旧实现的"加 1e-7 再 round"一致，即半分进位
+    (2.675, 268), (1.005, 101), (-2.675, -268), (0.004, 0), (-0.005, -1), ('12.345', 1235),
+])
+def test_to_cents_rounds_half_up(value, expected):
+    assert to_cents(value) == expected
+
+
+def test_batch_matches_single():
+    rnd = random.Random(SEED)
+    amounts = [Decimal(random_amount(rnd)).scaleb(-2) for _ in range(1000)] * 3
+    assert nums_to_rmb_upper(amounts) == [num_to_rmb_upper(a) for a in amounts]